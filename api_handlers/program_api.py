@@ -1,27 +1,34 @@
 """
 API handler per la gestione dei programmi di irrigazione.
 """
-from microdot import Response
 import ujson
 import uasyncio as asyncio
+import time
 from log_manager import log_event
+from json_stream import json_response
+from etag import make_etag, is_not_modified, not_modified, with_etag
 
-def json_response(data, status_code=200):
+def get_programs(request):
     """
-    Helper per creare risposte JSON standardizzate.
+    API per ottenere i programmi.
+    L'ETag combina la versione dello snapshot e quella dei metadati di esecuzione.
     """
-    return Response(
-        body=ujson.dumps(data),
-        status_code=status_code,
-        headers={'Content-Type': 'application/json'}
-    )
-
-def get_programs(request):
-    """API per ottenere i programmi."""
     try:
         from program_manager import load_programs
-        programs = load_programs()
-        return json_response(programs)
+        from program_runtime import get_runtime, get_runtime_version
+        snapshot = load_programs()
+        
+        etag = make_etag('p', snapshot.version, get_runtime_version())
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        
+        # Aggiungi alle definizioni i metadati di esecuzione (ultima esecuzione, esito, ...)
+        # senza modificare lo snapshot, che è in sola lettura
+        programs = {}
+        for program_id, program in snapshot.items():
+            runtime = get_runtime(program_id)
+            programs[program_id] = dict(program, **runtime) if runtime else program
+        return with_etag(json_response(programs), etag)
     except Exception as e:
         log_event(f"Errore get_programs: {e}", "ERROR")
         return json_response({}, 200)  # Fallback sicuro
@@ -29,7 +36,8 @@ def get_programs(request):
 def save_program_route(request):
     """API per salvare un nuovo programma."""
     try:
-        from program_manager import load_programs, save_programs, check_program_conflicts
+        from program_manager import save_program, check_program_conflicts, get_compiled_programs
+        from program_model import compile_program
         
         # Estrai e valida dati
         program_data = request.json
@@ -49,28 +57,27 @@ def save_program_route(request):
         if not program_data.get('steps'):
             return json_response({'success': False, 'error': 'Seleziona almeno una zona'}, 400)
 
-        # Carica programmi esistenti
-        programs = load_programs()
+        compiled = compile_program(program_data)
 
         # Verifica se esiste un programma con lo stesso nome
-        for existing_program in programs.values():
-            if existing_program['name'] == program_data['name']:
+        for existing_program in get_compiled_programs().values():
+            if existing_program.name == compiled.name:
                 return json_response({'success': False, 'error': 'Nome programma già esistente'}, 400)
 
         # Verifica conflitti
-        has_conflict, conflict_message = check_program_conflicts(program_data, programs)
+        has_conflict, conflict_message = check_program_conflicts(program_data)
         if has_conflict:
             return json_response({'success': False, 'error': conflict_message}, 400)
 
         # Genera nuovo ID
+        programs = get_compiled_programs()
         new_id = '1'
         if programs:
             new_id = str(max([int(pid) for pid in programs.keys()]) + 1)
         program_data['id'] = new_id
 
         # Salva programma
-        programs[new_id] = program_data
-        if save_programs(programs):
+        if save_program(new_id, program_data):
             log_event(f"Nuovo programma '{program_data['name']}' creato con ID {new_id}", "INFO")
             return json_response({'success': True, 'program_id': new_id})
         else:
@@ -142,9 +149,9 @@ def delete_program_route(request):
 async def start_program_route(request):
     """API per avviare manualmente un programma."""
     try:
-        from program_manager import load_programs
+        from program_manager import get_program
         from program_execution import execute_program
-        from program_state import load_program_state, program_running
+        from program_state import state
         
         # Estrai e valida dati
         data = request.json
@@ -159,14 +166,12 @@ async def start_program_route(request):
             return json_response({'success': False, 'error': 'ID programma mancante'}, 400)
 
         # Carica programma
-        programs = load_programs()
-        program = programs.get(program_id)
+        program = get_program(program_id)
         if not program:
             return json_response({'success': False, 'error': 'Programma non trovato'}, 404)
 
         # Verifica se già in esecuzione
-        load_program_state()
-        if program_running:
+        if state.running:
             return json_response({'success': False, 'error': 'Altro programma in esecuzione'}, 400)
 
         # Avvia programma in un task separato
@@ -210,12 +215,27 @@ def stop_program_route(request):
         return json_response({'success': False, 'error': str(e)}, 500)
 
 def get_program_state(request):
-    """API per ottenere lo stato del programma corrente."""
+    """
+    API per ottenere lo stato del programma corrente.
+    Durante un'esecuzione i tempi residui cambiano senza incrementare la versione
+    dello stato: l'ETag include allora anche il secondo corrente e il passo in corso.
+    """
     try:
         from program_execution import get_program_state
+        from program_state import state as program_state
         
         state = get_program_state()
-        return json_response(state)
+        step = state.get('active_step')
+        if step:
+            etag = make_etag('s', program_state.version, int(time.time()), step['index'],
+                             step['phase'], step['remaining_seconds'])
+        elif program_state.running:
+            etag = make_etag('s', program_state.version, int(time.time()))
+        else:
+            etag = make_etag('s', program_state.version)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        return with_etag(json_response(state), etag)
     except Exception as e:
         log_event(f"Errore get_program_state: {e}", "ERROR")
         return json_response({'program_running': False, 'current_program_id': None})
@@ -223,7 +243,7 @@ def get_program_state(request):
 def toggle_program_automatic(request):
     """API per abilitare/disabilitare l'automazione di un singolo programma."""
     try:
-        from program_manager import load_programs, save_programs
+        from program_manager import get_program, update_program_fields
         
         # Estrai e valida dati
         data = request.json
@@ -239,17 +259,12 @@ def toggle_program_automatic(request):
         if not program_id:
             return json_response({'success': False, 'error': 'ID programma mancante'}, 400)
                 
-        # Carica programmi
-        programs = load_programs()
-        
-        if program_id not in programs:
+        # Verifica programma
+        if get_program(program_id) is None:
             return json_response({'success': False, 'error': 'Programma non trovato'}, 404)
                 
-        # Aggiorna stato
-        programs[program_id]['automatic_enabled'] = enable
-        
-        # Salva programmi
-        if save_programs(programs):
+        # Aggiorna stato e salva programma
+        if update_program_fields(program_id, {'automatic_enabled': enable}):
             log_event(f"Automazione programma {program_id} {'abilitata' if enable else 'disabilitata'}", "INFO")
             return json_response({'success': True})
         else:
@@ -1,26 +1,22 @@
 """
 API handler per le funzioni di gestione delle impostazioni.
 """
-from microdot import Response
 import ujson
 from log_manager import log_event
-
-def json_response(data, status_code=200):
-    """
-    Helper per creare risposte JSON standardizzate.
-    """
-    return Response(
-        body=ujson.dumps(data),
-        status_code=status_code,
-        headers={'Content-Type': 'application/json'}
-    )
+from json_stream import json_response
+from etag import make_etag, is_not_modified, not_modified, with_etag
 
 def get_user_settings(request):
     """API per ottenere le impostazioni utente."""
     try:
-        from settings_manager import load_user_settings
+        from settings_manager import load_user_settings, get_settings_version
         
         settings = load_user_settings()
+        
+        # Versione letta dopo il caricamento, che può creare il file predefinito
+        etag = make_etag('u', get_settings_version())
+        if is_not_modified(request, etag):
+            return not_modified(etag)
         if not settings:
             return json_response({'error': 'Impossibile caricare impostazioni'}, 500)
             
@@ -30,7 +26,7 @@ def get_user_settings(request):
         elif 'pin' not in settings['safety_relay']:
             settings['safety_relay']['pin'] = 13
                 
-        return json_response(settings)
+        return with_etag(json_response(settings), etag)
     except Exception as e:
         log_event(f"Errore get_user_settings: {e}", "ERROR")
         return json_response({'error': str(e)}, 500)
@@ -0,0 +1,51 @@
+"""
+API handler per lo stato complessivo del controller (long-poll) e per le notifiche push (SSE).
+"""
+from microdot import Response
+from log_manager import log_event
+from json_stream import json_response
+# Importati all'avvio del server: si iscrivono a event_bus già dal primo evento
+from status_monitor import get_status, wait_status_change
+from event_stream import EventStream, client_count, MAX_CLIENTS
+
+STATUS_DEFAULT_TIMEOUT = 25  # Attesa predefinita di una richiesta con "since" (secondi)
+STATUS_MAX_TIMEOUT = 30      # Attesa massima accettata dal parametro "timeout" (secondi)
+
+# Lo stato cambia di continuo: le risposte non vanno conservate nella cache del browser
+NO_STORE = {'Cache-Control': 'no-store'}
+
+async def get_status_route(request):
+    """
+    API per ottenere zone, stato del programma e passo in corso in un'unica risposta.
+    Senza parametri risponde subito; con since=<versione> tiene aperta la richiesta
+    finché la versione non cambia o non scade il timeout, poi restituisce lo stato
+    corrente (con la stessa versione se nulla è cambiato).
+    """
+    try:
+        since = request.args.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+                timeout = int(request.args.get('timeout', STATUS_DEFAULT_TIMEOUT))
+            except ValueError:
+                return json_response({'error': 'Parametri non validi'}, 400, NO_STORE)
+            timeout = max(0, min(timeout, STATUS_MAX_TIMEOUT))
+            await wait_status_change(since, timeout)
+        
+        return json_response(get_status(), headers=NO_STORE)
+    except Exception as e:
+        log_event(f"Errore get_status: {e}", "ERROR")
+        return json_response({'error': str(e)}, 500, NO_STORE)
+
+def events_route(request):
+    """
+    API per le notifiche push: risposta text/event-stream che resta aperta e riceve
+    gli eventi di zone, passi e fine dei programmi e i log di errore.
+    """
+    if client_count() >= MAX_CLIENTS:
+        return json_response({'error': 'Troppe connessioni agli eventi'}, 503, NO_STORE)
+    
+    return Response(
+        body=EventStream(),
+        headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'}
+    )
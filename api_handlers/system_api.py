@@ -1,30 +1,49 @@
 """
 API handler per le funzioni di sistema.
 """
-from microdot import Response
-import ujson
 import uasyncio as asyncio
 import machine
 import gc
 import time
-from log_manager import log_event
+from log_manager import log_event, flush_logs, get_log_stats
+from json_stream import json_response
+from etag import make_etag, is_not_modified, not_modified, with_etag
 
-def json_response(data, status_code=200):
+def get_system_logs(request):
     """
-    Helper per creare risposte JSON standardizzate.
+    API per ottenere i log di sistema.
+    Senza parametri restituisce la lista completa (compatibilità); con i parametri
+    level, since, limit, cursor o after restituisce una pagina filtrata di query_logs.
+    L'ETag dipende solo dalla versione dei log: il browser lo associa all'URL completo,
+    parametri compresi. Quello della risposta viene calcolato dopo la lettura, così
+    corrisponde al contenuto restituito anche se la lettura registra o scarta voci.
     """
-    return Response(
-        body=ujson.dumps(data),
-        status_code=status_code,
-        headers={'Content-Type': 'application/json'}
-    )
-
-def get_system_logs(request):
-    """API per ottenere i log di sistema."""
     try:
-        from log_manager import get_logs
-        logs = get_logs()
-        return json_response(logs)
+        from log_manager import get_logs, query_logs, get_log_version
+        
+        etag = make_etag('l', get_log_version())
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        
+        args = request.args
+        if not args:
+            logs = get_logs()
+            return with_etag(json_response(logs), make_etag('l', get_log_version()))
+        
+        try:
+            level = args.get('level')
+            since = args.get('since')
+            result = query_logs(
+                level=level.upper() if level else None,
+                since=int(since) if since else None,
+                limit=int(args.get('limit', 100)),
+                cursor=args.get('cursor') or None,
+                after=args.get('after') or None
+            )
+        except (ValueError, KeyError):
+            return json_response({'error': 'Parametri di ricerca non validi'}, 400)
+        
+        return with_etag(json_response(result), make_etag('l', get_log_version()))
     except Exception as e:
         log_event(f"Errore get_system_logs: {e}", "ERROR")
         return json_response({'error': 'Log manager non disponibile'}, 500)
@@ -62,6 +81,7 @@ def restart_system_route(request):
 async def _delayed_reset(delay_seconds):
     """Esegue un reset del sistema dopo un ritardo specificato."""
     await asyncio.sleep(delay_seconds)
+    flush_logs()
     machine.reset()
 
 def reset_settings_route(request):
@@ -104,6 +124,7 @@ def get_server_stats(request):
     try:
         # Importiamo direttamente da web_server per avere accesso alle variabili globali
         from web_server import server_stats, server_health
+        from file_cache import get_cache_stats
         import time  # Assicuriamoci che time sia importato
         
         # Aggiorna metriche memoria
@@ -111,15 +132,18 @@ def get_server_stats(request):
         uptime = current_time - server_health['start_time']
         mem_free = gc.mem_free()
         mem_alloc = gc.mem_alloc()
+        cache_stats = get_cache_stats()
         
         stats = {
             'uptime': uptime,
             'uptime_human': f"{int(uptime // 3600)}h {int((uptime % 3600) // 60)}m",
             'requests_total': server_stats['requests_total'],
             'requests_error': server_stats['requests_error'],
-            'cache_hits': server_stats['cache_hits'],
-            'cache_misses': server_stats['cache_misses'],
+            'cache_hits': cache_stats['hits'],
+            'cache_misses': cache_stats['misses'],
+            'file_cache': cache_stats,
             'gc_runs': server_stats['gc_runs'],
+            'logs': get_log_stats(),
             'memory': {
                 'free': mem_free,
                 'allocated': mem_alloc,
@@ -1,20 +1,10 @@
 """
 API handler per le funzioni WiFi.
 """
-from microdot import Response
 import ujson
 import time
 from log_manager import log_event
-
-def json_response(data, status_code=200):
-    """
-    Helper per creare risposte JSON standardizzate.
-    """
-    return Response(
-        body=ujson.dumps(data),
-        status_code=status_code,
-        headers={'Content-Type': 'application/json'}
-    )
+from json_stream import json_response
 
 def get_wifi_scan_results(request):
     """API per ottenere i risultati della scansione WiFi."""
@@ -1,21 +1,11 @@
 """
 API handler per la gestione delle zone di irrigazione.
 """
-from microdot import Response
 import ujson
 from log_manager import log_event
+from json_stream import json_response
 from settings_manager import load_user_settings
 
-def json_response(data, status_code=200):
-    """
-    Helper per creare risposte JSON standardizzate.
-    """
-    return Response(
-        body=ujson.dumps(data),
-        status_code=status_code,
-        headers={'Content-Type': 'application/json'}
-    )
-
 def get_zones_status_endpoint(request):
     """API per ottenere lo stato delle zone."""
     try:
@@ -39,7 +29,7 @@ def handle_start_zone(request):
     """API per avviare una zona."""
     try:
         from zone_manager import start_zone
-        from program_state import program_running, load_program_state
+        from program_state import state
         
         # Estrai e valida parametri
         data = request.json
@@ -56,8 +46,7 @@ def handle_start_zone(request):
             return json_response({'error': 'Parametri mancanti', 'success': False}, 400)
 
         # Verifica se un programma è in esecuzione
-        load_program_state()
-        if program_running:
+        if state.running:
             return json_response({'error': 'Programma in esecuzione', 'success': False}, 400)
 
         # Avvia zona
@@ -5,7 +5,7 @@ Monitor leggero dello stato del sistema e dei servizi.
 import uasyncio as asyncio
 import gc
 import time
-from log_manager import log_event
+from log_manager import log_event, log_eventf
 from utils import gc_collect
 
 # Configurazione
@@ -41,7 +41,7 @@ async def check_memory_usage():
         
         # Verifica memoria bassa
         if free_mem < MEMORY_THRESHOLD or percent_free < 10:
-            log_event(f"Memoria bassa: {free_mem} bytes ({percent_free:.1f}%), GC forzato", "WARNING")
+            log_eventf("WARNING", "Memoria bassa: {} bytes ({:.1f}%), GC forzato", free_mem, percent_free)
             memory_recovered = gc_collect()
             system_metrics['gc_runs'] += 1
             
@@ -50,7 +50,7 @@ async def check_memory_usage():
             new_percent_free = (new_free_mem / total_mem) * 100
             
             if memory_recovered > 0:
-                log_event(f"Post GC: {new_free_mem} bytes ({new_percent_free:.1f}%), recuperati {memory_recovered} bytes", "INFO")
+                log_eventf("INFO", "Post GC: {} bytes ({:.1f}%), recuperati {} bytes", new_free_mem, new_percent_free, memory_recovered)
             
             if new_free_mem < MEMORY_THRESHOLD:
                 return False
@@ -58,7 +58,7 @@ async def check_memory_usage():
         return True
     
     except Exception as e:
-        log_event(f"Errore controllo memoria: {e}", "ERROR")
+        log_eventf("ERROR", "Errore controllo memoria: {}", e)
         return False
 
 async def check_web_server():
@@ -87,7 +87,7 @@ async def check_web_server():
             # Server non risponde
             pass
     except Exception as e:
-        log_event(f"Errore controllo web server: {e}", "ERROR")
+        log_eventf("ERROR", "Errore controllo web server: {}", e)
     
     return False
 
@@ -117,14 +117,14 @@ async def check_system_health():
                 uptime_hours = int(system_metrics['uptime'] // 3600)
                 uptime_minutes = int((system_metrics['uptime'] % 3600) // 60)
                 
-                log_event(f"Sistema in salute. Uptime: {uptime_hours}h {uptime_minutes}m. "
-                         f"Memoria: {free_mem} bytes liberi ({percent_free:.1f}%)", "INFO")
+                log_eventf("INFO", "Sistema in salute. Uptime: {}h {}m. Memoria: {} bytes liberi ({:.1f}%)",
+                           uptime_hours, uptime_minutes, free_mem, percent_free)
         else:
             # Log ogni iterazione in caso di problemi
-            log_event(f"Problemi rilevati. Memoria OK: {memory_ok}, WebServer OK: {web_server_ok}", "WARNING")
+            log_eventf("WARNING", "Problemi rilevati. Memoria OK: {}, WebServer OK: {}", memory_ok, web_server_ok)
     
     except Exception as e:
-        log_event(f"Errore controllo salute sistema: {e}", "ERROR")
+        log_eventf("ERROR", "Errore controllo salute sistema: {}", e)
 
 async def basic_diagnostics_loop():
     """
@@ -136,7 +136,7 @@ async def basic_diagnostics_loop():
         try:
             await check_system_health()
         except Exception as e:
-            log_event(f"Errore diagnostica: {e}", "ERROR")
+            log_eventf("ERROR", "Errore diagnostica: {}", e)
         
         # Controllo più frequente se ci sono problemi noti
         await asyncio.sleep(CHECK_INTERVAL)
@@ -0,0 +1,80 @@
+"""
+Modulo per le richieste GET condizionali (ETag / If-None-Match).
+L'ETag di una risposta è costruito dai contatori di versione dei dati che la compongono,
+senza serializzarli: se il client invia un tag ancora valido il server risponde
+304 Not Modified con i soli header, invece di rigenerare e trasmettere il JSON.
+"""
+import uos as os
+import ubinascii
+from microdot import Response
+
+# Identificativo casuale dell'avvio: i contatori di versione ripartono da zero a ogni
+# riavvio, quindi senza questo prefisso un tag vecchio potrebbe tornare valido
+_BOOT_ID = ubinascii.hexlify(os.urandom(4)).decode()
+
+def make_etag(*parts):
+    """
+    Costruisce un ETag forte dalle versioni dei dati.
+
+    Args:
+        *parts: Prefisso della risorsa e contatori di versione
+
+    Returns:
+        str: ETag tra virgolette, es. "3fa1c2d0-p-12-4"
+    """
+    return '"' + _BOOT_ID + '-' + '-'.join([str(p) for p in parts]) + '"'
+
+def is_not_modified(request, etag):
+    """
+    Verifica se il tag inviato dal client in If-None-Match corrisponde.
+
+    Args:
+        request: Richiesta Microdot
+        etag: ETag corrente della risorsa
+
+    Returns:
+        boolean: True se il client ha già la versione corrente
+    """
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]  # Confronto debole, come richiesto per If-None-Match
+        if candidate == etag or candidate == '*':
+            return True
+    return False
+
+def not_modified(etag):
+    """
+    Crea la risposta 304 per una risorsa invariata.
+
+    Args:
+        etag: ETag corrente della risorsa
+
+    Returns:
+        Response: Risposta senza corpo
+    """
+    return Response(body=b'', status_code=304, reason='Not Modified', headers={
+        'ETag': etag,
+        'Cache-Control': 'no-cache'
+    })
+
+def with_etag(response, etag):
+    """
+    Aggiunge l'ETag a una risposta.
+    Con "no-cache" il browser conserva la risposta ma la riconvalida a ogni richiesta.
+
+    Args:
+        response: Risposta Microdot
+        etag: ETag della risorsa
+
+    Returns:
+        Response: La stessa risposta
+    """
+    if response.status_code == 200:
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,133 @@
+"""
+Modulo per la notifica dei cambi di stato tra i moduli del controller (publish/subscribe).
+Chi modifica impostazioni, programmi, stato del programma, zone o log pubblica un evento
+sul relativo argomento; scheduler, contatori di versione, cache e canali push si iscrivono
+e reagiscono subito, senza rileggere file o interrogare a intervalli.
+
+I callback sono chiamati in modo sincrono da publish, nell'ordine di iscrizione, e non
+devono bloccare né registrare nel log (log_manager pubblica a sua volta). MicroPython non
+ha riferimenti deboli: chi si iscrive per un tempo limitato deve chiamare unsubscribe,
+o usare EventQueue e chiamarne close().
+"""
+import uasyncio as asyncio
+
+# Argomenti ed eventi pubblicati
+TOPIC_SETTINGS = 'settings'            # 'saved'
+TOPIC_PROGRAMS = 'programs'            # 'changed' (definizioni), 'run_recorded' (metadati di esecuzione)
+TOPIC_PROGRAM_STATE = 'program_state'  # 'running', 'idle', 'step', 'finished'
+TOPIC_ZONES = 'zones'                  # 'started', 'stopped'
+TOPIC_LOGS = 'logs'                    # 'error'
+
+_subscribers = {}  # Argomento -> lista di callback(topic, event, data)
+
+def subscribe(topic, callback):
+    """
+    Iscrive un callback a un argomento.
+    
+    Args:
+        topic: Argomento (TOPIC_*)
+        callback: Funzione chiamata come callback(topic, event, data)
+    
+    Returns:
+        callback: Lo stesso callback, da passare a unsubscribe
+    """
+    callbacks = _subscribers.get(topic)
+    if callbacks is None:
+        callbacks = _subscribers[topic] = []
+    if callback not in callbacks:
+        callbacks.append(callback)
+    return callback
+
+def unsubscribe(topic, callback):
+    """
+    Annulla l'iscrizione di un callback.
+    
+    Args:
+        topic: Argomento
+        callback: Callback restituito da subscribe
+    """
+    callbacks = _subscribers.get(topic)
+    if callbacks and callback in callbacks:
+        callbacks.remove(callback)
+
+def publish(topic, event, data=None):
+    """
+    Pubblica un evento. Un errore in un callback non interrompe gli altri.
+    
+    Args:
+        topic: Argomento (TOPIC_*)
+        event: Nome dell'evento
+        data: Dizionario con i dettagli, da non modificare nei callback
+    """
+    callbacks = _subscribers.get(topic)
+    if not callbacks:
+        return
+    for callback in tuple(callbacks):
+        try:
+            callback(topic, event, data)
+        except Exception as e:
+            print(f"Errore nel gestore dell'evento {topic}/{event}: {e}")
+
+class EventQueue:
+    """
+    Coda di eventi a profondità limitata per i consumatori asincroni.
+    Quando la coda è piena l'evento più vecchio viene scartato e contato in "dropped";
+    on_overflow, se indicato, viene chiamato a ogni evento scartato.
+    """
+    def __init__(self, topics, maxlen=16, on_overflow=None):
+        self.maxlen = maxlen
+        self.dropped = 0
+        self._on_overflow = on_overflow
+        self._items = []
+        self._event = asyncio.Event()
+        self._topics = topics
+        self._callback = self._put  # Stesso oggetto per subscribe e unsubscribe
+        for topic in topics:
+            subscribe(topic, self._callback)
+    
+    def _put(self, topic, event, data):
+        if len(self._items) >= self.maxlen:
+            self._items.pop(0)
+            self.dropped += 1
+            if self._on_overflow:
+                self._on_overflow()
+        self._items.append((topic, event, data))
+        self._event.set()
+    
+    def __len__(self):
+        return len(self._items)
+    
+    def get_nowait(self):
+        """
+        Returns:
+            tuple or None: Prossimo evento già in coda, None se la coda è vuota
+        """
+        return self._items.pop(0) if self._items else None
+    
+    async def get(self, timeout=None):
+        """
+        Attende il prossimo evento.
+        
+        Args:
+            timeout: Attesa massima in secondi, None per nessun limite
+        
+        Returns:
+            tuple or None: (topic, event, data), None se è scaduto il timeout
+        """
+        while not self._items:
+            self._event.clear()
+            try:
+                if timeout is None:
+                    await self._event.wait()
+                else:
+                    await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self._items.pop(0)
+    
+    def close(self):
+        """
+        Annulla le iscrizioni della coda.
+        """
+        for topic in self._topics:
+            unsubscribe(topic, self._callback)
@@ -0,0 +1,141 @@
+"""
+Modulo per il canale di notifiche push (Server-Sent Events) dell'interfaccia web.
+Ogni client collegato a /events riceve da event_bus, tramite una coda a profondità
+limitata, l'avvio e l'arresto delle zone, i passi e la fine dei programmi e i log di
+errore: il costo dipende dal numero di eventi e non dalla frequenza di polling.
+"""
+import ujson
+import time
+from event_bus import EventQueue, TOPIC_PROGRAM_STATE, TOPIC_ZONES, TOPIC_LOGS
+
+MAX_CLIENTS = 2          # Connessioni /events contemporanee (i socket dell'ESP32 sono pochi)
+MAX_PENDING = 16         # Eventi in coda per client; oltre, il client è considerato bloccato
+KEEPALIVE_INTERVAL = 15  # Secondi senza eventi dopo i quali viene inviato un commento
+RETRY_MS = 3000          # Attesa suggerita al browser prima di riconnettersi
+STALE_TIMEOUT = 3 * KEEPALIVE_INTERVAL  # Secondi senza letture dopo i quali il client è scollegato
+
+_clients = []  # EventStream collegati
+
+def _format_event(topic, event, data):
+    """
+    Traduce un evento di event_bus nel formato SSE.
+    
+    Args:
+        topic: Argomento dell'evento
+        event: Nome dell'evento
+        data: Dettagli dell'evento
+    
+    Returns:
+        str or None: Evento SSE, None se l'evento non è inoltrato ai client
+    """
+    if topic == TOPIC_ZONES:
+        sse_type = 'zone'
+        payload = dict(data, active=(event == 'started'))
+    elif topic == TOPIC_PROGRAM_STATE and event == 'step':
+        sse_type = 'step'
+        payload = dict(data)
+    elif topic == TOPIC_PROGRAM_STATE and event == 'finished':
+        sse_type = 'program'
+        payload = dict(data)
+    elif topic == TOPIC_LOGS:
+        sse_type = 'log'
+        payload = dict(data, level='ERROR')
+    else:
+        return None
+    
+    payload['ts'] = int(time.time())
+    return 'event: ' + sse_type + '\ndata: ' + ujson.dumps(payload) + '\n\n'
+
+def _prune():
+    """
+    Scollega i client che non leggono da più di STALE_TIMEOUT secondi: Microdot non
+    chiama aclose() se la risposta si interrompe per un errore di socket non previsto.
+    """
+    now = time.time()
+    for client in _clients[:]:
+        if now - client._last_read > STALE_TIMEOUT:
+            client._detach()
+
+def client_count():
+    """
+    Returns:
+        int: Numero di client collegati
+    """
+    _prune()
+    return len(_clients)
+
+class EventStream:
+    """
+    Corpo di una risposta text/event-stream.
+    Microdot lo consuma come iteratore asincrono: il client viene registrato alla prima
+    lettura, quindi una risposta mai inviata non occupa posti, e scollegato in aclose(),
+    se la lettura viene interrotta da un errore o dalla cancellazione del task, o quando
+    la sua coda si riempie.
+    """
+    def __init__(self):
+        self._queue = None
+        self._closed = False
+        self._last_read = time.time()
+    
+    def _attach(self):
+        """
+        Registra il client e si iscrive agli eventi.
+        
+        Returns:
+            bool: False se i posti sono esauriti
+        """
+        if client_count() >= MAX_CLIENTS:
+            self._closed = True
+            return False
+        
+        self._queue = EventQueue((TOPIC_ZONES, TOPIC_PROGRAM_STATE, TOPIC_LOGS),
+                                 MAX_PENDING, self._detach)
+        _clients.append(self)
+        return True
+    
+    def _detach(self):
+        """
+        Scollega il client: l'iteratore terminerà la risposta alla prossima lettura.
+        """
+        self._closed = True
+        if self._queue:
+            self._queue.close()
+        if self in _clients:
+            _clients.remove(self)
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        self._last_read = time.time()
+        if self._queue is None and not self._closed:
+            if not self._attach():
+                raise StopAsyncIteration
+            return 'retry: ' + str(RETRY_MS) + '\n\n'
+        
+        try:
+            while not self._closed:
+                item = await self._queue.get(KEEPALIVE_INTERVAL)
+                if self._closed:
+                    break
+                if item is None:
+                    return ': keepalive\n\n'  # Commento: mantiene aperta la connessione
+                
+                # Invia in un solo blocco tutti gli eventi accumulati
+                chunks = []
+                while item is not None:
+                    chunk = _format_event(*item)
+                    if chunk:
+                        chunks.append(chunk)
+                    item = self._queue.get_nowait()
+                if chunks:
+                    return ''.join(chunks)
+        except BaseException:
+            # Anche CancelledError: il task della connessione è stato annullato
+            self._detach()
+            raise
+        
+        raise StopAsyncIteration
+    
+    async def aclose(self):
+        self._detach()
@@ -1,83 +1,127 @@
 """
 Modulo specifico per la gestione della cache di file.
-Implementa un sistema LRU (Least Recently Used) per la cache dei file.
+Implementa una cache LRU (Least Recently Used) limitata in byte: l'ordine di accesso è
+una lista doppiamente collegata indicizzata da un dizionario, quindi lettura, spostamento
+in testa ed eliminazione costano O(1). I percorsi inesistenti sono ricordati per
+NOT_FOUND_TTL secondi, così le richieste ripetute di file mancanti non toccano il filesystem.
 """
 import time
 import uos as os
 
 # Cache e parametri
-_file_cache = {}  # {path: (content, content_type, timestamp)}
-_cache_usage = [] # Lista di path ordinati per ultimo accesso
-FILE_CACHE_SIZE = 10  # Massimo numero file da cachecare
-CACHE_TTL = 300       # Tempo di vita cache in secondi
+FILE_CACHE_MAX_BYTES = 64 * 1024  # Byte complessivi dei file in cache
+FILE_CACHE_MAX_FILE = 32 * 1024   # File più grandi sono letti ma non messi in cache
+CACHE_TTL = 300                   # Tempo di vita predefinito in secondi (None: nessuna scadenza)
+NOT_FOUND_TTL = 60                # Tempo di vita dei percorsi inesistenti in secondi
+NOT_FOUND_MAX = 16                # Percorsi inesistenti ricordati
 
-def get_cached_file(path, content_type=None):
+# Nodo della lista: [prec, succ, path, content, content_type, scadenza]
+_PREV, _NEXT, _PATH, _CONTENT, _TYPE, _EXPIRES = 0, 1, 2, 3, 4, 5
+
+_file_cache = {}  # {path: nodo}
+_root = []        # Sentinella: _root[_NEXT] è il più recente, _root[_PREV] il meno recente
+_root[:] = [_root, _root, None, None, None, None]
+_not_found = {}   # {path: scadenza}
+_stats = {'hits': 0, 'misses': 0, 'not_found_hits': 0, 'evictions': 0, 'bytes': 0}
+
+def _unlink(node):
+    """
+    Stacca un nodo dalla lista LRU.
+    """
+    node[_PREV][_NEXT] = node[_NEXT]
+    node[_NEXT][_PREV] = node[_PREV]
+
+def _push_front(node):
+    """
+    Inserisce un nodo in testa alla lista LRU (accesso più recente).
+    """
+    first = _root[_NEXT]
+    node[_PREV] = _root
+    node[_NEXT] = first
+    first[_PREV] = node
+    _root[_NEXT] = node
+
+def _remove(node):
+    """
+    Toglie un nodo dalla cache aggiornando il conteggio dei byte.
+    """
+    _unlink(node)
+    del _file_cache[node[_PATH]]
+    _stats['bytes'] -= len(node[_CONTENT])
+
+def _store(path, content, content_type, expires):
+    """
+    Inserisce un file in testa alla cache, eliminando i meno recenti finché
+    il totale non rientra in FILE_CACHE_MAX_BYTES.
+    """
+    size = len(content)
+    while _file_cache and _stats['bytes'] + size > FILE_CACHE_MAX_BYTES:
+        _remove(_root[_PREV])
+        _stats['evictions'] += 1
+    
+    node = [None, None, path, content, content_type, expires]
+    _push_front(node)
+    _file_cache[path] = node
+    _stats['bytes'] += size
+
+def get_cached_file(path, content_type=None, ttl=CACHE_TTL):
     """
     Ottiene un file dalla cache o dal filesystem.
+    Un file in cache è restituito senza accedere al filesystem fino alla scadenza;
+    i file il cui nome contiene l'hash del contenuto possono usare ttl=None.
     
     Args:
         path: Percorso del file
         content_type: Tipo di contenuto opzionale
-        
+        ttl: Tempo di vita in cache in secondi, None per nessuna scadenza
+    
     Returns:
         tuple or None: (content, content_type) o None se non esiste
     """
-    global _file_cache, _cache_usage
     current_time = time.time()
     
     # Verifica se il file è in cache
-    if path in _file_cache:
-        content, cached_content_type, timestamp = _file_cache[path]
-        
-        # Verifica validità cache
-        if current_time - timestamp <= CACHE_TTL:
-            # Aggiorna posizione in LRU cache
-            _cache_usage.remove(path)
-            _cache_usage.append(path)
-            
-            return (content, cached_content_type or content_type)
+    node = _file_cache.get(path)
+    if node is not None:
+        if node[_EXPIRES] is None or current_time < node[_EXPIRES]:
+            # Sposta in testa alla lista LRU
+            _unlink(node)
+            _push_front(node)
+            _stats['hits'] += 1
+            return (node[_CONTENT], node[_TYPE] or content_type)
+        _remove(node)  # Scaduto: verrà riletto
     
-    # File non in cache o cache scaduta
-    if not file_exists(path):
-        return None
-        
-    try:
-        # Determina tipo di contenuto
-        if content_type is None:
-            content_type = determine_content_type(path)
-        
-        # Leggi file (solo per file di dimensioni ragionevoli)
-        try:
-            stat_info = os.stat(path)
-            file_size = stat_info[6]  # indice 6 è la dimensione file
-            
-            # Cache solo file under 32K per evitare problemi memoria
-            if file_size < 32 * 1024:
-                with open(path, 'rb') as f:
-                    content = f.read()
-                    
-                # Gestisci cache LRU - rimuovi file meno recente se necessario
-                if len(_file_cache) >= FILE_CACHE_SIZE and _cache_usage:
-                    oldest = _cache_usage.pop(0)
-                    if oldest in _file_cache:
-                        del _file_cache[oldest]
-                
-                # Aggiungi file a cache
-                _file_cache[path] = (content, content_type, current_time)
-                _cache_usage.append(path)
-                
-                return (content, content_type)
-            else:
-                # File troppo grande per cache, leggilo direttamente
-                with open(path, 'rb') as f:
-                    content = f.read()
-                return (content, content_type)
-        except Exception as e:
-            print(f"Errore nel caricamento file {path}: {e}")
+    # Percorso già risultato inesistente
+    expires = _not_found.get(path)
+    if expires is not None:
+        if current_time < expires:
+            _stats['not_found_hits'] += 1
             return None
+        del _not_found[path]
+    
+    _stats['misses'] += 1
+    
+    # Determina tipo di contenuto
+    if content_type is None:
+        content_type = determine_content_type(path)
+    
+    # L'apertura verifica anche l'esistenza: nessuna chiamata a stat
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+    except OSError:
+        if len(_not_found) >= NOT_FOUND_MAX:
+            _not_found.clear()
+        _not_found[path] = current_time + NOT_FOUND_TTL
+        return None
     except Exception as e:
-        print(f"Errore nel determinare il tipo di {path}: {e}")
+        print(f"Errore nel caricamento file {path}: {e}")
         return None
+    
+    # Cache solo file fino a FILE_CACHE_MAX_FILE per evitare problemi memoria
+    if len(content) <= FILE_CACHE_MAX_FILE:
+        _store(path, content, content_type, None if ttl is None else current_time + ttl)
+    return (content, content_type)
 
 def file_exists(path):
     """
@@ -85,7 +129,7 @@ def file_exists(path):
     
     Args:
         path: Percorso del file
-        
+    
     Returns:
         boolean: True se il file esiste, False altrimenti
     """
@@ -101,7 +145,7 @@ def determine_content_type(path):
     
     Args:
         path: Percorso del file
-        
+    
     Returns:
         str: Tipo di contenuto MIME
     """
@@ -124,17 +168,32 @@ def determine_content_type(path):
     else:
         return 'text/plain'
 
+def get_cache_stats():
+    """
+    Restituisce i contatori della cache.
+    
+    Returns:
+        dict: Letture dalla cache (hits), dal filesystem (misses), di percorsi già
+            risultati inesistenti (not_found_hits), file eliminati per fare spazio
+            (evictions), byte e file in cache
+    """
+    stats = dict(_stats)
+    stats['entries'] = len(_file_cache)
+    stats['max_bytes'] = FILE_CACHE_MAX_BYTES
+    return stats
+
 def clear_cache():
     """
     Svuota la cache dei file.
     """
-    global _file_cache, _cache_usage
-    _file_cache = {}
-    _cache_usage = []
+    _file_cache.clear()
+    _root[:] = [_root, _root, None, None, None, None]
+    _not_found.clear()
+    _stats['bytes'] = 0
     
     # Forza GC dopo pulizia cache
     try:
         import gc
         gc.collect()
     except:
-        pass
\ No newline at end of file
+        pass
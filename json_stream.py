@@ -0,0 +1,85 @@
+"""
+Modulo per la serializzazione JSON in streaming.
+Genera la risposta a blocchi di piccole dimensioni invece di costruire un'unica stringa,
+così il picco di memoria per richiesta dipende dalla dimensione del blocco e non dal payload.
+"""
+import ujson
+from microdot import Response
+
+CHUNK_SIZE = 512  # Dimensione indicativa (caratteri) di ogni blocco prodotto
+
+def _iter_tokens(value):
+    """
+    Genera i frammenti JSON di un valore, visitando ricorsivamente liste e dizionari.
+    I dizionari senza contenitori annidati (es. una voce di log) sono serializzati in un colpo solo.
+    
+    Args:
+        value: Valore da serializzare
+    """
+    if isinstance(value, dict):
+        flat = True
+        for item in value.values():
+            if isinstance(item, (dict, list, tuple)):
+                flat = False
+                break
+        if flat:
+            yield ujson.dumps(value)
+            return
+        
+        yield '{'
+        first = True
+        for key, item in value.items():
+            yield ('' if first else ', ') + ujson.dumps(str(key)) + ': '
+            first = False
+            yield from _iter_tokens(item)
+        yield '}'
+    elif isinstance(value, (list, tuple)):
+        yield '['
+        first = True
+        for item in value:
+            if not first:
+                yield ', '
+            first = False
+            yield from _iter_tokens(item)
+        yield ']'
+    else:
+        yield ujson.dumps(value)
+
+def iter_json(data, chunk_size=CHUNK_SIZE):
+    """
+    Serializza un valore in JSON come generatore di blocchi di testo.
+    Produce sempre almeno un blocco, come richiesto dal percorso generatore di Microdot.
+    
+    Args:
+        data: Valore da serializzare
+        chunk_size: Dimensione minima di un blocco prima dell'emissione
+    """
+    parts = []
+    size = 0
+    for token in _iter_tokens(data):
+        parts.append(token)
+        size += len(token)
+        if size >= chunk_size:
+            yield ''.join(parts)
+            parts = []
+            size = 0
+    if parts:
+        yield ''.join(parts)
+
+def json_response(data, status_code=200, headers=None):
+    """
+    Crea la risposta JSON standard delle API, con il corpo generato a blocchi da
+    iter_json per limitare il picco di memoria.
+    
+    Args:
+        data: Valore da serializzare
+        status_code: Codice di stato HTTP
+        headers: Header aggiuntivi (es. Cache-Control), opzionale
+        
+    Returns:
+        Response: Risposta Microdot
+    """
+    response_headers = {'Content-Type': 'application/json'}
+    if headers:
+        response_headers.update(headers)
+    return Response(body=iter_json(data), status_code=status_code, headers=response_headers)
@@ -2,179 +2,767 @@
 Modulo per la gestione dei log di sistema.
 Gestisce la registrazione, rotazione e recupero dei log di sistema con meccanismi di protezione
 contro errori di I/O e uso efficiente della memoria.
+
+I log sono salvati come journal append-only: ogni giorno ha il proprio segmento
+(/data/logs/YYYY-MM-DD.ndjson) con una voce JSON per riga. Il flush accoda solo le
+nuove voci e la rotazione elimina interi segmenti scaduti, senza riscrivere lo storico.
+Le voci registrate con log_eventf sono salvate come id del modello più argomenti;
+la tabella dei modelli (/data/logs/templates.txt) è condivisa da tutti i segmenti.
 """
 import ujson
-import time
 import uos as os
 import gc
-from utils import day_of_year, get_current_date, get_current_time, ensure_directory_exists, get_dirname
+import uasyncio as asyncio
+import ustruct as struct
+from array import array
+from utils import ensure_directory_exists
+from time_utils import now, epoch_day, today, format_date, format_time, parse_date, parse_time
+from event_bus import publish, TOPIC_LOGS
 
-LOG_FILE = '/data/system_log.json'
+LOG_DIR = '/data/logs'
+LEGACY_LOG_FILE = '/data/system_log.json'  # Vecchio formato (file JSON unico), migrato all'avvio
+SEGMENT_EXT = '.ndjson'
+TEMPLATES_FILE = LOG_DIR + '/templates.txt'  # Tabella dei modelli, una riga [id, modello] per voce (append-only)
 MAX_LOG_DAYS = 10  # Mantiene log per 10 giorni
-MAX_LOG_ENTRIES = 1000  # Limite massimo di voci di log per prevenire file troppo grandi
-_log_cache = []  # Cache per ridurre le operazioni su file
+MAX_LOG_ENTRIES = 1000  # Numero massimo di voci restituite in lettura
+MAX_SEGMENT_SIZE = 48 * 1024  # Dimensione massima di un segmento giornaliero (bytes)
 _last_flush_time = 0  # Traccia l'ultimo flush su disco
 _FLUSH_INTERVAL = 60  # Flush su disco ogni 60 secondi o se ci sono più di 10 log in cache
-_MAX_CACHE_SIZE = 10  # Numero massimo di log in cache prima del flush automatico
+_MAX_CACHE_SIZE = 10  # Voci in cache oltre le quali viene risvegliato il writer
+
+# Livelli di log e relativi codici numerici
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+_LEVEL_CODES = {'DEBUG': 0, 'INFO': 1, 'WARNING': 2, 'ERROR': 3}
+_min_level = 1  # Soglia corrente (INFO), aggiornata da set_log_level
+
+# Cache dei log in memoria: ring buffer preallocato all'avvio.
+# Ogni slot contiene timestamp (secondi epoch Unix), codice livello e lunghezza del messaggio;
+# il testo è copiato nell'area _ring_text all'offset slot * _RING_MSG_SIZE.
+# log_event non crea dizionari né stringhe di data/ora: l'occupazione è fissa.
+_RING_SLOTS = 32  # Numero di slot (deve essere >= _MAX_CACHE_SIZE)
+_RING_MSG_SIZE = 128  # Bytes massimi per messaggio (i più lunghi vengono troncati con "…")
+_RING_PACK = str(_RING_MSG_SIZE) + 's'  # Formato di pack_into per copiare un messaggio nello slot
+_ELLIPSIS = b'\xe2\x80\xa6'  # "…" in UTF-8, aggiunto ai messaggi troncati
+_JSON_TRUE = b'true'
+_JSON_FALSE = b'false'
+_ring_ts = array('L', [0] * _RING_SLOTS)
+_ring_tid = array('h', [-1] * _RING_SLOTS)  # Id del modello (-1: testo libero, altrimenti argomenti JSON)
+_ring_level = bytearray(_RING_SLOTS)
+_ring_len = array('H', [0] * _RING_SLOTS)
+_ring_text = bytearray(_RING_SLOTS * _RING_MSG_SIZE)
+_ring_head = 0  # Prossimo slot da scrivere
+_ring_count = 0  # Voci in attesa di flush (le ultime _ring_count prima di _ring_head)
+_journal_ready = False  # True dopo creazione directory e migrazione del vecchio file
+_last_rotation_day = None  # Giorno (epoch) dell'ultima rotazione eseguita
+_dropped_entries = 0  # Voci scartate (segmento del giorno pieno o coda del writer piena)
+_writer_running = False  # True mentre log_writer_task è attivo
+_flush_event = asyncio.Event()  # Risveglia il writer prima della scadenza di _FLUSH_INTERVAL
+_SCAN_BLOCK_SIZE = 512  # Bytes letti per volta nella scansione all'indietro dei segmenti
+_log_version = 0  # Incrementato a ogni voce registrata, scartata o eliminata (ETag delle API)
+
+# Tabella dei modelli di messaggio usati con log_eventf.
+# Su disco ogni voce occupa [secondi del giorno, livello, id modello, argomenti...]
+# invece del testo completo; il testo viene ricomposto solo in lettura.
+_MAX_TEMPLATES = 128  # Oltre questo limite i messaggi sono salvati come testo libero
+_templates = []  # Id -> modello
+_template_ids = {}  # Modello -> id
+_templates_saved = 0  # Modelli già scritti su TEMPLATES_FILE
+_templates_loaded = False
+
+def _segment_path(day):
+    """
+    Restituisce il percorso del segmento di log per un giorno.
+    
+    Args:
+        day: Giorno (epoch Unix)
+    
+    Returns:
+        str: Percorso del file segmento (nome nel formato YYYY-MM-DD)
+    """
+    return LOG_DIR + '/' + format_date(day) + SEGMENT_EXT
 
-def _ensure_log_file_exists():
+def _list_segments():
     """
-    Crea il file di log se non esiste, con gestione robusta degli errori.
+    Elenca i giorni dei segmenti presenti su disco, in ordine cronologico.
+    
+    Returns:
+        list: Giorni (epoch Unix) dei segmenti esistenti
     """
     try:
+        names = os.listdir(LOG_DIR)
+    except OSError:
+        return []
+    
+    days = []
+    for name in names:
+        if name.endswith(SEGMENT_EXT):
+            day = parse_date(name[:-len(SEGMENT_EXT)])
+            if day is not None:
+                days.append(day)
+    days.sort()
+    return days
+
+def _append_entries(records):
+    """
+    Accoda le voci ai rispettivi segmenti giornalieri in formato compatto.
+    Apre ogni segmento una sola volta per giorno.
+    
+    Args:
+        records: Iterabile di tuple (ts, livello, corpo JSON) in ordine cronologico
+    """
+    global _dropped_entries, _log_version
+    
+    f = None
+    open_day = None
+    try:
+        for ts, code, body in records:
+            day = epoch_day(ts)
+            if day != open_day:
+                if f:
+                    f.close()
+                path = _segment_path(day)
+                
+                # Limita la crescita di un singolo giorno (es. raffiche di DEBUG)
+                try:
+                    size = os.stat(path)[6]
+                except OSError:
+                    size = 0
+                
+                f = open(path, 'a')
+                open_day = day
+            
+            if size >= MAX_SEGMENT_SIZE and code != 3:
+                _dropped_entries += 1
+                _log_version += 1  # La voce era visibile nel ring buffer
+                continue
+            
+            line = '[' + str(ts - day * 86400) + ',' + str(code) + ',' + body + ']\n'
+            f.write(line)
+            size += len(line)
+    finally:
+        if f:
+            f.close()
+
+def _expand(tid, args):
+    """
+    Ricompone il testo di un messaggio salvato come modello più argomenti.
+    
+    Args:
+        tid: Id del modello
+        args: Lista degli argomenti
+    
+    Returns:
+        str: Messaggio completo
+    """
+    template = _templates[tid] if 0 <= tid < len(_templates) else None
+    if template is not None:
         try:
-            os.stat(LOG_FILE)
-        except OSError:
-            # File non esiste, crealo
-            # Assicurati che la directory data esista
-            ensure_directory_exists(get_dirname(LOG_FILE))
+            return template.format(*args)
+        except Exception:
+            return template
+    return f"<modello {tid}> {args}"  # Modello perso: mostra id e argomenti
+
+def _decode_line(day, line):
+    """
+    Decodifica una riga di un segmento nella voce di log (dizionario).
+    Accetta anche le righe nel vecchio formato {"ts", "level", "message"}.
+    
+    Args:
+        day: Giorno (epoch Unix) del segmento
+        line: Riga letta dal file
+    
+    Returns:
+        dict: Voce di log
+    
+    Raises:
+        ValueError: Se la riga non è JSON valido (es. troncata)
+    """
+    rec = ujson.loads(line)
+    if isinstance(rec, dict):
+        return rec
+    if len(rec) < 3 or not 0 <= rec[1] < len(LEVELS):
+        raise ValueError("voce non valida")
+    
+    body = rec[2]
+    if isinstance(body, str):
+        message = body
+    else:
+        message = _expand(body, rec[3:])
+    return {"ts": day * 86400 + rec[0], "level": LEVELS[rec[1]], "message": message}
+
+def _ring_body(slot):
+    """
+    Restituisce il corpo JSON di uno slot, come scritto su disco dopo ts e livello.
+    
+    Args:
+        slot: Indice dello slot
+    
+    Returns:
+        str: Testo JSON ("messaggio" oppure id,arg1,arg2...)
+    """
+    off = slot * _RING_MSG_SIZE
+    text = str(_ring_text[off:off + _ring_len[slot]], 'utf-8')
+    tid = _ring_tid[slot]
+    if tid < 0:
+        return ujson.dumps(text)
+    if text:
+        return str(tid) + ',' + text
+    return str(tid)
+
+def _ring_entry(slot):
+    """
+    Costruisce la voce di log (dizionario) contenuta in uno slot del ring buffer.
+    Usata solo nei percorsi di lettura, mai in log_event.
+    
+    Args:
+        slot: Indice dello slot
+    
+    Returns:
+        dict: Voce di log
+    """
+    off = slot * _RING_MSG_SIZE
+    text = str(_ring_text[off:off + _ring_len[slot]], 'utf-8')
+    tid = _ring_tid[slot]
+    if tid >= 0:
+        text = _expand(tid, ujson.loads('[' + text + ']'))
+    return {
+        "ts": _ring_ts[slot],
+        "level": LEVELS[_ring_level[slot]],
+        "message": text
+    }
+
+def _with_datetime(entry):
+    """
+    Aggiunge a una voce i campi leggibili date (YYYY-MM-DD) e time (HH:MM:SS).
+    Su disco e in memoria si conserva solo il timestamp "ts".
+    
+    Args:
+        entry: Voce di log
+    
+    Returns:
+        dict: La stessa voce, completata
+    """
+    ts = entry.get('ts', 0)
+    entry['date'] = format_date(epoch_day(ts))
+    entry['time'] = format_time(ts)
+    return entry
+
+def _iter_pending():
+    """
+    Genera le voci in attesa di flush (ts, livello, corpo JSON),
+    dalla più vecchia alla più recente.
+    """
+    first = (_ring_head - _ring_count) % _RING_SLOTS
+    for i in range(_ring_count):
+        slot = (first + i) % _RING_SLOTS
+        yield _ring_ts[slot], _ring_level[slot], _ring_body(slot)
+
+def _load_templates():
+    """
+    Carica in RAM la tabella dei modelli salvata su disco.
+    Ogni riga è [id, modello]. Righe troncate (es. spegnimento durante la scrittura),
+    id o modelli duplicati vengono scartati, e in quel caso la tabella viene riscritta
+    senza di essi: i modelli registrati in seguito non finiscono dopo una riga illeggibile.
+    """
+    global _templates_saved, _templates_loaded
+    
+    _templates_loaded = True
+    rewrite = False
+    try:
+        with open(TEMPLATES_FILE, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    tid, template = ujson.loads(line)
+                    if not isinstance(tid, int) or not isinstance(template, str):
+                        raise ValueError("voce non valida")
+                    if not 0 <= tid < _MAX_TEMPLATES:
+                        raise ValueError("id fuori intervallo")
+                except (ValueError, TypeError):
+                    print(f"Modello di log non valido scartato: {line[:40]}")
+                    rewrite = True
+                    continue
                 
-            # Crea il file log vuoto
-            with open(LOG_FILE, 'w') as f:
-                ujson.dump([], f)
+                if (tid < len(_templates) and _templates[tid] is not None) or template in _template_ids:
+                    print(f"Modello di log duplicato scartato: id {tid}")
+                    rewrite = True
+                    continue
+                while len(_templates) <= tid:
+                    _templates.append(None)  # Id di una riga persa: non viene riassegnato
+                _templates[tid] = template
+                _template_ids[template] = tid
+    except OSError:
+        pass  # Nessuna tabella salvata
+    
+    _templates_saved = len(_templates)
+    if rewrite:
+        _rewrite_templates()
+
+def _rewrite_templates():
+    """
+    Riscrive la tabella dei modelli tramite un file temporaneo, con le sole righe valide.
+    
+    Returns:
+        boolean: True se la riscrittura è riuscita
+    """
+    temp_file = TEMPLATES_FILE + '.tmp'
+    try:
+        with open(temp_file, 'w') as f:
+            for tid in range(_templates_saved):
+                template = _templates[tid]
+                if template is not None:
+                    f.write(ujson.dumps([tid, template]) + '\n')
+        os.rename(temp_file, TEMPLATES_FILE)
+        return True
+    except OSError as e:
+        print(f"Errore riscrittura modelli log: {e}")
+        return False
+
+def _save_templates():
+    """
+    Accoda su disco i modelli registrati dopo l'ultimo salvataggio.
+    Va eseguita prima di scrivere le voci che li usano.
+    
+    Returns:
+        boolean: True se la tabella su disco è aggiornata
+    """
+    global _templates_saved
+    
+    if _templates_saved >= len(_templates):
+        return True
+    try:
+        with open(TEMPLATES_FILE, 'a') as f:
+            for tid in range(_templates_saved, len(_templates)):
+                f.write(ujson.dumps([tid, _templates[tid]]) + '\n')
+        _templates_saved = len(_templates)
+        return True
+    except OSError as e:
+        print(f"Errore salvataggio modelli log: {e}")
+        return False
+
+def _intern_template(template):
+    """
+    Restituisce l'id di un modello, registrandolo se nuovo.
+    
+    Args:
+        template: Modello del messaggio con segnaposto {}
+    
+    Returns:
+        int: Id del modello, -1 se la tabella è piena
+    """
+    tid = _template_ids.get(template)
+    if tid is not None:
+        return tid
+    if not _templates_loaded:
+        _ensure_journal()
+        tid = _template_ids.get(template)
+        if tid is not None:
+            return tid
+    if len(_templates) >= _MAX_TEMPLATES:
+        return -1
+    tid = len(_templates)
+    _templates.append(template)
+    _template_ids[template] = tid
+    return tid
+
+def _migrate_legacy_log():
+    """
+    Converte il vecchio file di log JSON unico in segmenti giornalieri e lo rimuove.
+    """
+    try:
+        with open(LEGACY_LOG_FILE, 'r') as f:
+            logs = ujson.load(f)
     except OSError:
+        return  # Nessun file da migrare
+    except ValueError:
+        logs = []
+    
+    try:
+        if isinstance(logs, list) and logs:
+            entries = []
+            for log in logs:
+                if not isinstance(log, dict):
+                    continue
+                day = parse_date(log.get('date', ''))
+                if day is None:
+                    continue
+                entries.append((
+                    day * 86400 + (parse_time(log.get('time', '')) or 0),
+                    _LEVEL_CODES.get(log.get('level'), 1),
+                    ujson.dumps(log.get('message', ''))
+                ))
+            logs = None
+            entries.sort(key=lambda x: x[0])
+            _append_entries(entries)
+        os.remove(LEGACY_LOG_FILE)
+        print("Log migrati nel nuovo formato a segmenti giornalieri")
+    except Exception as e:
+        print(f"Errore durante la migrazione dei log: {e}")
+    
+    gc.collect()
+
+def _ensure_journal():
+    """
+    Prepara la directory del journal, con gestione robusta degli errori.
+    La migrazione dal vecchio formato viene eseguita una sola volta.
+    
+    Returns:
+        boolean: True se il journal è utilizzabile, False altrimenti
+    """
+    global _journal_ready
+    
+    if _journal_ready:
+        return True
+    
+    if not ensure_directory_exists(LOG_DIR):
         # Se c'è un errore nella creazione, stampa un avviso ma non fare crashare l'app
-        print("ATTENZIONE: Impossibile creare il file di log")
+        print("ATTENZIONE: Impossibile creare la directory dei log")
+        return False
+    
+    _journal_ready = True
+    if not _templates_loaded:
+        _load_templates()
+    _migrate_legacy_log()
+    return True
 
 def _flush_log_cache():
     """
-    Scrive la cache dei log su disco.
+    Scrive le voci in attesa del ring buffer su disco accodandole al segmento del giorno.
+    Il costo dipende solo dal numero di voci in cache, non dalla dimensione dello storico.
     """
-    global _log_cache, _last_flush_time
+    global _ring_count, _last_flush_time, _log_version
     
-    if not _log_cache:
+    if not _ring_count:
         return
-        
+    
     try:
-        _ensure_log_file_exists()
-        
-        # Leggi i log esistenti
-        try:
-            with open(LOG_FILE, 'r') as f:
-                logs = ujson.load(f)
-                if not isinstance(logs, list):
-                    logs = []
-        except (OSError, ValueError):
-            logs = []
-        
-        # Aggiungi i log dalla cache
-        logs.extend(_log_cache)
-        
-        # Applica rotazione dei log (rimuovi log più vecchi di MAX_LOG_DAYS)
-        logs = _apply_log_rotation(logs)
+        if not _ensure_journal():
+            return
         
-        # Limita il numero massimo di voci di log
-        if len(logs) > MAX_LOG_ENTRIES:
-            logs = logs[-MAX_LOG_ENTRIES:]  # Mantieni solo i log più recenti
+        # I modelli devono essere su disco prima delle voci che li citano
+        if not _save_templates():
+            return
         
-        # Scrivi i log aggiornati
-        with open(LOG_FILE, 'w') as f:
-            ujson.dump(logs, f)
+        _append_entries(_iter_pending())
         
-        # Pulisci la cache
-        _log_cache = []
-        _last_flush_time = time.time()
-        
-        # Forza garbage collection dopo operazioni su file
-        gc.collect()
+        # Libera gli slot: il contenuto resta nel buffer e verrà sovrascritto.
+        # Le voci ora su disco compaiono in query_logs: cambia anche la versione (ETag)
+        _ring_count = 0
+        _log_version += 1
+        _last_flush_time = now()
         
+        # La rotazione serve solo al cambio di giorno
+        if today() != _last_rotation_day:
+            _apply_log_rotation()
+    
     except Exception as e:
         print(f"Errore durante il flush dei log: {e}")
 
-def _apply_log_rotation(logs):
+def _apply_log_rotation():
+    """
+    Elimina i segmenti più vecchi di MAX_LOG_DAYS.
+    Ogni segmento richiede un solo confronto tra interi, senza leggerne il contenuto.
+    """
+    global _last_rotation_day, _log_version
+    
+    _last_rotation_day = today()
+    
+    # Giorno limite: i segmenti precedenti sono scaduti
+    cutoff = _last_rotation_day - MAX_LOG_DAYS
+    
+    for day in _list_segments():
+        if day >= cutoff:
+            break  # Segmenti ordinati: i successivi sono tutti più recenti
+        try:
+            os.remove(_segment_path(day))
+            _log_version += 1
+        except OSError as e:
+            print(f"Errore rimozione segmento log {format_date(day)}: {e}")
+
+def _ring_reserve():
     """
-    Filtra i log per mantenere solo quelli entro il periodo di MAX_LOG_DAYS.
+    Garantisce che lo slot _ring_head sia libero: a buffer pieno lo svuota su disco.
+    Una voce viene scartata solo se la scrittura non riesce.
+    """
+    global _ring_count, _dropped_entries
+    
+    if _ring_count >= _RING_SLOTS:
+        # Anche con il writer attivo: attenderlo farebbe perdere la voce più vecchia
+        _flush_log_cache()
+        if _ring_count >= _RING_SLOTS:
+            _ring_count -= 1
+            _dropped_entries += 1
+
+def _ring_commit(code, tid):
+    """
+    Completa lo slot _ring_head, il cui testo è già stato scritto, e lo accoda.
     
     Args:
-        logs: Lista di log da filtrare
-        
+        code: Codice numerico del livello
+        tid: Id del modello, -1 per testo libero
+    """
+    global _ring_head, _ring_count, _log_version
+    
+    slot = _ring_head
+    _ring_ts[slot] = now()
+    _ring_level[slot] = code
+    _ring_tid[slot] = tid
+    
+    _ring_head = (slot + 1) % _RING_SLOTS
+    _ring_count += 1
+    _log_version += 1
+
+def _ring_write_text(slot, message):
+    """
+    Copia un messaggio nello slot senza creare copie intermedie in bytes.
+    I messaggi più lunghi di _RING_MSG_SIZE vengono troncati e terminano con "…".
+    
+    Args:
+        slot: Indice dello slot
+        message: Messaggio (str)
+    """
+    off = slot * _RING_MSG_SIZE
+    end = off + _RING_MSG_SIZE
+    try:
+        # MicroPython copia direttamente il buffer della stringa e azzera il resto dello slot
+        struct.pack_into(_RING_PACK, _ring_text, off, message)
+    except Exception:
+        # CPython (simulatore su host) accetta solo bytes (struct.error)
+        struct.pack_into(_RING_PACK, _ring_text, off, message.encode())
+    
+    if _ring_text[end - 1] == 0:
+        # Messaggio più corto dello slot: la fine è il primo byte del riempimento a zero
+        lo, hi = off, end - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _ring_text[mid]:
+                lo = mid + 1
+            else:
+                hi = mid
+        _ring_len[slot] = lo - off
+        return
+    
+    n = _RING_MSG_SIZE
+    if len(message) > n or len(message.encode()) > n:
+        # Troncato: segnalo con "…" senza spezzare un carattere UTF-8 multibyte
+        n -= len(_ELLIPSIS)
+        while n > 0 and (_ring_text[off + n] & 0xC0) == 0x80:
+            n -= 1
+        _ring_text[off + n:off + n + len(_ELLIPSIS)] = _ELLIPSIS
+        n += len(_ELLIPSIS)
+    _ring_len[slot] = n
+
+def _ring_put_int(pos, end, value):
+    """
+    Scrive un intero in cifre decimali nell'area dei messaggi.
+    
+    Args:
+        pos: Offset di scrittura
+        end: Offset limite (escluso)
+        value: Intero da scrivere
+    
     Returns:
-        list: Lista filtrata di log
+        int: Offset successivo, -1 se l'intero non entra
     """
-    if not logs:
-        return []
+    if value < 0:
+        if pos >= end:
+            return -1
+        _ring_text[pos] = 45  # '-'
+        pos += 1
+        value = -value
+    
+    digits = 1
+    v = value
+    while v >= 10:
+        v //= 10
+        digits += 1
+    if pos + digits > end:
+        return -1
+    
+    i = pos + digits
+    while True:
+        i -= 1
+        _ring_text[i] = 48 + value % 10
+        value //= 10
+        if not value:
+            break
+    return pos + digits
+
+def _ring_write_args(slot, args):
+    """
+    Scrive gli argomenti di un modello nello slot come elementi JSON separati da virgola.
+    Gli interi sono scritti cifra per cifra, senza allocazioni; stringhe e altri
+    valori passano da ujson.dumps.
+    
+    Args:
+        slot: Indice dello slot
+        args: Argomenti del modello
+    
+    Returns:
+        boolean: False se gli argomenti non entrano nello slot (non si possono troncare)
+    """
+    off = slot * _RING_MSG_SIZE
+    end = off + _RING_MSG_SIZE
+    pos = off
+    for a in args:
+        if pos > off:
+            if pos >= end:
+                return False
+            _ring_text[pos] = 44  # ','
+            pos += 1
+        if a is True or a is False:
+            data = _JSON_TRUE if a else _JSON_FALSE
+        elif isinstance(a, int):
+            pos = _ring_put_int(pos, end, a)
+            if pos < 0:
+                return False
+            continue
+        else:
+            # Solo valori JSON semplici: il resto (es. eccezioni) viene convertito in testo
+            data = ujson.dumps(a if isinstance(a, (float, str)) else str(a)).encode()
+        n = len(data)
+        if pos + n > end:
+            return False
+        _ring_text[pos:pos + n] = data
+        pos += n
+    _ring_len[slot] = pos - off
+    return True
+
+def set_log_level(level):
+    """
+    Imposta la soglia minima dei messaggi registrati.
+    I messaggi sotto soglia non vengono né stampati né salvati.
+    
+    Args:
+        level: Livello minimo (DEBUG, INFO, WARNING, ERROR)
+    
+    Returns:
+        boolean: True se il livello è valido, False altrimenti
+    """
+    global _min_level
+    
+    code = _LEVEL_CODES.get(level)
+    if code is None:
+        return False
+    _min_level = code
+    return True
+
+def get_log_level():
+    """
+    Restituisce la soglia minima corrente dei messaggi registrati.
+    
+    Returns:
+        str: Livello corrente
+    """
+    return LEVELS[_min_level]
+
+def is_log_enabled(level):
+    """
+    Verifica se un livello di log supera la soglia corrente.
+    Utile per evitare calcoli costosi destinati solo a messaggi di debug.
+    
+    Args:
+        level: Livello da verificare
+    
+    Returns:
+        boolean: True se i messaggi di quel livello vengono registrati
+    """
+    return _LEVEL_CODES.get(level, 1) >= _min_level
+
+def log_eventf(level, template, *args):
+    """
+    Variante di log_event con formattazione differita.
+    Il messaggio viene composto con template.format(*args) solo se il livello è abilitato,
+    quindi un messaggio soppresso non costa né formattazione né allocazioni.
+    Su disco si salvano solo l'id del modello e gli argomenti: il modello deve
+    essere una stringa costante, non un testo già formattato.
+    
+    Args:
+        level: Livello di log (DEBUG, INFO, WARNING, ERROR)
+        template: Modello del messaggio con segnaposto {}
+        *args: Valori da inserire nel modello
+    """
+    code = _LEVEL_CODES.get(level, 1)
+    if code < _min_level:
+        return
+    
+    try:
+        message = template.format(*args)
+    except Exception:
+        log_event(template, level)  # Modello non coerente con gli argomenti: registra almeno il testo
+        return
+    
+    try:
+        tid = _intern_template(template)
+        if tid >= 0:
+            _ring_reserve()
+        if tid < 0 or not _ring_write_args(_ring_head, args):
+            log_event(message, level)  # Tabella piena o argomenti troppo lunghi
+            return
+        _ring_commit(code, tid)
         
-    now = time.time()
-    current_day = time.localtime(now)[7]  # Giorno dell'anno
-    current_year = time.localtime(now)[0]  # Anno corrente
+        print('[', LEVELS[code], '] ', message, sep='')
+        if code == 3:
+            publish(TOPIC_LOGS, 'error', {'message': message})
+        _schedule_flush(code)
+    except Exception as e:
+        print(f"Errore durante la registrazione nel log: {e}")
+
+def _schedule_flush(code):
+    """
+    Avvia la scrittura su disco delle voci in cache se necessario:
+    risveglia il writer, o scrive direttamente se il writer non è attivo.
     
-    filtered_logs = []
+    Args:
+        code: Codice numerico del livello dell'ultima voce
+    """
+    needs_flush = (
+        _ring_count >= _MAX_CACHE_SIZE or 
+        now() - _last_flush_time >= _FLUSH_INTERVAL or
+        code == 3  # Flush immediato per gli errori
+    )
     
-    for log in logs:
-        try:
-            log_date = log.get("date", "")
-            if not log_date:
-                continue
-                
-            # Estrai anno, mese, giorno dalla data del log
-            log_parts = log_date.split('-')
-            if len(log_parts) != 3:
-                continue
-                
-            log_year = int(log_parts[0])
-            log_month = int(log_parts[1])
-            log_day = int(log_parts[2])
-            
-            # Calcola il giorno dell'anno per il log
-            log_day_of_year = day_of_year(log_year, log_month, log_day)
-            
-            # Gestione del cambio anno
-            if log_year == current_year:
-                # Stesso anno: confronto diretto dei giorni
-                if current_day - log_day_of_year <= MAX_LOG_DAYS:
-                    filtered_logs.append(log)
-            elif log_year == current_year - 1 and current_day <= MAX_LOG_DAYS:
-                # Anno precedente, ma siamo all'inizio del nuovo anno
-                days_in_previous_year = 366 if (log_year % 4 == 0 and (log_year % 100 != 0 or log_year % 400 == 0)) else 365
-                if (days_in_previous_year - log_day_of_year + current_day) <= MAX_LOG_DAYS:
-                    filtered_logs.append(log)
-                    
-        except (ValueError, IndexError):
-            # Se c'è un errore nella data, mantieni il log (meglio sicuri)
-            filtered_logs.append(log)
-    
-    return filtered_logs
+    if needs_flush:
+        if _writer_running:
+            _flush_event.set()
+        else:
+            _flush_log_cache()
 
 def log_event(message, level="INFO"):
     """
     Registra un evento nel log di sistema.
-    Utilizza caching per ridurre le operazioni di I/O su file.
+    Il messaggio viene copiato nel ring buffer preallocato; la scrittura su disco
+    è delegata a log_writer_task, o eseguita qui se il writer non è attivo.
+    I messaggi sotto la soglia impostata con set_log_level vengono ignorati.
     
     Args:
         message: Messaggio da registrare
-        level: Livello di log (INFO, WARNING, ERROR)
+        level: Livello di log (DEBUG, INFO, WARNING, ERROR)
     """
-    global _log_cache, _last_flush_time
+    code = _LEVEL_CODES.get(level, 1)
+    if code < _min_level:
+        return
     
     try:
-        # Prepara il nuovo log
-        current_date = get_current_date()
-        current_time = get_current_time()
-        
-        new_log = {
-            "date": current_date,
-            "time": current_time,
-            "level": level,
-            "message": message
-        }
-        
         # Aggiungi alla cache
-        _log_cache.append(new_log)
+        if not isinstance(message, str):
+            message = str(message)
+        _ring_reserve()
+        _ring_write_text(_ring_head, message)
+        _ring_commit(code, -1)
         
         # Stampa a console per debug immediato
-        print(f"[{level}] {current_time}: {message}")
+        print('[', LEVELS[code], '] ', message, sep='')
         
-        # Determina se è necessario fare flush su disco
-        current_time = time.time()
-        needs_flush = (
-            len(_log_cache) >= _MAX_CACHE_SIZE or 
-            current_time - _last_flush_time >= _FLUSH_INTERVAL or
-            level == "ERROR"  # Flush immediato per gli errori
-        )
-        
-        if needs_flush:
-            _flush_log_cache()
+        # Notifica gli iscritti a event_bus (es. client collegati a /events)
+        if code == 3:
+            publish(TOPIC_LOGS, 'error', {'message': message})
         
+        # Determina se è necessario fare flush su disco
+        _schedule_flush(code)
+    
     except Exception as e:
         print(f"Errore durante la registrazione nel log: {e}")
         # In caso di errore nella registrazione, tenta un flush di emergenza
@@ -183,31 +771,299 @@ def log_event(message, level="INFO"):
         except:
             pass
 
+async def log_writer_task():
+    """
+    Task asincrono che scrive su disco le voci accodate da log_event.
+    Si risveglia quando la cache supera _MAX_CACHE_SIZE, per un ERROR
+    o comunque ogni _FLUSH_INTERVAL secondi.
+    """
+    global _writer_running
+    
+    _writer_running = True
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(_flush_event.wait(), _FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            _flush_event.clear()
+            _flush_log_cache()
+    finally:
+        _writer_running = False
+        _flush_log_cache()
+
+def flush_logs():
+    """
+    Scrive immediatamente su disco tutte le voci in attesa.
+    Da usare prima di un riavvio o di un arresto, quando il writer potrebbe non girare più.
+    """
+    try:
+        _flush_log_cache()
+    except Exception as e:
+        print(f"Errore durante il flush dei log: {e}")
+
+def get_log_version():
+    """
+    Returns:
+        int: Versione corrente dei log, per l'ETag delle API
+    """
+    return _log_version
+
+def get_log_stats():
+    """
+    Restituisce le statistiche della coda dei log.
+    
+    Returns:
+        dict: Voci in attesa, voci scartate e stato del writer
+    """
+    return {
+        'pending': _ring_count,
+        'dropped': _dropped_entries,
+        'writer_running': _writer_running
+    }
+
+def _read_segment(day, logs, limit):
+    """
+    Legge un segmento e aggiunge le sue voci alla lista, dalla più recente.
+    
+    Args:
+        day: Giorno (epoch Unix) del segmento
+        logs: Lista di destinazione
+        limit: Numero massimo di voci totali nella lista
+    """
+    entries = []
+    try:
+        with open(_segment_path(day), 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(_decode_line(day, line))
+                except ValueError:
+                    # Riga troncata (es. spegnimento durante la scrittura): ignorala
+                    continue
+    except OSError:
+        return
+    
+    # Le righe sono in ordine cronologico: invertile per avere le più recenti prima
+    entries.reverse()
+    for entry in entries[:limit - len(logs)]:
+        logs.append(_with_datetime(entry))
+
 def get_logs():
     """
     Restituisce tutti i log salvati.
-    Esegue il flush della cache prima di leggere per garantire dati aggiornati.
+    Le voci non ancora scritte su disco sono lette direttamente dal ring buffer.
     
     Returns:
         Lista di log ordinati dal più recente al più vecchio
     """
     try:
-        # Flush della cache prima di leggere
-        _flush_log_cache()
+        # Voci in memoria (le più recenti), dalla più nuova alla più vecchia
+        logs = []
+        for i in range(1, min(_ring_count, MAX_LOG_ENTRIES) + 1):
+            logs.append(_with_datetime(_ring_entry((_ring_head - i) % _RING_SLOTS)))
         
-        _ensure_log_file_exists()
-        with open(LOG_FILE, 'r') as f:
-            logs = ujson.load(f)
-            
-            # Ordina i log per data e ora (più recenti prima)
-            if logs and isinstance(logs, list):
-                logs.sort(key=lambda x: (x.get('date', ''), x.get('time', '')), reverse=True)
-                
+        if not _ensure_journal():
             return logs
+        
+        # I segmenti sono già ordinati per giorno e le righe per ora: nessun sort necessario
+        for day in reversed(_list_segments()):
+            if len(logs) >= MAX_LOG_ENTRIES:
+                break
+            _read_segment(day, logs, MAX_LOG_ENTRIES)
+        
+        return logs
     except Exception as e:
         print(f"Errore durante la lettura dei log: {e}")
         return []
 
+def _parse_cursor(cursor):
+    """
+    Decodifica un cursore di log nella forma "giorno:offset".
+    
+    Args:
+        cursor: Cursore opaco restituito da query_logs
+    
+    Returns:
+        tuple: (giorno del segmento, offset in bytes)
+    
+    Raises:
+        ValueError: Se il cursore non è valido
+    """
+    day, offset = cursor.split(':')
+    return int(day), int(offset)
+
+def _segment_size(day):
+    """
+    Restituisce la dimensione in bytes di un segmento, 0 se non esiste.
+    """
+    try:
+        return os.stat(_segment_path(day))[6]
+    except OSError:
+        return 0
+
+def _scan_segment_reverse(day, end, visit):
+    """
+    Scorre all'indietro le righe di un segmento, dalla più recente, leggendo blocchi
+    dalla fine del file: non carica mai l'intero segmento in memoria.
+    
+    Args:
+        day: Giorno (epoch Unix) del segmento
+        end: Offset di fine scansione (escluso), None per la fine del file
+        visit: Funzione (offset, riga) chiamata per ogni riga, ritorna False per fermarsi
+    
+    Returns:
+        boolean: False se la scansione è stata interrotta da visit, True altrimenti
+    """
+    try:
+        f = open(_segment_path(day), 'rb')
+    except OSError:
+        return True
+    
+    try:
+        if end is None:
+            f.seek(0, 2)
+            end = f.tell()
+        
+        buf = b''
+        buf_start = end  # Offset su file del primo byte di buf
+        while True:
+            # Cerca l'inizio dell'ultima riga completa nel buffer
+            i = buf.rfind(b'\n', 0, len(buf) - 1)
+            if i >= 0 or (buf_start == 0 and buf):
+                line = buf[i + 1:]
+                buf = buf[:i + 1]
+                line = line.strip()
+                if line and not visit(buf_start + i + 1, line):
+                    return False
+                continue
+            if buf_start == 0:
+                return True
+            n = min(_SCAN_BLOCK_SIZE, buf_start)
+            buf_start -= n
+            f.seek(buf_start)
+            buf = f.read(n) + buf
+    finally:
+        f.close()
+
+def query_logs(level=None, since=None, limit=100, cursor=None, after=None):
+    """
+    Interroga il journal dei log senza caricare e ordinare l'intero storico.
+    
+    Senza "after" scorre i segmenti all'indietro dalla voce più recente (o dal cursore
+    di una pagina precedente) e si ferma appena raccolte "limit" voci o superato "since".
+    Con "after" restituisce solo le voci scritte dopo quel cursore (modalità tail): al più
+    "limit" voci, le più recenti, sempre filtrate per livello e "since".
+    
+    Args:
+        level: Livello minimo da includere (DEBUG, INFO, WARNING, ERROR), None per tutti
+        since: Timestamp minimo delle voci (secondi epoch Unix), None per nessun limite
+        limit: Numero massimo di voci da restituire
+        cursor: Cursore "cursor" di una risposta precedente per la pagina successiva
+        after: Cursore "tail" di una risposta precedente per le sole voci nuove
+    
+    Returns:
+        dict: {'logs': voci dalla più recente, 'cursor': pagina successiva o None,
+               'tail': cursore da usare con "after" per le voci successive,
+               'pending': voci non ancora su disco, escluse da questa risposta}
+    
+    Raises:
+        ValueError: Se livello o cursori non sono validi
+    """
+    min_code = _LEVEL_CODES[level] if level else 0
+    limit = max(1, min(int(limit), MAX_LOG_ENTRIES))
+    
+    # Le voci ancora in memoria non hanno una posizione su disco: il writer viene risvegliato
+    # e le scrive subito, senza I/O nella richiesta HTTP; "pending" indica al client che
+    # compariranno con la prossima richiesta "after". Senza writer vengono scritte qui.
+    if _ring_count:
+        if _writer_running:
+            _flush_event.set()
+        else:
+            _flush_log_cache()
+    pending = _ring_count
+    if not _ensure_journal():
+        return {'logs': [], 'cursor': None, 'tail': None, 'pending': pending}
+    
+    segments = _list_segments()
+    tail = None
+    if segments:
+        tail = f"{segments[-1]}:{_segment_size(segments[-1])}"
+    
+    logs = []
+    state = {'cursor': None, 'day': None}
+    
+    def visit(offset, line):
+        try:
+            entry = _decode_line(state['day'], line)
+        except ValueError:
+            return True  # Riga troncata: ignorala
+        if since is not None and entry.get('ts', 0) < since:
+            state['cursor'] = None  # Voci più vecchie non interessano
+            return False
+        if _LEVEL_CODES.get(entry.get('level'), 1) >= min_code:
+            if len(logs) >= limit:
+                return False
+            logs.append(_with_datetime(entry))
+            state['cursor'] = f"{state['day']}:{offset}"
+        return True
+    
+    if after:
+        # Modalità tail: solo le voci successive al cursore, in ordine cronologico
+        after_day, after_offset = _parse_cursor(after)
+        new_logs = []
+        for day in segments:
+            if day < after_day:
+                continue
+            start = 0
+            if day == after_day:
+                start = after_offset
+                if _segment_size(day) < start:
+                    start = 0  # Segmento ricreato (log cancellati)
+            try:
+                with open(_segment_path(day), 'rb') as f:
+                    f.seek(start)
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            entry = _decode_line(day, line)
+                        except ValueError:
+                            continue
+                        if since is not None and entry.get('ts', 0) < since:
+                            continue
+                        if _LEVEL_CODES.get(entry.get('level'), 1) >= min_code:
+                            new_logs.append(entry)
+                            if len(new_logs) >= 2 * limit:
+                                del new_logs[:-limit]  # Mantieni solo le più recenti, un taglio ogni "limit" voci
+            except OSError:
+                continue
+        new_logs = new_logs[-limit:]
+        new_logs.reverse()
+        for entry in new_logs:
+            _with_datetime(entry)
+        return {'logs': new_logs, 'cursor': None, 'tail': tail or after, 'pending': pending}
+    
+    cursor_day, cursor_offset = None, None
+    if cursor:
+        cursor_day, cursor_offset = _parse_cursor(cursor)
+    
+    for day in reversed(segments):
+        if cursor_day is not None and day > cursor_day:
+            continue  # Segmenti già restituiti nelle pagine precedenti
+        state['day'] = day
+        end = cursor_offset if day == cursor_day else None
+        if not _scan_segment_reverse(day, end, visit):
+            break
+    else:
+        # Storico esaurito: non ci sono altre pagine
+        state['cursor'] = None
+    
+    return {'logs': logs, 'cursor': state['cursor'], 'tail': tail, 'pending': pending}
+
 def clear_logs():
     """
     Cancella tutti i log e resetta la cache.
@@ -215,16 +1071,19 @@ def clear_logs():
     Returns:
         boolean: True se l'operazione è riuscita, False altrimenti
     """
-    global _log_cache, _last_flush_time
+    global _ring_count, _last_flush_time, _dropped_entries, _log_version
     
     try:
-        _ensure_log_file_exists()
-        with open(LOG_FILE, 'w') as f:
-            ujson.dump([], f)
-            
+        _ensure_journal()
+        _log_version += 1  # Anche una cancellazione parziale cambia il contenuto
+        
+        for day in _list_segments():
+            os.remove(_segment_path(day))
+        
         # Resetta anche la cache
-        _log_cache = []
-        _last_flush_time = time.time()
+        _ring_count = 0
+        _last_flush_time = now()
+        _dropped_entries = 0
         
         # Forza la garbage collection
         gc.collect()
@@ -236,4 +1095,4 @@ def clear_logs():
 
 # Inizializzazione del modulo
 # Imposta il timestamp dell'ultimo flush all'avvio
-_last_flush_time = time.time()
\ No newline at end of file
+_last_flush_time = now()
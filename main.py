@@ -4,9 +4,9 @@ File principale del sistema di irrigazione.
 from wifi_manager import initialize_network, reset_wifi_module, retry_client_connection
 from web_server import start_web_server
 from zone_manager import initialize_pins, stop_all_zones
-from program_scheduling import check_programs
+from program_scheduling import check_programs, wait_next_activation
 from program_execution import reset_program_state
-from log_manager import log_event
+from log_manager import log_event, log_eventf, log_writer_task, flush_logs
 from diagnostics.system_monitor import start_diagnostics, check_memory_usage
 import uasyncio as asyncio
 from utils import gc_collect
@@ -20,7 +20,7 @@ try:
 except (ImportError, AttributeError):
     HAS_WATCHDOG = False
 
-# Intervallo di controllo dei programmi in secondi
+# Attesa in secondi prima di riprendere il controllo dei programmi dopo un errore
 PROGRAM_CHECK_INTERVAL = 30
 WATCHDOG_INTERVAL = 60  # Intervallo di attività del watchdog in secondi
 MAX_CONSECUTIVE_ERRORS = 5  # Numero massimo di errori consecutivi permessi
@@ -33,7 +33,8 @@ system_start_time = time.time()
 
 async def program_check_loop():
     """
-    Task asincrono che controlla periodicamente i programmi di irrigazione.
+    Task asincrono che avvia i programmi di irrigazione alla loro scadenza.
+    Dorme fino alla prossima attivazione pianificata invece di interrogare periodicamente.
     Implementa meccanismi di recupero da errori e tentativi ripetuti.
     """
     global consecutive_program_errors, last_error_reset_time
@@ -47,8 +48,8 @@ async def program_check_loop():
             if consecutive_program_errors > 0:
                 consecutive_program_errors = 0
                 
-            # Attendi fino al prossimo controllo
-            await asyncio.sleep(PROGRAM_CHECK_INTERVAL)
+            # Attendi fino alla prossima attivazione o a una modifica dei programmi
+            await wait_next_activation()
             
         except asyncio.CancelledError:
             # Gestisce la cancellazione pulita del task
@@ -163,7 +164,7 @@ async def main():
                 pass
         except Exception as e:
             # Gestisci qualsiasi altro errore inaspettato
-            log_event(f"Errore durante disattivazione Bluetooth: {e}", "DEBUG")
+            log_eventf("DEBUG", "Errore durante disattivazione Bluetooth: {}", e)
         
         # Pulizia iniziale della memoria
         gc_collect()
@@ -209,6 +210,10 @@ async def main():
         # FASE 7: Avvio dei servizi principali
         # Ogni servizio è avviato come task asincrono separato
         
+        # Avvia il writer dei log: da qui in poi log_event non scrive più su disco
+        log_writer = asyncio.create_task(log_writer_task())
+        tasks.append(log_writer)
+        
         # Avvia il web server
         log_event("Avvio del web server", "INFO")
         web_server_task = asyncio.create_task(start_web_server())
@@ -258,6 +263,7 @@ async def main():
         print(f"ERRORE CRITICO: {e}")
         # Pausa breve per permettere la registrazione dell'errore
         await asyncio.sleep(1)
+        flush_logs()
         
         # Tenta un riavvio sicuro
         machine.reset()
@@ -291,8 +297,9 @@ def start():
         
         # Salva l'errore nel log prima del riavvio
         try:
-            from log_manager import log_event
+            from log_manager import log_event, flush_logs
             log_event(f"ERRORE FATALE ALL'AVVIO: {e}", "ERROR")
+            flush_logs()
         except:
             pass
             
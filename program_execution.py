@@ -1,13 +1,216 @@
 """
 Modulo per l'esecuzione dei programmi di irrigazione.
 Gestisce l'esecuzione e l'interruzione dei programmi in modo sicuro.
+
+Ogni passo ha una scadenza assoluta in ticks_ms e un'unica attesa, che termina
+alla scadenza o subito quando stop_program cambia lo stato del programma.
 """
 import time
 import uasyncio as asyncio
-from log_manager import log_event
-from program_state import program_running, current_program_id, save_program_state, load_program_state
+from log_manager import log_event, log_eventf
+from program_state import state, set_program_running, set_program_idle, clear_program_state
 from zone_manager import start_zone, stop_zone, stop_all_zones, get_active_zones_count
 from settings_manager import load_user_settings
+from program_runtime import RESULT_COMPLETED, RESULT_STOPPED, RESULT_ERROR
+from time_utils import today
+from event_bus import publish, TOPIC_PROGRAM_STATE
+
+# Passo in corso del programma in esecuzione, None se nessun programma è attivo
+# {'index': indice del passo, 'zone_id': zona (None durante una pausa),
+#  'phase': 'zone' o 'delay', 'deadline': scadenza in ticks_ms}
+_active_step = None
+
+def _set_active_step(index, zone_id, phase, duration_ms):
+    """
+    Registra il passo in corso e ne calcola la scadenza.
+    
+    Args:
+        index: Indice del passo nel programma
+        zone_id: Zona attiva, None durante una pausa
+        phase: 'zone' o 'delay'
+        duration_ms: Durata del passo in millisecondi
+        
+    Returns:
+        int: Scadenza del passo in ticks_ms
+    """
+    global _active_step
+    
+    deadline = time.ticks_add(time.ticks_ms(), duration_ms)
+    _active_step = {'index': index, 'zone_id': zone_id, 'phase': phase, 'deadline': deadline}
+    publish(TOPIC_PROGRAM_STATE, 'step', {'program_id': state.program_id, 'index': index,
+                                          'zone_id': zone_id, 'phase': phase,
+                                          'duration': duration_ms // 1000})
+    return deadline
+
+def _is_current(program_id):
+    """
+    Verifica che il programma sia ancora quello in esecuzione.
+    
+    Args:
+        program_id: ID del programma
+        
+    Returns:
+        boolean: False se il programma è stato fermato
+    """
+    return state.running and state.program_id == program_id
+
+def _parse_step(index, step):
+    """
+    Valida uno step del programma.
+    
+    Args:
+        index: Indice dello step
+        step: Step nel formato {'zone_id', 'duration'}
+        
+    Returns:
+        tuple: (zone_id, durata in minuti), None se lo step non è valido
+    """
+    if not isinstance(step, dict):
+        log_eventf("WARNING", "Step {} non valido, ignorato", index+1)
+        return None
+    
+    if step.get('zone_id') is None:
+        log_eventf("ERROR", "Errore nel passo {}: zone_id mancante", index+1)
+        return None
+    
+    try:
+        return int(step['zone_id']), int(step.get('duration', 1))
+    except (ValueError, TypeError):
+        log_eventf("WARNING", "Step {} non valido, ignorato", index+1)
+        return None
+
+async def _wait_deadline(deadline, program_id):
+    """
+    Attende la scadenza di un passo senza polling.
+    L'attesa è interrotta immediatamente da un cambio di stato del programma.
+    
+    Args:
+        deadline: Scadenza in ticks_ms
+        program_id: ID del programma che sta attendendo
+        
+    Returns:
+        boolean: True alla scadenza, False se il programma è stato fermato
+    """
+    while _is_current(program_id):
+        remaining = time.ticks_diff(deadline, time.ticks_ms())
+        if remaining <= 0:
+            return True
+        try:
+            await asyncio.wait_for(state.changed.wait(), remaining / 1000)
+        except asyncio.TimeoutError:
+            pass
+    return False
+
+async def _run_sequential(steps, program_id, activation_delay):
+    """
+    Esegue gli step uno dopo l'altro, con l'eventuale pausa tra le zone.
+    
+    Args:
+        steps: Lista degli step del programma
+        program_id: ID del programma
+        activation_delay: Pausa in secondi tra una zona e la successiva
+    """
+    for i, step in enumerate(steps):
+        # Verifica se il programma è stato interrotto
+        if not _is_current(program_id):
+            log_eventf("INFO", "Programma interrotto dall'utente")
+            return
+        
+        parsed = _parse_step(i, step)
+        if not parsed:
+            continue
+        zone_id, duration = parsed
+            
+        log_eventf("INFO", "Attivazione zona {} per {} minuti", zone_id, duration)
+        
+        # FASE 2.1: Attiva la zona (senza timer proprio: la chiude l'esecutore)
+        if not start_zone(zone_id, duration, from_program=True):
+            log_eventf("ERROR", "Errore nell'attivazione della zona {}", zone_id)
+            continue
+            
+        # FASE 2.2: Attendi la scadenza dello step, calcolata dall'attivazione
+        deadline = _set_active_step(i, zone_id, 'zone', duration * 60000)
+        if not await _wait_deadline(deadline, program_id):
+            log_eventf("INFO", "Programma interrotto durante l'esecuzione di uno step")
+            return
+            
+        # FASE 2.3: Ferma la zona
+        if not stop_zone(zone_id):
+            log_eventf("WARNING", "Errore nell'arresto della zona {}", zone_id)
+            
+        log_eventf("INFO", "Zona {} completata", zone_id)
+
+        # Gestione del ritardo tra zone
+        if activation_delay > 0 and i < len(steps) - 1:
+            log_eventf("INFO", "Attesa {} secondi prima della prossima zona", activation_delay)
+            
+            deadline = _set_active_step(i, None, 'delay', activation_delay * 1000)
+            if not await _wait_deadline(deadline, program_id):
+                log_eventf("INFO", "Ritardo interrotto: programma fermato")
+                return
+
+async def _run_parallel(steps, program_id, max_active):
+    """
+    Esegue gli step in gruppi concorrenti di al massimo max_active zone.
+    Appena una zona termina, il posto libero viene assegnato al primo step in
+    attesa (nell'ordine del programma) la cui zona non sia già aperta.
+    La pausa tra le zone non si applica in questa modalità.
+    
+    Args:
+        steps: Lista degli step del programma
+        program_id: ID del programma
+        max_active: Numero massimo di zone aperte contemporaneamente
+    """
+    pending = []
+    for i, step in enumerate(steps):
+        parsed = _parse_step(i, step)
+        if parsed:
+            pending.append((i, parsed[0], parsed[1]))
+    
+    running = {}  # zone_id -> (indice dello step, scadenza in ticks_ms)
+    
+    while pending or running:
+        if not _is_current(program_id):
+            log_eventf("INFO", "Programma interrotto durante l'esecuzione di uno step")
+            return
+        
+        # Occupa i posti liberi con gli step in attesa
+        k = 0
+        while k < len(pending) and len(running) < max_active:
+            i, zone_id, duration = pending[k]
+            if zone_id in running:
+                k += 1  # Stessa zona già aperta: resta in coda
+                continue
+            del pending[k]
+            
+            log_eventf("INFO", "Attivazione zona {} per {} minuti", zone_id, duration)
+            if not start_zone(zone_id, duration, from_program=True):
+                log_eventf("ERROR", "Errore nell'attivazione della zona {}", zone_id)
+                continue
+            running[zone_id] = (i, time.ticks_add(time.ticks_ms(), duration * 60000))
+        
+        if not running:
+            return  # Nessuna zona avviabile
+        
+        # Attendi la prima scadenza tra le zone aperte
+        now = time.ticks_ms()
+        next_zone = None
+        for zone_id, (i, deadline) in running.items():
+            if next_zone is None or time.ticks_diff(deadline, running[next_zone][1]) < 0:
+                next_zone = zone_id
+        i, deadline = running[next_zone]
+        _set_active_step(i, next_zone, 'zone', time.ticks_diff(deadline, now))
+        if not await _wait_deadline(deadline, program_id):
+            log_eventf("INFO", "Programma interrotto durante l'esecuzione di uno step")
+            return
+        
+        # Chiudi tutte le zone scadute
+        now = time.ticks_ms()
+        for zone_id in [z for z, (_, d) in running.items() if time.ticks_diff(d, now) <= 0]:
+            del running[zone_id]
+            if not stop_zone(zone_id):
+                log_eventf("WARNING", "Errore nell'arresto della zona {}", zone_id)
+            log_eventf("INFO", "Zona {} completata", zone_id)
 
 async def execute_program(program, manual=False):
     """
@@ -21,22 +224,15 @@ async def execute_program(program, manual=False):
     Returns:
         boolean: True se l'esecuzione è completata con successo, False altrimenti
     """
+    global _active_step
+    
     if not isinstance(program, dict):
-        log_event("Tentativo di eseguire un programma non valido", "ERROR")
+        log_eventf("ERROR", "Tentativo di eseguire un programma non valido")
         return False
     
-    # Ricarica lo stato per assicurarsi di avere dati aggiornati
-    load_program_state()
-    
-    # Riferimento esplicito alle variabili globali
-    global program_running, current_program_id
-    
-    if program_running:
-        successful_execution = True
-        # Importazione locale per evitare dipendenze circolari
-        from program_manager import update_last_run_date
-        update_last_run_date(program_id)
-        log_event(f"Programma {program_name} completato con successo", "INFO")
+    if state.running:
+        log_eventf("WARNING", "Programma {} già in esecuzione, avvio annullato", state.program_id)
+        return False
 
     # Controllo migliorato delle zone attive: sempre arrestare tutte le zone manuali
     # prima di avviare un programma (automatico o manuale)
@@ -46,66 +242,42 @@ async def execute_program(program, manual=False):
         try:
             # Primo tentativo di arresto con logging dettagliato
             if not stop_all_zones():
-                log_event("Errore durante il primo tentativo di arresto zone attive", "WARNING")
+                log_eventf("WARNING", "Errore durante il primo tentativo di arresto zone attive")
                 # Secondo tentativo di arresto dopo una breve pausa
                 await asyncio.sleep(1)
                 if not stop_all_zones():
-                    log_event("Errore critico: impossibile arrestare le zone attive", "ERROR")
+                    log_eventf("ERROR", "Errore critico: impossibile arrestare le zone attive")
                     return False
         except Exception as e:
-            log_event(f"Eccezione durante l'arresto delle zone attive: {e}", "ERROR")
+            log_eventf("ERROR", "Eccezione durante l'arresto delle zone attive: {}", e)
             # Tenta comunque di continuare, ma con cautela
 
     # Assicurazione finale che tutte le zone siano disattivate
     try:
         # Verifica esplicita che tutte le zone siano arrestate
         if not stop_all_zones():
-            log_event("Errore durante l'arresto delle zone, tentativo di recupero", "ERROR")
+            log_eventf("ERROR", "Errore durante l'arresto delle zone, tentativo di recupero")
             # Ultimo tentativo disperato con attesa più lunga
             await asyncio.sleep(2)
             if not stop_all_zones():
-                log_event("Impossibile garantire l'arresto di tutte le zone, annullamento avvio programma", "ERROR")
+                log_eventf("ERROR", "Impossibile garantire l'arresto di tutte le zone, annullamento avvio programma")
                 return False
     except Exception as e:
-        log_event(f"Eccezione grave durante l'arresto delle zone: {e}", "ERROR")
+        log_eventf("ERROR", "Eccezione grave durante l'arresto delle zone: {}", e)
         return False
 
     # Ottieni l'ID del programma
     program_id = str(program.get('id', '0'))
     program_name = program.get('name', 'Senza nome')
     
-    # FASE 1: Imposta lo stato del programma
-    program_running = True
-    current_program_id = program_id
-    
-    # Salva lo stato aggiornato su file
-    save_program_state()
-    
-    # FASE 2: Verifica che lo stato sia stato salvato correttamente
-    # Effettua più tentativi per garantire che lo stato sia persistente
-    state_persisted = False
-    for retry in range(3):  # Massimo 3 tentativi
-        # Verifica lo stato salvato
-        load_program_state()
-        
-        if program_running and current_program_id == program_id:
-            state_persisted = True
-            break
-        
-        # Se lo stato non è corretto, lo reimpostiamo e risalviamo
-        log_event(f"Stato programma non persistito, tentativo {retry + 1}/3", "WARNING")
-        program_running = True
-        current_program_id = program_id
-        save_program_state()
-        
-        await asyncio.sleep(0.2)  # Breve pausa tra i tentativi
-    
-    if not state_persisted:
-        log_event("IMPORTANTE: Impossibile persistere lo stato del programma", "ERROR")
+    # FASE 1: Imposta lo stato del programma (un solo record su file, con CRC)
+    set_program_running(program_id)
+    start_day = today()
+    start_ticks = time.ticks_ms()
+    result = RESULT_STOPPED
     
-    # FASE 3: Esecuzione del programma
-    program_name = program.get('name', 'Senza nome')
-    log_event(f"Avvio programma: {program_name} (ID: {program_id})", "INFO")
+    # FASE 2: Esecuzione del programma
+    log_eventf("INFO", "Avvio programma: {} (ID: {})", program_name, program_id)
 
     # Carica le impostazioni utente per il ritardo di attivazione
     settings = load_user_settings()
@@ -120,112 +292,50 @@ async def execute_program(program, manual=False):
         
         # Validation: verifica che gli steps siano in formato valido
         if not isinstance(steps, list):
-            log_event(f"Formato steps non valido nel programma {program_id}", "ERROR")
+            log_eventf("ERROR", "Formato steps non valido nel programma {}", program_id)
             raise ValueError("Formato steps non valido")
         
-        for i, step in enumerate(steps):
-            # Verifica periodicamente se il programma è stato interrotto
-            load_program_state()
-            
-            if not program_running:
-                log_event("Programma interrotto dall'utente", "INFO")
-                break
-
-            # Verifica che lo step sia valido
-            if not isinstance(step, dict):
-                log_event(f"Step {i+1} non valido, ignorato", "WARNING")
-                continue
-                
-            zone_id = step.get('zone_id')
-            duration = step.get('duration', 1)
-            
-            if zone_id is None:
-                log_event(f"Errore nel passo {i+1}: zone_id mancante", "ERROR")
-                continue
-                
-            log_event(f"Attivazione zona {zone_id} per {duration} minuti", "INFO")
-            
-            # FASE 3.1: Attiva la zona
-            result = start_zone(zone_id, duration)
-            if not result:
-                log_event(f"Errore nell'attivazione della zona {zone_id}", "ERROR")
-                continue
-                
-            # FASE 3.2: Attendi per la durata specificata
-            # Suddividi l'attesa in intervalli più brevi per verificare interruzioni
-            remaining_seconds = duration * 60
-            check_interval = 10  # Verifica ogni 10 secondi
-            
-            while remaining_seconds > 0 and program_running:
-                # Determina il tempo di attesa per questo ciclo
-                wait_time = min(check_interval, remaining_seconds)
-                
-                # Attendi
-                await asyncio.sleep(wait_time)
-                remaining_seconds -= wait_time
-                
-                # Verifica lo stato del programma
-                load_program_state()
-                
-                if not program_running:
-                    log_event("Programma interrotto durante l'esecuzione di uno step", "INFO")
-                    break
-            
-            # Se il programma è stato interrotto, esci dal ciclo degli step
-            if not program_running:
-                break
-                
-            # FASE 3.3: Ferma la zona
-            if not stop_zone(zone_id):
-                log_event(f"Errore nell'arresto della zona {zone_id}", "WARNING")
-                
-            log_event(f"Zona {zone_id} completata", "INFO")
-
-            # Gestione del ritardo tra zone
-            if activation_delay > 0 and i < len(steps) - 1:
-                # Converti il ritardo in secondi
-                delay_in_seconds = activation_delay
-                log_event(f"Attesa {delay_in_seconds} secondi prima della prossima zona", "INFO")
-
-                # Suddividi il ritardo in intervalli più brevi per controllo interruzioni
-                remaining_delay = delay_in_seconds
-                while remaining_delay > 0 and program_running:
-                    wait_time = min(check_interval, remaining_delay)
-                    await asyncio.sleep(wait_time)
-                    remaining_delay -= wait_time
-
-                    # Verifica lo stato del programma (potrebbe essere stato interrotto)
-                    load_program_state()
-
-                    if not program_running:
-                        log_event("Ritardo interrotto: programma fermato", "INFO")
-                        break
+        if program.get('parallel_groups'):
+            # Più zone insieme, entro il limite di zone attive
+            max_active = max(1, int(settings.get('max_active_zones', 1)))
+            await _run_parallel(steps, program_id, max_active)
+        else:
+            await _run_sequential(steps, program_id, activation_delay)
         
-        # FASE 4: Verifica se l'esecuzione è stata completata con successo
+        # FASE 3: Verifica se l'esecuzione è stata completata con successo
         # Se siamo arrivati qui e il programma è ancora in esecuzione, 
         # significa che tutti gli step sono stati completati
-        if program_running:
+        if _is_current(program_id):
             successful_execution = True
-            update_last_run_date(program_id)
-            log_event(f"Programma {program_name} completato con successo", "INFO")
+            result = RESULT_COMPLETED
+            log_eventf("INFO", "Programma {} completato con successo", program_name)
         
         return successful_execution
     
     except Exception as e:
-        log_event(f"Errore durante l'esecuzione del programma {program_name}: {e}", "ERROR")
+        log_eventf("ERROR", "Errore durante l'esecuzione del programma {}: {}", program_name, e)
+        result = RESULT_ERROR
         return False
     finally:
-        # FASE 5: Pulizia finale - questi passaggi vengono eseguiti sempre
+        # FASE 4: Pulizia finale - questi passaggi vengono eseguiti sempre
+        _active_step = None
         try:
-            # Aggiorna lo stato del programma
-            program_running = False
-            current_program_id = None
-            save_program_state()
+            # Registra esito e durata nei metadati di esecuzione
+            # Importazione locale per evitare dipendenze circolari
+            from program_manager import record_program_run
+            duration = time.ticks_diff(time.ticks_ms(), start_ticks) // 1000
+            record_program_run(program_id, start_day, result, duration)
+            publish(TOPIC_PROGRAM_STATE, 'finished', {'program_id': program_id, 'result': result,
+                                                      'duration': duration})
+            
+            # Aggiorna lo stato del programma, se non già fatto da stop_program
+            if state.program_id == program_id:
+                set_program_idle()
             
             # Assicurati che tutte le zone siano disattivate
             stop_all_zones()
         except Exception as final_e:
-            log_event(f"Errore durante la pulizia finale: {final_e}", "ERROR")
+            log_eventf("ERROR", "Errore durante la pulizia finale: {}", final_e)
 
 def stop_program():
     """
@@ -235,96 +345,43 @@ def stop_program():
     Returns:
         boolean: True se l'operazione è riuscita, False altrimenti
     """
-    global program_running, current_program_id
-    
-    # Salva i valori originali per la verifica
-    original_running = program_running
-    original_id = current_program_id
-    
-    # Ricarica lo stato per assicurarsi di avere dati aggiornati
-    load_program_state()
-    
-    # Verifica di coerenza: se non era in esecuzione prima ma ora lo è,
-    # considera lo stato originale più attendibile
-    # Questo gestisce i casi di race condition nei caricamenti da file
-    if not program_running and original_running:
-        log_event(f"Stato incoerente durante arresto: era {original_running}, ora {program_running}", "WARNING")
-        program_running = True
-        current_program_id = original_id
-    
     # Se non c'è nessun programma in esecuzione, non fare nulla
-    if not program_running:
-        log_event("Nessun programma in esecuzione da interrompere", "INFO")
+    if not state.running:
+        log_eventf("INFO", "Nessun programma in esecuzione da interrompere")
         return False
         
     # FASE 1: Log dell'operazione
-    prog_id = current_program_id or "sconosciuto"
-    log_event(f"Interruzione programma {prog_id} in corso", "INFO")
+    prog_id = state.program_id or "sconosciuto"
+    log_eventf("INFO", "Interruzione programma {} in corso", prog_id)
     
     # FASE 2: Arresta tutte le zone prima di aggiornare lo stato
     # Questo evita che il programma venga marcato come interrotto ma le zone rimangano attive
     try:
         if not stop_all_zones():
-            log_event("Errore nell'arresto delle zone durante l'interruzione", "ERROR")
+            log_eventf("ERROR", "Errore nell'arresto delle zone durante l'interruzione")
         else:
-            log_event("Tutte le zone arrestate correttamente", "INFO")
+            log_eventf("INFO", "Tutte le zone arrestate correttamente")
     except Exception as e:
-        log_event(f"Eccezione durante l'arresto delle zone: {e}", "ERROR")
+        log_eventf("ERROR", "Eccezione durante l'arresto delle zone: {}", e)
     
-    # FASE 3: Aggiorna lo stato del programma
-    program_running = False
-    current_program_id = None
+    # FASE 3: Aggiorna lo stato del programma (notifica l'esecutore e salva su file)
+    set_program_idle()
     
-    # FASE 4: Salva lo stato e verifica
-    save_program_state()
-    
-    # Esegui più tentativi per garantire che lo stato sia persistito
-    state_saved = False
-    for retry in range(3):
-        # Verifica lo stato salvato
-        original_running = program_running
-        original_id = current_program_id
-        
-        # Ricarica lo stato
-        load_program_state()
-        
-        # Verifica che lo stato sia stato salvato correttamente
-        if program_running == original_running and current_program_id == original_id:
-            state_saved = True
-            break
-        
-        # Se lo stato non è stato salvato correttamente, risalva
-        log_event(f"Stato non persistito durante arresto, tentativo {retry + 1}/3", "WARNING")
-        program_running = original_running
-        current_program_id = original_id
-        save_program_state()
-        
-        time.sleep(0.2)  # Breve pausa tra i tentativi
-    
-    if not state_saved:
-        log_event("IMPORTANTE: Impossibile persistere stato del programma dopo arresto", "ERROR")
-        
     return True
 
 def reset_program_state():
     """
     Resetta lo stato del programma.
     """
-    global program_running, current_program_id
-    
     # Ferma eventuali zone attive
     try:
         stop_all_zones()
     except Exception as e:
-        log_event(f"Errore durante l'arresto delle zone nel reset: {e}", "ERROR")
+        log_eventf("ERROR", "Errore durante l'arresto delle zone nel reset: {}", e)
     
-    # Resetta le variabili di stato
-    program_running = False
-    current_program_id = None
-    
-    # Salva lo stato su file
-    save_program_state()
-    log_event("Stato del programma resettato", "INFO")
+    # Resetta lo stato e salvalo su file (allinea anche il disco dopo un riavvio)
+    clear_program_state()
+    log_eventf("INFO", "Stato del programma resettato")
 
 def get_program_state():
     """
@@ -334,16 +391,12 @@ def get_program_state():
     Returns:
         dict: Stato del programma con informazioni sulla zona attiva
     """
-    load_program_state()
-    
-    state = {
-        'program_running': program_running,
-        'current_program_id': current_program_id,
-        'active_zone': None
-    }
+    result = state.to_dict()
+    result['active_zone'] = None
+    result['active_step'] = None
     
     # Se c'è un programma in esecuzione, aggiungi informazioni sulla zona attiva
-    if program_running:
+    if state.running:
         # Ottieni lo stato delle zone
         from zone_manager import get_zones_status
         zones_status = get_zones_status()
@@ -351,6 +404,17 @@ def get_program_state():
         active_zones_list = [zone for zone in zones_status if zone.get('active', False)]
         if active_zones_list:
             # Prendi la prima zona attiva (dovrebbe essere solo una durante un programma)
-            state['active_zone'] = active_zones_list[0]
+            result['active_zone'] = active_zones_list[0]
+        
+        # Passo in corso, con il tempo residuo calcolato dalla scadenza
+        step = _active_step
+        if step:
+            remaining_ms = max(0, time.ticks_diff(step['deadline'], time.ticks_ms()))
+            result['active_step'] = {
+                'index': step['index'],
+                'zone_id': step['zone_id'],
+                'phase': step['phase'],
+                'remaining_seconds': (remaining_ms + 999) // 1000
+            }
     
-    return state
\ No newline at end of file
+    return result
\ No newline at end of file
@@ -5,102 +5,356 @@ Gestisce il caricamento, la creazione, l'aggiornamento e l'esecuzione dei progra
 import ujson
 import time
 import uos as os
-from utils import ensure_directory_exists, get_current_date, get_dirname
-from log_manager import log_event
+from utils import ensure_directory_exists
+from time_utils import format_date, format_time, SECONDS_PER_DAY
+from log_manager import log_event, log_eventf
+from program_model import compile_program, MONTH_NAMES
+from program_runtime import (RUNTIME_FIELDS, get_last_run_day, import_legacy_fields,
+                             record_run, remove_runtime, clear_runtime, RESULT_COMPLETED)
 
 # IMPORTANTE: Ri-esportiamo funzioni dai nuovi moduli modulari
 # per mantenere la compatibilità con le importazioni esistenti
 from program_execution import execute_program, stop_program, reset_program_state
 from program_scheduling import check_programs, is_program_active_in_current_month, is_program_due_today
+from event_bus import publish, TOPIC_PROGRAMS
 
-# Percorsi dei file
-PROGRAM_FILE = '/data/program.json'
+# Percorsi dei file: un record per programma, chiamato con l'ID del programma
+PROGRAMS_DIR = '/data/programs'
+PROGRAM_FILE = '/data/program.json'  # Vecchio formato a file unico, letto solo per la migrazione
 
-# Cache per i programmi - ottimizza le operazioni di lettura/scrittura
-_programs_cache = None
-_programs_cache_valid = False
+# Snapshot corrente del catalogo (indice id -> programma), None se da rileggere dal disco
+_snapshot = None
 
-def _ensure_programs_file_exists():
+# Versione dell'ultimo snapshot: cresce a ogni modifica o rilettura, anche dopo un'invalidazione
+_programs_version = 0
+
+# Programmi compilati (id -> CompiledProgram), aggiornati solo al salvataggio
+_compiled_cache = None
+
+# Indice delle finestre di esecuzione per mese, usato dalla verifica dei conflitti.
+# Ricostruito quando cambiano i programmi o le impostazioni che ne determinano la durata.
+_conflict_index = None
+_conflict_index_key = None
+
+def _record_path(program_id):
+    """
+    Restituisce il percorso del record di un programma.
+    
+    Args:
+        program_id: ID del programma
+        
+    Returns:
+        str: Percorso del file
+    """
+    return PROGRAMS_DIR + '/' + str(program_id) + '.json'
+
+def _write_record(program_id, program):
+    """
+    Scrive il record di un singolo programma in modo atomico.
+    
+    Args:
+        program_id: ID del programma
+        program: Programma da salvare
+    """
+    path = _record_path(program_id)
+    temp_file = path + '.tmp'
+    with open(temp_file, 'w') as f:
+        ujson.dump(program, f)
+        f.flush()  # Flush esplicito per garantire la scrittura su disco
+    
+    # Rinomina il file temporaneo (operazione atomica su molti filesystem)
+    os.rename(temp_file, path)
+
+def _remove_record(program_id):
+    """
+    Elimina il record di un programma, se esiste.
+    
+    Args:
+        program_id: ID del programma
+    """
+    try:
+        os.remove(_record_path(program_id))
+    except OSError:
+        pass
+
+def _migrate_legacy_file():
     """
-    Assicura che il file dei programmi esista.
+    Converte il vecchio file unico program.json in un record per programma.
+    Il vecchio file viene rimosso solo dopo aver scritto tutti i record.
     """
     try:
-        # Verifica se il file esiste
+        with open(PROGRAM_FILE, 'r') as f:
+            programs = ujson.load(f)
+    except OSError:
+        return  # Nessun file da migrare
+    except ValueError:
+        log_event("File programmi non valido, migrazione saltata", "WARNING")
+        programs = {}
+    
+    if isinstance(programs, dict):
+        for prog_id, program in programs.items():
+            if isinstance(program, dict):
+                program['id'] = str(prog_id)
+                _write_record(prog_id, program)
+    
+    os.remove(PROGRAM_FILE)
+    log_eventf("INFO", "Migrati {} programmi nel formato a record singoli", len(programs))
+
+def _read_records():
+    """
+    Legge tutti i record dei programmi.
+    
+    Returns:
+        dict: Dizionario dei programmi
+    """
+    programs = {}
+    for name in os.listdir(PROGRAMS_DIR):
+        if not name.endswith('.json'):
+            continue  # File temporanei di una scrittura interrotta
+        prog_id = name[:-5]
         try:
-            with open(PROGRAM_FILE, 'r') as f:
-                return
-        except OSError:
-            # Il file non esiste, crealo
-            dirname = PROGRAM_FILE.rsplit('/', 1)[0] if '/' in PROGRAM_FILE else ''
-            if dirname:
-                ensure_directory_exists(dirname)
-            with open(PROGRAM_FILE, 'w') as f:
-                ujson.dump({}, f)
-            log_event("File programmi creato", "INFO")
-    except Exception as e:
-        log_event("Errore nella verifica/creazione del file programmi: " + str(e), "ERROR")
+            with open(PROGRAMS_DIR + '/' + name, 'r') as f:
+                program = ujson.load(f)
+        except (OSError, ValueError) as e:
+            log_eventf("ERROR", "Record programma {} non leggibile: {}", prog_id, e)
+            continue
+        
+        # Rimuovi programmi non validi
+        if not isinstance(program, dict):
+            continue
+        
+        # Assicura che l'ID sia salvato nel programma stesso
+        program['id'] = prog_id
+        programs[prog_id] = program
+    return programs
+
+class ProgramsSnapshot:
+    """
+    Catalogo dei programmi in sola lettura, con numero di versione.
+    Uno snapshot non cambia mai: ogni modifica salvata ne crea uno nuovo con
+    versione maggiore, per cui i lettori non devono copiarlo e la versione può
+    essere usata per la cache delle risposte. Anche i programmi contenuti non
+    vanno modificati: usare save_program o update_program_fields.
+    """
+    __slots__ = ('version', '_programs')
+    
+    def __init__(self, version, programs):
+        self.version = version
+        self._programs = programs
+    
+    def get(self, program_id, default=None):
+        """
+        Args:
+            program_id: ID del programma
+            default: Valore restituito se il programma non esiste
+            
+        Returns:
+            dict: Programma (da non modificare)
+        """
+        return self._programs.get(program_id, default)
+    
+    def __getitem__(self, program_id):
+        return self._programs[program_id]
+    
+    def __contains__(self, program_id):
+        return program_id in self._programs
+    
+    def __len__(self):
+        return len(self._programs)
+    
+    def __iter__(self):
+        return iter(self._programs)
+    
+    def keys(self):
+        return self._programs.keys()
+    
+    def values(self):
+        return self._programs.values()
+    
+    def items(self):
+        return self._programs.items()
+
+def _new_snapshot(programs):
+    """
+    Pubblica un nuovo snapshot del catalogo.
+    
+    Args:
+        programs: Dizionario dei programmi, da non modificare dopo la pubblicazione
+    """
+    global _snapshot, _programs_version
+    _programs_version += 1
+    _snapshot = ProgramsSnapshot(_programs_version, programs)
 
 def load_programs(force_reload=False):
     """
-    Carica i programmi dal file con supporto alla cache.
+    Restituisce lo snapshot corrente dei programmi, leggendo i record solo se necessario.
     
     Args:
-        force_reload: Se True, ricarica dal disco anche se la cache è valida
+        force_reload: Se True, ricarica dal disco anche se lo snapshot è valido
         
     Returns:
-        dict: Dizionario dei programmi
+        ProgramsSnapshot: Catalogo in sola lettura (vuoto in caso di errore)
     """
-    global _programs_cache, _programs_cache_valid
+    # Se non c'è uno snapshot valido o è richiesto un ricaricamento forzato, rileggi i record
+    if _snapshot is None or force_reload:
+        try:
+            ensure_directory_exists(PROGRAMS_DIR)
+            _migrate_legacy_file()
+            programs = _read_records()
+            # Le date di esecuzione delle versioni precedenti passano ai metadati di runtime
+            import_legacy_fields(programs)
+            _new_snapshot(programs)
+        except Exception as e:
+            log_eventf("ERROR", "Errore caricamento programmi: {}", e)
+            # In caso di errore, ritorna un catalogo vuoto
+            return ProgramsSnapshot(_programs_version, {})
     
-    # Se la cache è valida e non è richiesto un ricaricamento forzato, usa la cache
-    if _programs_cache_valid and not force_reload and _programs_cache is not None:
-        return _programs_cache.copy()  # Ritorna una copia per sicurezza
+    return _snapshot
+
+def get_program(program_id):
+    """
+    Restituisce un singolo programma dallo snapshot corrente.
     
-    try:
-        _ensure_programs_file_exists()
+    Args:
+        program_id: ID del programma
         
-        with open(PROGRAM_FILE, 'r') as f:
-            programs = ujson.load(f)
-            
-            # Validazione del formato
-            if not isinstance(programs, dict):
-                log_event("Formato file programmi non valido, inizializzazione nuovo file", "WARNING")
-                programs = {}
-                save_programs(programs)
-            
-            # Assicura che tutti gli ID siano stringhe e ogni programma abbia il suo ID
-            for prog_id in list(programs.keys()):
-                if not isinstance(programs[prog_id], dict):
-                    # Rimuovi programmi non validi
-                    del programs[prog_id]
-                    continue
-                    
-                # Assicura che l'ID sia salvato nel programma stesso
-                programs[prog_id]['id'] = str(prog_id)
-            
-            # Aggiorna la cache
-            _programs_cache = programs.copy()
-            _programs_cache_valid = True
-            
-            return programs
-    except OSError:
-        log_event("File program.json non trovato, creazione file vuoto", "WARNING")
-        empty_programs = {}
-        save_programs(empty_programs)
+    Returns:
+        dict or None: Programma (da non modificare), None se non esiste
+    """
+    return load_programs().get(str(program_id))
+
+def _apply_changes(changes):
+    """
+    Pubblica un nuovo snapshot con i record appena scritti o rimossi
+    e aggiorna la forma compilata dei soli programmi modificati.
+    
+    Args:
+        changes: Dizionario id -> programma salvato, None se rimosso
+    """
+    programs = dict(load_programs().items())
+    for program_id, program in changes.items():
+        if program is None:
+            programs.pop(program_id, None)
+        else:
+            programs[program_id] = program
+    
+    _new_snapshot(programs)
+    _replace_compiled(changes)
+    
+    # Lo scheduler ricalcola le prossime attivazioni
+    publish(TOPIC_PROGRAMS, 'changed', {'ids': list(changes)})
+
+def _replace_compiled(changes):
+    """
+    Aggiorna la forma compilata dei programmi indicati creando un nuovo dizionario:
+    chi ha già ottenuto quello precedente da get_compiled_programs non lo vede cambiare.
+    
+    Args:
+        changes: Dizionario id -> programma salvato, None se rimosso
+    """
+    global _compiled_cache
+    
+    if _compiled_cache is None:
+        return  # Verrà compilato tutto alla prossima richiesta
+    
+    compiled = dict(_compiled_cache)
+    for program_id, program in changes.items():
+        if program is None:
+            compiled.pop(program_id, None)
+        else:
+            compiled[program_id] = compile_program(program, get_last_run_day(program_id))
+    _compiled_cache = compiled
+
+def _definition(program, program_id):
+    """
+    Prepara la definizione da salvare, senza i campi dei metadati di esecuzione.
+    
+    Args:
+        program: Programma ricevuto
+        program_id: ID del programma
+        
+    Returns:
+        dict: Copia della definizione
+    """
+    program = dict(program, id=program_id)
+    for field in RUNTIME_FIELDS:
+        program.pop(field, None)
+    return program
+
+def save_program(program_id, program):
+    """
+    Salva un singolo programma, riscrivendo solo il suo record.
+    
+    Args:
+        program_id: ID del programma
+        program: Programma da salvare
         
-        # Aggiorna la cache
-        _programs_cache = empty_programs.copy()
-        _programs_cache_valid = True
+    Returns:
+        boolean: True se l'operazione è riuscita, False altrimenti
+    """
+    if not isinstance(program, dict):
+        log_event("Errore: tentativo di salvare un programma non valido", "ERROR")
+        return False
+    
+    program_id = str(program_id)
+    program = _definition(program, program_id)
+    
+    try:
+        # Assicura che i record esistenti siano caricati e la directory esista
+        load_programs()
+        _write_record(program_id, program)
+        _apply_changes({program_id: program})
+        return True
+    except Exception as e:
+        log_eventf("ERROR", "Errore salvataggio programma {}: {}", program_id, e)
+        # Rileggi i record alla prossima richiesta
+        invalidate_programs_cache()
+        return False
+
+def update_program_fields(program_id, fields):
+    """
+    Modifica alcuni campi di un programma esistente, creando una nuova versione.
+    
+    Args:
+        program_id: ID del programma
+        fields: Dizionario dei campi da aggiornare
+        
+    Returns:
+        boolean: True se l'operazione è riuscita, False se il programma non esiste o in caso di errore
+    """
+    program = get_program(program_id)
+    if program is None:
+        return False
+    
+    updated = dict(program)
+    updated.update(fields)
+    return save_program(program_id, updated)
+
+def remove_program_record(program_id):
+    """
+    Elimina il record di un singolo programma.
+    
+    Args:
+        program_id: ID del programma
         
-        return empty_programs
+    Returns:
+        boolean: True se l'operazione è riuscita, False altrimenti
+    """
+    program_id = str(program_id)
+    try:
+        load_programs()
+        os.remove(_record_path(program_id))
+        _apply_changes({program_id: None})
+        return True
     except Exception as e:
-        log_event(f"Errore caricamento programmi: {e}", "ERROR")
-        # In caso di errore, ritorna un dizionario vuoto
-        return {}
+        log_eventf("ERROR", "Errore eliminazione record programma {}: {}", program_id, e)
+        invalidate_programs_cache()
+        return False
 
 def save_programs(programs):
     """
-    Salva i programmi su file in modo atomico.
+    Salva l'intero insieme dei programmi.
+    Vengono riscritti solo i record modificati e rimossi quelli non più presenti.
     
     Args:
         programs: Dizionario dei programmi da salvare
@@ -108,92 +362,256 @@ def save_programs(programs):
     Returns:
         boolean: True se l'operazione è riuscita, False altrimenti
     """
-    global _programs_cache, _programs_cache_valid
-    
     if not isinstance(programs, dict):
         log_event("Errore: tentativo di salvare programmi non validi", "ERROR")
         return False
     
     try:
-        # Assicura che la directory esista
-        ensure_directory_exists(get_dirname(PROGRAM_FILE))
+        current = load_programs()
+        changes = {}
         
-        # Scrittura atomica tramite file temporaneo
-        temp_file = PROGRAM_FILE + '.tmp'
-        with open(temp_file, 'w') as f:
-            ujson.dump(programs, f)
-            f.flush()  # Flush esplicito per garantire la scrittura su disco
+        for prog_id, program in programs.items():
+            prog_id = str(prog_id)
+            if not isinstance(program, dict):
+                continue
+            program = _definition(program, prog_id)
+            if current.get(prog_id) != program:
+                _write_record(prog_id, program)
+                changes[prog_id] = program
         
-        # Rinomina il file temporaneo (operazione atomica su molti filesystem)
-        os.rename(temp_file, PROGRAM_FILE)
+        for prog_id in current:
+            if prog_id not in programs:
+                _remove_record(prog_id)
+                changes[prog_id] = None
         
-        # Aggiorna la cache
-        _programs_cache = programs.copy()
-        _programs_cache_valid = True
+        if changes:
+            _apply_changes(changes)
         
-        log_event("Programmi salvati con successo", "INFO")
+        log_eventf("INFO", "Programmi salvati con successo ({} record aggiornati)", len(changes))
         return True
     except Exception as e:
-        log_event(f"Errore salvataggio programmi: {e}", "ERROR")
-        # Invalida la cache in caso di errore
-        _programs_cache_valid = False
+        log_eventf("ERROR", "Errore salvataggio programmi: {}", e)
+        # Rileggi i record alla prossima richiesta
+        invalidate_programs_cache()
         return False
 
+def clear_programs():
+    """
+    Elimina tutti i programmi salvati.
+    
+    Returns:
+        boolean: True se l'operazione è riuscita, False altrimenti
+    """
+    return save_programs({}) and clear_runtime()
+
 def invalidate_programs_cache():
     """
-    Invalida la cache dei programmi, forzando una rilettura alla prossima richiesta.
+    Invalida lo snapshot dei programmi, forzando una rilettura alla prossima richiesta.
     """
-    global _programs_cache_valid
-    _programs_cache_valid = False
+    global _snapshot, _compiled_cache
+    _snapshot = None
+    _compiled_cache = None
+    publish(TOPIC_PROGRAMS, 'changed', {'ids': None})
 
-def check_program_conflicts(program, programs, exclude_id=None):
+def _compile_programs(programs):
     """
-    Verifica se ci sono conflitti tra programmi negli stessi mesi e con lo stesso orario.
+    Compila tutti i programmi validi.
+    
+    Args:
+        programs: Dizionario dei programmi
+        
+    Returns:
+        dict: Dizionario id -> CompiledProgram
+    """
+    compiled = {}
+    for prog_id, program in programs.items():
+        if isinstance(program, dict):
+            compiled[str(prog_id)] = compile_program(dict(program, id=str(prog_id)),
+                                                     get_last_run_day(prog_id))
+    return compiled
+
+def get_compiled_programs():
+    """
+    Restituisce i programmi in forma compilata.
+    La forma compilata viene calcolata al primo caricamento e poi aggiornata record per
+    record da save_program, remove_program_record e save_programs.
+    
+    Returns:
+        dict: Dizionario id -> CompiledProgram, in sola lettura: ogni modifica
+            ne crea uno nuovo
+    """
+    global _compiled_cache
+    
+    if _compiled_cache is None:
+        _compiled_cache = _compile_programs(load_programs())
+    return _compiled_cache
+
+def _run_settings():
+    """
+    Legge le impostazioni che determinano la durata di un'esecuzione.
+    
+    Returns:
+        tuple: (pausa tra le zone in secondi, zone attive contemporaneamente)
+    """
+    # Importazione locale per evitare dipendenze circolari
+    from settings_manager import load_user_settings
+    settings = load_user_settings()
+    try:
+        activation_delay = int(settings.get('activation_delay', 0))
+    except (ValueError, TypeError):
+        activation_delay = 0
+    try:
+        max_active = max(1, int(settings.get('max_active_zones', 1)))
+    except (ValueError, TypeError):
+        max_active = 1
+    return activation_delay, max_active
+
+def _program_windows(compiled, activation_delay, max_active):
+    """
+    Calcola le finestre di esecuzione giornaliere di un programma.
+    Un'esecuzione che supera la mezzanotte prosegue il giorno dopo, che può cadere
+    nel mese successivo: la parte dopo la mezzanotte vale anche per quel mese.
+    
+    Args:
+        compiled: Programma compilato
+        activation_delay: Pausa tra le zone in secondi
+        max_active: Zone attive contemporaneamente
+        
+    Returns:
+        list: Lista di (inizio, fine, maschera dei mesi) in secondi dalla mezzanotte
+    """
+    if not compiled.month_mask or compiled.start_minute is None:
+        return []
+    
+    start = compiled.start_minute * 60
+    # Anche un programma senza step occupa il proprio minuto di attivazione
+    end = start + max(60, compiled.run_duration(activation_delay, max_active))
+    windows = [(start, min(end, SECONDS_PER_DAY), compiled.month_mask)]
+    if end > SECONDS_PER_DAY:
+        mask = compiled.month_mask
+        next_months = ((mask << 1) | (mask >> 11)) & 0xFFF
+        windows.append((0, end - SECONDS_PER_DAY, mask | next_months))
+    return windows
+
+def _bisect_left(values, x):
+    """
+    Ricerca binaria della prima posizione con valore >= x in una lista ordinata.
+    
+    Args:
+        values: Lista ordinata
+        x: Valore da cercare
+        
+    Returns:
+        int: Indice di inserimento
+    """
+    lo, hi = 0, len(values)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if values[mid] < x:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+def _get_conflict_index():
+    """
+    Restituisce l'indice delle finestre di esecuzione, ricostruendolo se necessario.
+    Per ogni mese contiene le finestre ordinate per inizio e, per ogni prefisso, i due
+    indici con la fine più tarda appartenenti a programmi diversi: così la finestra che
+    si sovrappone a un intervallo si trova con una sola ricerca binaria, anche
+    escludendo il programma in modifica.
+    
+    Returns:
+        list: Per ogni mese una tupla (inizi, fini, id, migliori)
+    """
+    global _conflict_index, _conflict_index_key
+    
+    compiled = get_compiled_programs()
+    activation_delay, max_active = _run_settings()
+    key = (_programs_version, activation_delay, max_active)
+    if _conflict_index is not None and _conflict_index_key == key:
+        return _conflict_index
+    
+    entries = [[] for _ in range(12)]
+    for pid, program in compiled.items():
+        for start, end, mask in _program_windows(program, activation_delay, max_active):
+            for month in range(12):
+                if mask & (1 << month):
+                    entries[month].append((start, end, pid))
+    
+    index = []
+    for month_entries in entries:
+        month_entries.sort()
+        starts = [e[0] for e in month_entries]
+        ends = [e[1] for e in month_entries]
+        pids = [e[2] for e in month_entries]
+        best = []
+        first = second = None
+        for i in range(len(pids)):
+            if first is None or ends[i] > ends[first]:
+                if first is not None and pids[first] != pids[i]:
+                    second = first
+                first = i
+            elif pids[i] != pids[first] and (second is None or ends[i] > ends[second]):
+                second = i
+            best.append((first, second))
+        index.append((starts, ends, pids, best))
+    
+    _conflict_index = index
+    _conflict_index_key = key
+    return index
+
+def check_program_conflicts(program, exclude_id=None):
+    """
+    Verifica se l'esecuzione di un programma si sovrappone a quella di un altro
+    programma attivo negli stessi mesi, tenendo conto della durata degli step,
+    delle pause tra le zone e dei gruppi paralleli.
     
     Args:
         program: Programma da verificare
-        programs: Dizionario di tutti i programmi
         exclude_id: ID del programma da escludere dalla verifica (per l'aggiornamento)
         
     Returns:
         tuple: (has_conflict, conflict_message)
     """
-    # Validazione degli input
-    if not isinstance(program, dict) or not isinstance(programs, dict):
-        return False, ""
+    candidate = compile_program(program)
     
-    # Estrai i mesi e l'orario dal programma
-    program_months = set(program.get('months', []))
-    if not program_months:
+    # Senza mesi o senza orario non ci possono essere conflitti
+    if candidate is None or not candidate.month_mask or candidate.start_minute is None:
         return False, ""
     
-    program_time = program.get('activation_time', '')
-    if not program_time:
-        return False, ""  # Senza orario non ci possono essere conflitti
-    
     # Converti exclude_id a stringa se non è None
     if exclude_id is not None:
         exclude_id = str(exclude_id)
     
-    # Verifica i conflitti con altri programmi
-    for pid, existing_program in programs.items():
-        # Salta il programma stesso durante la modifica
-        if exclude_id and str(pid) == exclude_id:
-            continue
+    index = _get_conflict_index()
+    compiled = get_compiled_programs()
+    activation_delay, max_active = _run_settings()
+    
+    for start, end, mask in _program_windows(candidate, activation_delay, max_active):
+        for month in range(12):
+            if not mask & (1 << month):
+                continue
+            starts, ends, pids, best = index[month]
             
-        # Salta i programmi non validi
-        if not isinstance(existing_program, dict):
-            continue
+            # Le finestre che iniziano prima della fine del candidato sono le prime k
+            k = _bisect_left(starts, end)
+            if k == 0:
+                continue
             
-        # Estrai mesi e orario dal programma esistente
-        existing_months = set(existing_program.get('months', []))
-        existing_time = existing_program.get('activation_time', '')
-        
-        # Verifica se c'è sovrapposizione nei mesi E lo stesso orario di attivazione
-        if program_months.intersection(existing_months) and program_time == existing_time:
-            # C'è una sovrapposizione nei mesi e lo stesso orario
-            program_name = existing_program.get('name', f'Programma {pid}')
-            return True, f"Conflitto con '{program_name}' nei mesi e orario selezionati"
+            # Tra queste, quella che termina più tardi (escluso il programma stesso)
+            first, second = best[k - 1]
+            i = second if pids[first] == exclude_id else first
+            if i is None or ends[i] <= start:
+                continue
+            
+            existing = compiled.get(pids[i])
+            program_name = existing.name if existing and existing.name else f'Programma {pids[i]}'
+            overlap_start = max(start, starts[i])
+            overlap_end = min(end, ends[i])
+            return True, (f"Conflitto con '{program_name}' a {MONTH_NAMES[month]}: "
+                          f"esecuzioni sovrapposte dalle {format_time(overlap_start)[:5]} "
+                          f"alle {format_time(overlap_end)[:5]}")
     
     return False, ""
 
@@ -206,30 +624,27 @@ def update_program(program_id, updated_program):
         return False, "Formato programma non valido"
     
     program_id = str(program_id)  # Assicura che l'ID sia una stringa
-    programs = load_programs(force_reload=True)
     
     # Verifica conflitti
-    has_conflict, conflict_message = check_program_conflicts(updated_program, programs, exclude_id=program_id)
+    has_conflict, conflict_message = check_program_conflicts(updated_program, exclude_id=program_id)
     if has_conflict:
-        log_event(f"Conflitto programma: {conflict_message}", "WARNING")
+        log_eventf("WARNING", "Conflitto programma: {}", conflict_message)
         return False, conflict_message
     
-    if program_id in programs:
+    if get_program(program_id) is not None:
         # Se il programma è in esecuzione, fermalo prima di aggiornarlo
-        from program_state import load_program_state, program_running, current_program_id
+        from program_state import state
         # Importazione locale per evitare dipendenze circolari
         from program_execution import stop_program
         
-        load_program_state()  # Forza il caricamento dello stato più recente
-        if program_running and current_program_id == program_id:
+        if state.running and state.program_id == program_id:
             stop_program()
             
         # Assicurati che l'ID del programma sia preservato
         updated_program['id'] = program_id
-        programs[program_id] = updated_program
         
-        if save_programs(programs):
-            log_event(f"Programma {program_id} aggiornato con successo", "INFO")
+        if save_program(program_id, updated_program):
+            log_eventf("INFO", "Programma {} aggiornato con successo", program_id)
             return True, ""
         else:
             error_msg = f"Errore durante il salvataggio del programma {program_id}"
@@ -245,49 +660,50 @@ def delete_program(program_id):
     Elimina un programma.
     """
     program_id = str(program_id)  # Assicura che l'ID sia una stringa
-    programs = load_programs(force_reload=True)
     
-    if program_id in programs:
+    if get_program(program_id) is not None:
         # Se il programma è in esecuzione, fermalo prima di eliminarlo
-        from program_state import load_program_state, program_running, current_program_id
+        from program_state import state
         # Importazione locale per evitare dipendenze circolari
         from program_execution import stop_program
         
-        load_program_state()  # Forza il caricamento dello stato più recente
-        if program_running and current_program_id == program_id:
+        if state.running and state.program_id == program_id:
             stop_program()
             
-        # Rimuovi il programma
-        del programs[program_id]
-        
-        if save_programs(programs):
-            log_event(f"Programma {program_id} eliminato con successo", "INFO")
+        # Rimuovi il programma e i suoi metadati di esecuzione
+        if remove_program_record(program_id) and remove_runtime(program_id):
+            log_eventf("INFO", "Programma {} eliminato con successo", program_id)
             return True
         else:
-            log_event(f"Errore durante l'eliminazione del programma {program_id}", "ERROR")
+            log_eventf("ERROR", "Errore durante l'eliminazione del programma {}", program_id)
             return False
     else:
-        log_event(f"Errore: programma con ID {program_id} non trovato", "ERROR")
+        log_eventf("ERROR", "Errore: programma con ID {} non trovato", program_id)
         return False
 
-def update_last_run_date(program_id):
+def record_program_run(program_id, start_day, result, duration):
     """
-    Aggiorna la data dell'ultima esecuzione del programma.
+    Registra la fine di un'esecuzione nei metadati di runtime.
+    La definizione del programma non viene riscritta.
     
     Args:
         program_id: ID del programma
+        start_day: Giorno epoch di avvio
+        result: Esito dell'esecuzione (vedi program_runtime)
+        duration: Durata in secondi
     """
     program_id = str(program_id)  # Assicura che l'ID sia una stringa
-    current_date = get_current_date()
     
     try:
-        programs = load_programs(force_reload=True)
+        record_run(program_id, start_day, result, duration)
         
-        if program_id in programs:
-            programs[program_id]['last_run_date'] = current_date
-            save_programs(programs)
-            log_event(f"Data ultima esecuzione aggiornata: programma {program_id}, data {current_date}", "INFO")
-        else:
-            log_event(f"Impossibile aggiornare data: programma {program_id} non trovato", "WARNING")
+        # Aggiorna la data usata dallo scheduler per la cadenza
+        if result == RESULT_COMPLETED:
+            # Nuova forma compilata: quella precedente resta invariata per chi la sta leggendo
+            program = get_program(program_id)
+            if program is not None:
+                _replace_compiled({program_id: program})
+            publish(TOPIC_PROGRAMS, 'run_recorded', {'program_id': program_id, 'result': result})
+            log_eventf("INFO", "Data ultima esecuzione aggiornata: programma {}, data {}", program_id, format_date(start_day))
     except Exception as e:
-        log_event(f"Errore nell'aggiornamento della data di esecuzione: {e}", "ERROR")
\ No newline at end of file
+        log_eventf("ERROR", "Errore nell'aggiornamento dei metadati di esecuzione: {}", e)
@@ -0,0 +1,230 @@
+"""
+Modulo per la rappresentazione compilata dei programmi di irrigazione.
+Ogni programma salvato viene tradotto una sola volta in un oggetto compatto con
+mesi come maschera di bit, orario come minuto del giorno e cadenza in giorni,
+così scheduler, verifica dei conflitti e API non analizzano più le stringhe.
+"""
+
+# Mappa dei nomi dei mesi italiani ai numeri di mese
+MONTHS_MAP = {
+    "Gennaio": 1, "Febbraio": 2, "Marzo": 3, "Aprile": 4,
+    "Maggio": 5, "Giugno": 6, "Luglio": 7, "Agosto": 8,
+    "Settembre": 9, "Ottobre": 10, "Novembre": 11, "Dicembre": 12
+}
+
+# Nomi dei mesi per numero (indice 0 = gennaio)
+MONTH_NAMES = ("Gennaio", "Febbraio", "Marzo", "Aprile", "Maggio", "Giugno", "Luglio",
+               "Agosto", "Settembre", "Ottobre", "Novembre", "Dicembre")
+
+class CompiledProgram:
+    """
+    Forma compilata e in sola lettura di un programma.
+    Il bit (mese - 1) di month_mask indica un mese attivo.
+    """
+    __slots__ = ('id', 'name', 'month_mask', 'start_minute', 'interval_days',
+                 'last_run_day', 'automatic', 'total_duration', 'steps', 'parallel')
+    
+    def __init__(self, program_id, name, month_mask, start_minute, interval_days,
+                 last_run_day, automatic, steps, parallel):
+        self.id = program_id
+        self.name = name
+        self.month_mask = month_mask          # 12 bit, gennaio = bit 0
+        self.start_minute = start_minute      # 0-1439, None se l'orario non è valido
+        self.interval_days = interval_days    # None se la cadenza non è riconosciuta
+        self.last_run_day = last_run_day      # Giorno epoch, None se mai eseguito
+        self.automatic = automatic
+        self.steps = steps                    # Tupla di (zone_id, durata in minuti)
+        self.parallel = parallel
+        self.total_duration = sum(d for _, d in steps) * 60  # Somma delle durate in secondi
+    
+    def is_active_in_month(self, month):
+        """
+        Args:
+            month: Mese (1-12)
+        
+        Returns:
+            boolean: True se il programma è attivo nel mese
+        """
+        return bool(self.month_mask & (1 << (month - 1)))
+    
+    def run_duration(self, activation_delay, max_active):
+        """
+        Calcola la durata di un'esecuzione completa, come la svolge program_execution.
+        
+        Args:
+            activation_delay: Pausa in secondi tra zone successive (modalità sequenziale)
+            max_active: Numero massimo di zone aperte insieme (modalità parallela)
+            
+        Returns:
+            int: Durata in secondi
+        """
+        if not self.parallel:
+            return self.total_duration + max(0, activation_delay) * max(0, len(self.steps) - 1)
+        
+        # Gruppi paralleli: simula l'assegnazione dei posti liberi agli step in attesa
+        pending = list(self.steps)
+        running = []  # (fine in secondi, zone_id)
+        elapsed = 0
+        while pending:
+            k = 0
+            while k < len(pending) and len(running) < max_active:
+                zone_id, minutes = pending[k]
+                if any(z == zone_id for _, z in running):
+                    k += 1  # Stessa zona già aperta: resta in coda
+                    continue
+                del pending[k]
+                running.append((elapsed + minutes * 60, zone_id))
+            elapsed = min(end for end, _ in running)
+            running = [r for r in running if r[0] > elapsed]
+        return max([elapsed] + [end for end, _ in running])
+    
+    def is_schedulable(self):
+        """
+        Returns:
+            boolean: True se il programma può essere avviato automaticamente
+        """
+        return (self.automatic and self.month_mask != 0 and
+                self.start_minute is not None and self.interval_days is not None)
+
+def months_to_mask(months):
+    """
+    Converte una lista di nomi di mesi nella maschera di bit corrispondente.
+    
+    Args:
+        months: Lista di nomi dei mesi in italiano
+    
+    Returns:
+        int: Maschera a 12 bit, 0 se nessun mese è valido
+    """
+    mask = 0
+    if isinstance(months, list):
+        for month in months:
+            number = MONTHS_MAP.get(month, 0)
+            if number:
+                mask |= 1 << (number - 1)
+    return mask
+
+def parse_activation_minute(activation_time):
+    """
+    Converte un orario HH:MM nel minuto del giorno.
+    
+    Args:
+        activation_time: Orario di attivazione
+    
+    Returns:
+        int or None: Minuti dalla mezzanotte, None se l'orario non è valido
+    """
+    if not isinstance(activation_time, str):
+        return None
+    parts = activation_time.split(':')
+    if len(parts) != 2:
+        return None
+    try:
+        hour = int(parts[0])
+        minute = int(parts[1])
+    except ValueError:
+        return None
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        return None
+    return hour * 60 + minute
+
+def recurrence_interval(program):
+    """
+    Restituisce l'intervallo in giorni tra due esecuzioni in base alla cadenza.
+    
+    Args:
+        program: Programma nel formato salvato
+    
+    Returns:
+        int or None: Giorni tra due esecuzioni, None se la cadenza non è riconosciuta
+    """
+    recurrence = program.get('recurrence', 'giornaliero')
+    
+    if recurrence == 'giornaliero':
+        # Il programma è previsto ogni giorno, ma non più volte al giorno
+        return 1
+    
+    elif recurrence == 'giorni_alterni':
+        # Il programma è previsto ogni 2 giorni
+        return 2
+    
+    elif recurrence == 'personalizzata':
+        # Il programma è previsto ogni intervallo_giorni
+        try:
+            interval_days = int(program.get('interval_days', 1))
+        except (ValueError, TypeError):
+            return None
+        # Assicura che l'intervallo sia almeno 1
+        return interval_days if interval_days > 0 else 1
+    
+    return None
+
+def legacy_last_run_day(program):
+    """
+    Restituisce il giorno dell'ultima esecuzione salvato nella definizione di un
+    programma dalle versioni precedenti (campi 'last_run_day' o 'last_run_date').
+    
+    Args:
+        program: Programma nel formato salvato
+    
+    Returns:
+        int or None: Giorno epoch, None se mai eseguito o se la data non è valida
+    """
+    last_run_day = program.get('last_run_day')
+    if isinstance(last_run_day, int):
+        return last_run_day
+    
+    last_run_date = program.get('last_run_date')
+    if last_run_date:
+        # Importazione locale: serve solo per i programmi nel vecchio formato
+        from time_utils import parse_date
+        return parse_date(last_run_date)
+    
+    return None
+
+def _compile_steps(steps):
+    """
+    Estrae gli step validi.
+    
+    Args:
+        steps: Lista degli step nel formato {'zone_id', 'duration'}
+        
+    Returns:
+        tuple: Tupla di (zone_id, durata in minuti)
+    """
+    compiled = []
+    if isinstance(steps, list):
+        for step in steps:
+            if not isinstance(step, dict) or step.get('zone_id') is None:
+                continue
+            try:
+                compiled.append((int(step['zone_id']), int(step.get('duration', 1))))
+            except (ValueError, TypeError):
+                continue
+    return tuple(compiled)
+
+def compile_program(program, last_run_day=None):
+    """
+    Compila un programma nel formato salvato.
+    
+    Args:
+        program: Programma nel formato salvato
+        last_run_day: Giorno epoch dell'ultima esecuzione, dai metadati di esecuzione
+    
+    Returns:
+        CompiledProgram or None: Programma compilato, None se il formato non è valido
+    """
+    if not isinstance(program, dict):
+        return None
+    
+    return CompiledProgram(
+        str(program.get('id', '')),
+        program.get('name', ''),
+        months_to_mask(program.get('months')),
+        parse_activation_minute(program.get('activation_time')),
+        recurrence_interval(program),
+        last_run_day,
+        bool(program.get('automatic_enabled', True)),
+        _compile_steps(program.get('steps')),
+        bool(program.get('parallel_groups'))
+    )
@@ -0,0 +1,175 @@
+"""
+Modulo per i metadati di esecuzione dei programmi.
+Ultima esecuzione, esito, numero di esecuzioni e durata sono salvati in un piccolo file
+separato, indicizzato per ID programma: dopo ogni esecuzione viene riscritto solo questo
+file, mentre le definizioni dei programmi cambiano solo quando l'utente le modifica.
+"""
+import ujson
+import uos as os
+from log_manager import log_event, log_eventf
+from utils import ensure_directory_exists, get_dirname
+
+PROGRAM_RUNTIME_FILE = '/data/program_runtime.json'
+
+# Campi di runtime: non fanno parte della definizione di un programma
+RUNTIME_FIELDS = ('last_run_day', 'last_run_date', 'last_result', 'run_count', 'last_duration')
+
+# Esiti di un'esecuzione
+RESULT_COMPLETED = 'completato'
+RESULT_STOPPED = 'interrotto'
+RESULT_ERROR = 'errore'
+
+_runtime = None  # id programma -> {'last_run_day', 'last_result', 'run_count', 'last_duration'}
+_version = 0  # Incrementato a ogni modifica dei metadati
+
+def _load():
+    """
+    Carica i metadati dal file, una sola volta.
+    
+    Returns:
+        dict: Metadati per ID programma
+    """
+    global _runtime
+    
+    if _runtime is None:
+        try:
+            with open(PROGRAM_RUNTIME_FILE, 'r') as f:
+                _runtime = ujson.load(f)
+            if not isinstance(_runtime, dict):
+                _runtime = {}
+        except OSError:
+            _runtime = {}
+        except ValueError:
+            log_event("File metadati di esecuzione non valido, reinizializzato", "WARNING")
+            _runtime = {}
+    return _runtime
+
+def _save():
+    """
+    Salva i metadati su file in modo atomico.
+    Va chiamata dopo ogni modifica: incrementa anche la versione.
+    
+    Returns:
+        boolean: True se il salvataggio è riuscito
+    """
+    global _version
+    
+    _version += 1
+    try:
+        ensure_directory_exists(get_dirname(PROGRAM_RUNTIME_FILE))
+        temp_file = PROGRAM_RUNTIME_FILE + '.tmp'
+        with open(temp_file, 'w') as f:
+            ujson.dump(_load(), f)
+            f.flush()
+        os.rename(temp_file, PROGRAM_RUNTIME_FILE)
+        return True
+    except Exception as e:
+        log_eventf("ERROR", "Errore salvataggio metadati di esecuzione: {}", e)
+        return False
+
+def get_runtime_version():
+    """
+    Returns:
+        int: Versione corrente dei metadati, per l'ETag delle API
+    """
+    return _version
+
+def get_runtime(program_id):
+    """
+    Restituisce i metadati di esecuzione di un programma.
+    
+    Args:
+        program_id: ID del programma
+    
+    Returns:
+        dict: Metadati (vuoto se il programma non è mai stato eseguito), da non modificare
+    """
+    return _load().get(str(program_id), {})
+
+def get_last_run_day(program_id):
+    """
+    Restituisce il giorno di avvio dell'ultima esecuzione completata.
+    
+    Args:
+        program_id: ID del programma
+    
+    Returns:
+        int or None: Giorno epoch, None se mai eseguito
+    """
+    return get_runtime(program_id).get('last_run_day')
+
+def import_legacy_fields(programs):
+    """
+    Importa la data di ultima esecuzione ancora salvata nelle definizioni
+    (campi 'last_run_day' o 'last_run_date') per i programmi senza metadati.
+    
+    Args:
+        programs: Dizionario dei programmi
+    """
+    # Importazione locale: serve solo per i programmi nel vecchio formato
+    from program_model import legacy_last_run_day
+    
+    runtime = _load()
+    imported = 0
+    for prog_id, program in programs.items():
+        if prog_id in runtime:
+            continue
+        last_run_day = legacy_last_run_day(program)
+        if last_run_day is not None:
+            runtime[prog_id] = {'last_run_day': last_run_day, 'run_count': 0}
+            imported += 1
+    
+    if imported:
+        _save()
+        log_eventf("INFO", "Importate {} date di esecuzione dalle definizioni", imported)
+
+def record_run(program_id, start_day, result, duration):
+    """
+    Registra la fine di un'esecuzione.
+    Il giorno di ultima esecuzione, usato per la cadenza, cambia solo se
+    l'esecuzione è stata completata, ed è il giorno in cui è iniziata.
+    
+    Args:
+        program_id: ID del programma
+        start_day: Giorno epoch di avvio
+        result: Esito (RESULT_COMPLETED, RESULT_STOPPED o RESULT_ERROR)
+        duration: Durata in secondi
+    
+    Returns:
+        boolean: True se il salvataggio è riuscito
+    """
+    runtime = _load()
+    entry = runtime.get(str(program_id))
+    if entry is None:
+        entry = runtime[str(program_id)] = {'run_count': 0}
+    
+    if result == RESULT_COMPLETED:
+        entry['last_run_day'] = start_day
+    entry['last_result'] = result
+    entry['run_count'] = entry.get('run_count', 0) + 1
+    entry['last_duration'] = duration
+    return _save()
+
+def remove_runtime(program_id):
+    """
+    Elimina i metadati di un programma.
+    
+    Args:
+        program_id: ID del programma
+    
+    Returns:
+        boolean: True se l'operazione è riuscita
+    """
+    if _load().pop(str(program_id), None) is None:
+        return True
+    return _save()
+
+def clear_runtime():
+    """
+    Elimina i metadati di tutti i programmi.
+    
+    Returns:
+        boolean: True se l'operazione è riuscita
+    """
+    _load().clear()
+    return _save()
@@ -1,220 +1,308 @@
 """
 Modulo per la gestione della pianificazione e verifica dei programmi di irrigazione.
+Il prossimo istante di attivazione di ogni programma automatico viene calcolato una sola
+volta e mantenuto in un min-heap; il ciclo di controllo dorme fino alla scadenza più vicina
+e la coda viene ricostruita solo quando cambiano i programmi o le impostazioni.
 """
-import time
+import heapq
 import uasyncio as asyncio
-from log_manager import log_event
-from program_state import load_program_state, program_running
+from log_manager import log_event, log_eventf
+from program_state import state
 from zone_manager import get_active_zones_count, stop_all_zones
-from utils import day_of_year, is_leap_year
+from time_utils import now, today, month_of_day, day_start, SECONDS_PER_DAY
+from program_model import compile_program, legacy_last_run_day
+from program_runtime import get_last_run_day as get_runtime_last_run_day
 from settings_manager import load_user_settings
+from event_bus import subscribe, TOPIC_SETTINGS, TOPIC_PROGRAMS
+
+# Ritardo massimo con cui un'attivazione scaduta viene ancora eseguita
+# (es. ciclo eventi occupato o riavvio subito dopo l'orario previsto)
+LATE_TOLERANCE = 300
+
+# Intervallo massimo di attesa, per riallineare la coda a eventuali correzioni dell'orologio
+MAX_SCHEDULER_SLEEP = 3600
+
+# Coda delle prossime attivazioni: min-heap di (istante, id programma)
+_schedule = []
+_schedule_valid = False
+_schedule_event = asyncio.Event()
+
+def _compile(program):
+    """
+    Compila un programma nel formato salvato con la sua data di ultima esecuzione.
+    
+    Args:
+        program: Programma da compilare
+        
+    Returns:
+        CompiledProgram or None: Programma compilato
+    """
+    if not isinstance(program, dict):
+        return None
+    return compile_program(program, get_last_run_day(program))
 
 def is_program_active_in_current_month(program):
     """
     Controlla se il programma è attivo nel mese corrente.
     
     Args:
-        program: Programma da verificare
+        program: Programma da verificare (dizionario o CompiledProgram)
         
     Returns:
         boolean: True se il programma è attivo nel mese corrente, False altrimenti
     """
-    if not isinstance(program, dict):
+    if isinstance(program, dict):
+        program = _compile(program)
+    if program is None:
         return False
-        
-    program_months = program.get('months', [])
-    if not program_months:
-        return False
-        
-    current_month = time.localtime()[1]
     
-    # Mappa dei nomi dei mesi italiani ai numeri di mese
-    months_map = {
-        "Gennaio": 1, "Febbraio": 2, "Marzo": 3, "Aprile": 4,
-        "Maggio": 5, "Giugno": 6, "Luglio": 7, "Agosto": 8,
-        "Settembre": 9, "Ottobre": 10, "Novembre": 11, "Dicembre": 12
-    }
+    return program.is_active_in_month(month_of_day(today()))
+
+def get_last_run_day(program):
+    """
+    Restituisce il giorno dell'ultima esecuzione di un programma.
+    Usa i metadati di esecuzione e, in loro assenza, i vecchi campi della definizione.
     
-    # Converti i nomi dei mesi in numeri
-    program_month_numbers = [months_map.get(month, 0) for month in program_months]
+    Args:
+        program: Programma da verificare (dizionario o CompiledProgram)
+        
+    Returns:
+        int or None: Giorno epoch dell'ultima esecuzione, None se mai eseguito
+    """
+    if not isinstance(program, dict):
+        return program.last_run_day if program is not None else None
     
-    return current_month in program_month_numbers
+    last_run_day = get_runtime_last_run_day(program.get('id'))
+    if last_run_day is None:
+        last_run_day = legacy_last_run_day(program)
+    return last_run_day
 
 def is_program_due_today(program):
     """
     Verifica se il programma è previsto per oggi in base alla cadenza.
     
     Args:
-        program: Programma da verificare
+        program: Programma da verificare (dizionario o CompiledProgram)
         
     Returns:
         boolean: True se il programma è previsto per oggi, False altrimenti
     """
-    if not isinstance(program, dict):
+    if isinstance(program, dict):
+        program = _compile(program)
+    if program is None:
         return False
         
-    # Ottieni la data corrente
-    current_time = time.localtime()
-    current_year = current_time[0]
-    current_month = current_time[1]
-    current_day = current_time[2]
-    
-    # Calcola il giorno dell'anno corrente
-    current_day_of_year = day_of_year(current_year, current_month, current_day)
-    
-    # Default: non eseguito mai (-1) o giorno diverso
-    last_run_day = -1
-    last_run_year = -1  # Aggiungiamo l'anno per gestire cambio anno
-
-    # Estrai la data dell'ultima esecuzione
-    if 'last_run_date' in program:
-        try:
-            last_run_date = program['last_run_date']
-            date_parts = last_run_date.split('-')
-            if len(date_parts) == 3:
-                year, month, day = int(date_parts[0]), int(date_parts[1]), int(date_parts[2])
-                last_run_day = day_of_year(year, month, day)
-                last_run_year = year
-            else:
-                log_event(f"Formato data non valido: {last_run_date}", "ERROR")
-        except Exception as e:
-            log_event(f"Errore nella conversione della data di esecuzione: {e}", "ERROR")
+    # Giorno corrente e giorno dell'ultima esecuzione come interi (giorni epoch)
+    current_day = today()
+    last_run_day = program.last_run_day
 
     # Log per debug
-    program_name = program.get('name', 'Senza nome')
-    log_event(f"Verifica esecuzione per '{program_name}': ultima esecuzione {last_run_year}-{last_run_day}, oggi {current_year}-{current_day_of_year}", "DEBUG")
+    log_eventf("DEBUG", "Verifica esecuzione per '{}': ultima esecuzione {}, oggi {}",
+               program.name, last_run_day, current_day)
 
     # Se non è mai stato eseguito, eseguilo oggi
-    if last_run_day == -1:
+    if last_run_day is None:
         return True
 
-    # Determina la cadenza del programma
-    recurrence = program.get('recurrence', 'giornaliero')
-    
-    # Gestisci il cambio di anno
-    days_since_last_run = 0
-    if last_run_year == current_year:
-        days_since_last_run = current_day_of_year - last_run_day
-    else:
-        # Se l'anno è diverso, calcola i giorni rimanenti nell'anno precedente
-        # + i giorni trascorsi nell'anno corrente
-        days_in_last_year = 366 if is_leap_year(last_run_year) else 365
-        days_since_last_run = (days_in_last_year - last_run_day) + current_day_of_year
-    
-    log_event(f"Giorni dall'ultima esecuzione di '{program_name}': {days_since_last_run}", "DEBUG")
-    
-    # Verifica basata sulla cadenza
-    if recurrence == 'giornaliero':
-        # Il programma è previsto ogni giorno, ma non più volte al giorno
-        return days_since_last_run >= 1
-    
-    elif recurrence == 'giorni_alterni':
-        # Il programma è previsto ogni 2 giorni
-        return days_since_last_run >= 2
+    # Per valori di recurrence sconosciuti, non eseguire
+    if program.interval_days is None:
+        return False
+
+    # Differenza tra giorni epoch: nessun caso speciale al cambio d'anno
+    return current_day - last_run_day >= program.interval_days
+
+def next_activation(program, not_before):
+    """
+    Calcola il primo istante di attivazione di un programma non precedente a not_before,
+    tenendo conto di orario, mesi attivi, cadenza e ultima esecuzione.
+    
+    Args:
+        program: Programma compilato (CompiledProgram)
+        not_before: Istante minimo (secondi dall'epoch Unix)
         
-    elif recurrence == 'personalizzata':
-        # Il programma è previsto ogni intervallo_giorni
-        interval_days = program.get('interval_days', 1)
-        # Assicura che l'intervallo sia almeno 1
-        if interval_days <= 0:
-            interval_days = 1
-        return days_since_last_run >= interval_days
+    Returns:
+        int or None: Istante di attivazione, None se il programma non è pianificabile
+    """
+    if program is None or not program.is_schedulable():
+        return None
     
-    # Per valori di recurrence sconosciuti, non eseguire
-    return False
+    offset = program.start_minute * 60
     
-async def check_programs():
+    # Primo giorno utile: quello di not_before, o il successivo se l'orario è già passato
+    day = (not_before - offset + SECONDS_PER_DAY - 1) // SECONDS_PER_DAY
+    
+    # Rispetta la cadenza rispetto all'ultima esecuzione
+    last_run_day = program.last_run_day
+    if last_run_day is not None and day < last_run_day + program.interval_days:
+        day = last_run_day + program.interval_days
+    
+    # Al più un anno di ricerca per trovare un mese attivo
+    for _ in range(366):
+        if program.is_active_in_month(month_of_day(day)):
+            return day_start(day) + offset
+        day += 1
+    
+    return None
+
+def invalidate_schedule():
+    """
+    Segnala che programmi o impostazioni sono cambiati: la coda delle attivazioni
+    verrà ricostruita e il ciclo di controllo risvegliato.
+    """
+    global _schedule_valid
+    _schedule_valid = False
+    _schedule_event.set()
+
+def _on_change(topic, event, data):
     """
-    Verifica se ci sono programmi da eseguire con gestione degli errori migliorata.
+    Callback di event_bus per i cambi di programmi e impostazioni.
+    """
+    invalidate_schedule()
+
+subscribe(TOPIC_SETTINGS, _on_change)
+subscribe(TOPIC_PROGRAMS, _on_change)
+
+def _rebuild_schedule(not_before=None):
+    """
+    Ricostruisce la coda delle attivazioni dai programmi salvati.
+    
+    Args:
+        not_before: Istante minimo delle attivazioni, None per includere quelle
+            scadute da non più di LATE_TOLERANCE secondi
+    
+    Returns:
+        boolean: False se i programmi automatici sono disattivati
+    """
+    global _schedule, _schedule_valid
+    _schedule_valid = True
+    _schedule = []
+    
+    settings = load_user_settings()
+    if not settings.get('automatic_programs_enabled', False):
+        log_event("Programmi automatici disattivati, nessuna attivazione pianificata", "DEBUG")
+        return False
+    
+    # Importazione locale per evitare dipendenze circolari
+    from program_manager import get_compiled_programs
+    programs = get_compiled_programs()
+    if not programs:
+        return True
+    
+    # Le attivazioni scadute da poco restano valide
+    if not_before is None:
+        not_before = now() - LATE_TOLERANCE
+    for pid, compiled in programs.items():
+        fire_ts = next_activation(compiled, not_before)
+        if fire_ts is not None:
+            _schedule.append((fire_ts, pid))
+    heapq.heapify(_schedule)
+    
+    if _schedule:
+        log_eventf("DEBUG", "Coda attivazioni ricostruita: {} programmi, prossimo tra {}s",
+                   len(_schedule), _schedule[0][0] - now())
+    return True
+
+def get_next_activation():
+    """
+    Restituisce la prossima attivazione pianificata.
+    
+    Returns:
+        tuple or None: (istante, id programma), None se non ci sono attivazioni
+    """
+    if not _schedule_valid:
+        _rebuild_schedule()
+    return _schedule[0] if _schedule else None
+
+async def wait_next_activation():
+    """
+    Attende fino alla prossima attivazione pianificata, o fino a quando
+    la coda viene invalidata da una modifica a programmi o impostazioni.
+    """
+    if not _schedule_valid:
+        _rebuild_schedule()
+    
+    delay = MAX_SCHEDULER_SLEEP
+    if _schedule:
+        delay = min(max(_schedule[0][0] - now(), 0), MAX_SCHEDULER_SLEEP)
+    
+    if delay > 0:
+        try:
+            await asyncio.wait_for(_schedule_event.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+    _schedule_event.clear()
+
+async def _run_scheduled(prog):
+    """
+    Avvia un programma pianificato, fermando prima eventuali zone manuali.
+    
+    Args:
+        prog: Programma da eseguire
     """
     try:
-        # Verifica impostazioni
-        settings = load_user_settings()
-        enabled = settings.get('automatic_programs_enabled', False)
-        
-        # Log breve
-        log_event("Controllo programmi - Attivi: " + str(enabled), "DEBUG")
+        # Ferma zone attive
+        count = get_active_zones_count()
+        if count > 0:
+            stop_all_zones()
+            await asyncio.sleep(1)
         
-        if not enabled:
-            return
+        # Avvia programma
+        from program_execution import execute_program
+        await execute_program(prog)
+    except Exception as e:
+        log_event("Errore esecuzione: " + str(e), "ERROR")
+
+async def check_programs():
+    """
+    Esegue i programmi la cui attivazione pianificata è scaduta.
+    Le attivazioni in ritardo di al più LATE_TOLERANCE secondi (es. ciclo eventi occupato)
+    vengono eseguite; quelle più vecchie, ad esempio scadute durante un'altra esecuzione,
+    vengono saltate e registrate nel log.
+    """
+    try:
+        if not _schedule_valid:
+            _rebuild_schedule()
         
-        # Verifica stato
-        load_program_state()
-        if program_running:
-            return
+        while _schedule and _schedule[0][0] <= now():
+            fire_ts, pid = heapq.heappop(_schedule)
             
-        # Carica programmi
-        from program_manager import load_programs
-        programs = load_programs()
-        if not programs:
-            return
-        
-        # Ora corrente
-        t = time.localtime()
-        hour = t[3]
-        minute = t[4]
-        
-        # Controlla programmi
-        for pid in programs:
-            prog = programs[pid]
-            if not isinstance(prog, dict):
-                continue
-                
-            # Verifica automatico
-            auto = prog.get('automatic_enabled', True)
-            if not auto:
-                continue
-                
-            # Verifica orario
-            act_time = prog.get('activation_time', '')
-            if not act_time:
+            # Importazione locale per evitare dipendenze circolari
+            from program_manager import get_program, get_compiled_programs
+            compiled = get_compiled_programs().get(pid)
+            if compiled is None:
                 continue
             
-            # Analizza orario
-            parts = act_time.split(':')
-            if len(parts) != 2:
-                continue
-                
-            try:
-                act_hour = int(parts[0])
-                act_minute = int(parts[1])
-                
-                # Verifica corrispondenza con tolleranza di 1 minuto
-                match = False
-                if hour == act_hour and minute == act_minute:
-                    match = True
-                elif hour == act_hour and minute == act_minute - 1:
-                    match = True
-                elif act_minute == 0 and minute == 59 and hour == act_hour - 1:
-                    match = True
+            late = now() - fire_ts
+            if late > LATE_TOLERANCE:
+                log_eventf("WARNING", "Programma '{}' saltato: attivazione scaduta da {}s",
+                           compiled.name, late)
+            elif state.running:
+                # Un altro programma è in esecuzione: l'attivazione viene saltata
+                log_eventf("WARNING", "Programma '{}' saltato: altro programma in esecuzione",
+                           compiled.name)
+            else:
+                log_eventf("INFO", "Attivazione programma '{}' (ritardo {}s)",
+                           compiled.name, late)
+                prog = get_program(pid)
+                if isinstance(prog, dict):
+                    await _run_scheduled(prog)
                 
-                # Verifica esecuzione oggi
-                if match:
-                    active = is_program_active_in_current_month(prog)
-                    due = is_program_due_today(prog)
-                    
-                    if active and due:
-                        # Ricarica stato per sicurezza
-                        load_program_state()
-                        if program_running:
-                            continue
-                        
-                        # Esegui programma
-                        try:
-                            # Ferma zone attive
-                            count = get_active_zones_count()
-                            if count > 0:
-                                stop_all_zones()
-                                await asyncio.sleep(1)
-                            
-                            # Avvia programma
-                            from program_execution import execute_program
-                            await execute_program(prog)
-                        except Exception as e:
-                            log_event("Errore esecuzione: " + str(e), "ERROR")
-            except (ValueError, TypeError) as e:
-                log_event(f"Errore parsing orario per programma {pid}: {e}", "ERROR")
-                continue
+                # Il salvataggio della data di esecuzione (o una modifica durante l'esecuzione)
+                # invalida la coda: viene ricostruita a partire da questa attivazione, così
+                # quelle scadute nel frattempo vengono segnalate come saltate
+                if not _schedule_valid:
+                    if not _rebuild_schedule(fire_ts):
+                        continue
+                    _schedule[:] = [entry for entry in _schedule if entry[1] != pid]
+                    heapq.heapify(_schedule)
+                    compiled = get_compiled_programs().get(pid)
+                    if compiled is None:
+                        continue
+            
+            # Ripianifica l'attivazione successiva del programma, anche se interrotto o fallito
+            fire_ts = next_activation(compiled, fire_ts + 1)
+            if fire_ts is not None:
+                heapq.heappush(_schedule, (fire_ts, pid))
                 
     except Exception as e:
-        log_event("Errore check_programs: " + str(e), "ERROR")
\ No newline at end of file
+        log_event("Errore check_programs: " + str(e), "ERROR")
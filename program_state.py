@@ -1,176 +1,268 @@
 """
 Modulo per la gestione dello stato del programma.
-Contiene variabili globali e funzioni per gestire lo stato di esecuzione dei programmi.
+Lo stato di esecuzione è mantenuto in memoria nell'oggetto condiviso "state":
+i lettori accedono direttamente agli attributi (state.running, state.program_id)
+senza leggere il file, che viene scritto solo ai cambi di stato e riletto solo
+all'avvio per il ripristino dopo un riavvio.
+
+Su disco lo stato è un record compatto con numero di sequenza e CRC, scritto
+alternativamente in due slot: una scrittura interrotta invalida solo lo slot
+in corso di scrittura e al caricamento vince lo slot valido più recente.
 """
 import ujson
 import uos as os
+import uasyncio as asyncio
 from log_manager import log_event
 from utils import ensure_directory_exists, get_dirname
+from event_bus import publish, TOPIC_PROGRAM_STATE
 
-# Variabili globali per gestire lo stato del programma
-program_running = False
-current_program_id = None
-PROGRAM_STATE_FILE = '/data/program_state.json'
-_last_saved_state = None  # Cache per ottimizzare le verifiche
+try:
+    from binascii import crc32
+except ImportError:
+    crc32 = None
 
-# In program_state.py, modifica la funzione save_program_state()
-def save_program_state():
-    global program_running, current_program_id, _last_saved_state
+PROGRAM_STATE_FILE = '/data/program_state.json'  # Vecchio formato, letto solo per la migrazione
+PROGRAM_STATE_SLOTS = ('/data/program_state.0', '/data/program_state.1')
+_state_seq = None  # Sequenza dell'ultimo record scritto o caricato (None: non ancora letta)
+
+class ProgramState:
+    """
+    Stato di esecuzione dei programmi, unico per tutto il sistema.
+    Va modificato solo tramite set_program_running e set_program_idle, che
+    incrementano "version" e risvegliano chi attende su "changed".
+    """
+    def __init__(self):
+        self.running = False
+        self.program_id = None
+        self.version = 0  # Incrementato a ogni cambio di stato
+        self.changed = asyncio.Event()
     
-    try:
-        # Prepara i dati da salvare
-        state_data = {
-            'program_running': program_running, 
-            'current_program_id': current_program_id
-        }
-        
-        # Salva lo stato attuale per confronti futuri
-        _last_saved_state = {
-            'program_running': program_running,
-            'current_program_id': current_program_id
-        }
+    def to_dict(self):
+        """
+        Returns:
+            dict: Stato nel formato usato dal file e dalle API
+        """
+        return {'program_running': self.running, 'current_program_id': self.program_id}
+
+# Istanza condivisa: importare "state", non copiarne gli attributi
+state = ProgramState()
+
+def _notify_change():
+    """
+    Registra un cambio di stato e risveglia tutti i task in attesa.
+    """
+    state.version += 1
+    state.changed.set()
+    state.changed.clear()  # I task già in attesa restano risvegliati
+    publish(TOPIC_PROGRAM_STATE, 'running' if state.running else 'idle',
+            {'program_id': state.program_id})
+
+def set_program_running(program_id):
+    """
+    Segna un programma come in esecuzione e salva lo stato su file.
+    
+    Args:
+        program_id: ID del programma avviato
+    """
+    program_id = str(program_id)
+    if state.running and state.program_id == program_id:
+        return
+    state.running = True
+    state.program_id = program_id
+    _notify_change()
+    save_program_state()
+
+def set_program_idle():
+    """
+    Segna che nessun programma è in esecuzione e salva lo stato su file.
+    """
+    if not state.running and state.program_id is None:
+        return
+    state.running = False
+    state.program_id = None
+    _notify_change()
+    save_program_state()
+
+def clear_program_state():
+    """
+    Riporta lo stato a inattivo e lo salva comunque su file,
+    per allineare il disco (avvio, reset di fabbrica).
+    
+    Returns:
+        boolean: True se il salvataggio è riuscito
+    """
+    if state.running or state.program_id is not None:
+        state.running = False
+        state.program_id = None
+        _notify_change()
+    return save_program_state()
+
+async def wait_state_change(version, timeout=None):
+    """
+    Attende un cambio di stato successivo a una versione nota.
+    
+    Args:
+        version: Valore di state.version già osservato
+        timeout: Attesa massima in secondi, None per nessun limite
         
-        # Assicurati che la directory esista
-        from utils import ensure_directory_exists
-        ensure_directory_exists(get_dirname(PROGRAM_STATE_FILE))
-            
-        # Usa la modalità più sicura di scrittura: scrivi in un file temporaneo e poi rinomina
-        temp_file = PROGRAM_STATE_FILE + '.tmp'
+    Returns:
+        boolean: True se lo stato è cambiato, False se è scaduto il timeout
+    """
+    if state.version != version:
+        return True
+    try:
+        if timeout is None:
+            await state.changed.wait()
+        else:
+            await asyncio.wait_for(state.changed.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    return state.version != version
+
+def _checksum(payload):
+    """
+    Calcola il CRC32 di un record di stato.
+    
+    Args:
+        payload: Testo del record
         
-        with open(temp_file, 'w') as f:
-            ujson.dump(state_data, f)
-            # Forza il flush dei dati sul disco
-            f.flush()
-            
-        # Rinomina il file temporaneo (operazione atomica su molti filesystem)
-        os.rename(temp_file, PROGRAM_STATE_FILE)
+    Returns:
+        int: CRC32 a 32 bit
+    """
+    data = payload.encode()
+    if crc32:
+        return crc32(data) & 0xFFFFFFFF
+    
+    # Implementazione software per le piattaforme senza binascii.crc32
+    crc = 0xFFFFFFFF
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xEDB88320
+            else:
+                crc >>= 1
+    return crc ^ 0xFFFFFFFF
+
+def _read_slot(path):
+    """
+    Legge e valida uno slot di stato.
+    
+    Args:
+        path: Percorso dello slot
         
-        # Verifica immediatamente che i dati siano stati scritti correttamente
-        verify_save()
+    Returns:
+        list: [sequenza, running, id programma], None se assente o non valido
+    """
+    try:
+        with open(path, 'r') as f:
+            line = f.read()
+    except OSError:
+        return None
+    
+    try:
+        payload, crc = line.strip().rsplit(' ', 1)
+        if int(crc, 16) != _checksum(payload):
+            return None  # Scrittura interrotta o file danneggiato
+        record = ujson.loads(payload)
+        if not isinstance(record, list) or len(record) != 3:
+            return None
+        return record
+    except ValueError:
+        return None
+
+def _latest_record():
+    """
+    Restituisce il record valido più recente tra i due slot.
+    
+    Returns:
+        list: [sequenza, running, id programma], None se nessuno slot è valido
+    """
+    best = None
+    for path in PROGRAM_STATE_SLOTS:
+        record = _read_slot(path)
+        if record and (best is None or record[0] > best[0]):
+            best = record
+    return best
+
+def save_program_state():
+    """
+    Salva su file lo stato corrente, per il ripristino dopo un riavvio.
+    Una sola scrittura, nello slot diverso da quello dell'ultimo record valido.
+    
+    Returns:
+        boolean: True se il salvataggio è riuscito
+    """
+    global _state_seq
+    
+    try:
+        if _state_seq is None:
+            # Primo salvataggio dall'avvio: prosegui la sequenza trovata su disco
+            record = _latest_record()
+            _state_seq = record[0] if record else 0
+            ensure_directory_exists(get_dirname(PROGRAM_STATE_SLOTS[0]))
         
+        seq = _state_seq + 1
+        payload = ujson.dumps([seq, state.running, state.program_id])
+        with open(PROGRAM_STATE_SLOTS[seq % 2], 'w') as f:
+            f.write(payload + ' ' + '%08x' % _checksum(payload) + '\n')
+        _state_seq = seq
+        return True
     except OSError as e:
         log_event(f"Errore durante il salvataggio dello stato: {e}", "ERROR")
     except Exception as e:
         log_event(f"Errore imprevisto nel salvataggio stato: {e}", "ERROR")
+    return False
 
-def verify_save():
-    """
-    Verifica che lo stato del programma sia stato salvato correttamente.
-    Riprova il salvataggio se la verifica fallisce.
+def _load_legacy_state():
     """
-    global program_running, current_program_id, _last_saved_state
+    Legge lo stato dal vecchio file JSON, se presente, e lo rimuove.
     
+    Returns:
+        list: [0, running, id programma], None se assente o non valido
+    """
     try:
         with open(PROGRAM_STATE_FILE, 'r') as f:
-            state = ujson.load(f)
-            
-            # Verifica che i dati siano validi
-            if not isinstance(state, dict):
-                raise ValueError("Formato stato non valido")
-                
-            # Verifica che lo stato salvato corrisponda allo stato che dovevamo salvare
-            if (state.get('program_running') != _last_saved_state['program_running'] or 
-                state.get('current_program_id') != _last_saved_state['current_program_id']):
-                
-                log_event("Verifica salvataggio fallita: discrepanza nello stato. Nuovo tentativo.", "WARNING")
-                
-                # Riscrivi il file con i dati corretti
-                with open(PROGRAM_STATE_FILE, 'w') as f2:
-                    ujson.dump(_last_saved_state, f2)
-                    f2.flush()
-                    
-    except (OSError, ValueError) as e:
-        log_event(f"Errore nella verifica del salvataggio: {e}", "WARNING")
-        
-        # Tenta di riscrivere il file
-        try:
-            with open(PROGRAM_STATE_FILE, 'w') as f:
-                ujson.dump(_last_saved_state, f)
-                f.flush()
-        except Exception as write_error:
-            log_event(f"Fallito tentativo di correzione stato: {write_error}", "ERROR")
+            data = ujson.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    try:
+        os.remove(PROGRAM_STATE_FILE)
+    except OSError:
+        pass
+    
+    if not isinstance(data, dict):
+        return None
+    return [0, bool(data.get('program_running')), data.get('current_program_id')]
 
 def load_program_state():
     """
-    Carica lo stato del programma dal file.
-    Implementa meccanismi di difesa contro la corruzione dei dati e stati incoerenti.
-    Aggiorna le variabili globali program_running e current_program_id.
+    Carica lo stato del programma dal più recente slot valido.
+    Da usare solo all'avvio o per un ripristino: durante il funzionamento lo stato
+    in memoria è quello autorevole e i lettori usano direttamente "state".
     """
-    global program_running, current_program_id
-    
-    # Salva i valori correnti per il debug e la gestione delle incoerenze
-    previous_running = program_running
-    previous_id = current_program_id
+    global _state_seq
     
     try:
-        with open(PROGRAM_STATE_FILE, 'r') as f:
-            try:
-                state = ujson.load(f)
-                
-                # Validazione dei dati
-                if not isinstance(state, dict):
-                    raise ValueError("Formato stato non valido")
-                
-                loaded_running = state.get('program_running')
-                loaded_id = state.get('current_program_id')
-                
-                # Protezione contro stati incoerenti
-                # Non sovrascrivere lo stato attivo con quello inattivo
-                # Questa protezione evita race condition dove un programma 
-                # potrebbe essere disattivato erroneamente
-                if loaded_running is not None:
-                    # Caso speciale: un programma risulta in esecuzione (true) in memoria 
-                    # ma non sul disco (false) - mantieni lo stato attivo
-                    if not loaded_running and program_running:
-                        log_event("Incoerenza stato rilevata: mantenuto stato attivo", "WARNING")
-                        # Salva lo stato attuale per correggere il file
-                        save_program_state()
-                    else:
-                        # Altrimenti, usa il valore caricato
-                        program_running = bool(loaded_running)
-                        
-                # Aggiorna l'ID solo se ce n'è uno nuovo e valido
-                # o se il programma non è in esecuzione (in quel caso, l'ID deve essere None)
-                if loaded_id is not None:
-                    current_program_id = loaded_id
-                elif not loaded_running:
-                    current_program_id = None
-                elif loaded_running and current_program_id is None:
-                    log_event("Stato anomalo: programma in esecuzione ma ID mancante", "WARNING")
-                
-                # Log solo se lo stato è cambiato (per ridurre il rumore nei log)
-                if previous_running != program_running or previous_id != current_program_id:
-                    log_event(f"Stato programma aggiornato: running={program_running}, id={current_program_id}", "INFO")
-                    
-                # Aggiorna la cache dello stato salvato
-                global _last_saved_state
-                _last_saved_state = {
-                    'program_running': program_running,
-                    'current_program_id': current_program_id
-                }
-                
-            except ValueError as e:
-                # Errore nella decodifica JSON, reinizializza lo stato con cautela
-                log_event(f"Errore decodifica JSON file stato: {e}. Reimpostazione stato.", "WARNING")
-                
-                # Se non c'è già un programma in esecuzione, inizializza lo stato
-                # Altrimenti mantieni lo stato corrente e risalva
-                if not program_running:
-                    program_running = False
-                    current_program_id = None
-                
-                save_program_state()
-                
-    except OSError as e:
-        # File non trovato, inizializza lo stato
-        log_event(f"File stato non trovato: {e}. Creazione nuovo file.", "INFO")
+        best = _latest_record()
+        if best is None:
+            best = _load_legacy_state()
+            if best is None:
+                log_event("Nessuno stato programma valido su disco, stato inattivo", "INFO")
+                return
+        
+        seq, running, program_id = best
+        _state_seq = max(_state_seq or 0, seq)
+        running = bool(running)
+        if not running:
+            program_id = None
         
-        # Preserva lo stato corrente se un programma è già in esecuzione
-        if not program_running:
-            program_running = False
-            current_program_id = None
-            
-        save_program_state()
+        if running != state.running or program_id != state.program_id:
+            state.running = running
+            state.program_id = program_id
+            _notify_change()
+            log_event(f"Stato programma ripristinato: running={running}, id={program_id}", "INFO")
     except Exception as e:
         # Errore non previsto, logga ma mantieni lo stato attuale
-        log_event(f"Errore critico caricamento stato: {e}", "ERROR")
\ No newline at end of file
+        log_event(f"Errore critico caricamento stato: {e}", "ERROR")
@@ -9,11 +9,13 @@ import gc
 import time
 from utils import ensure_directory_exists, get_dirname
 from cache_manager import get_cached, invalidate_cache
+from event_bus import publish, TOPIC_SETTINGS
 
 # Percorsi dei file
 USER_SETTINGS_FILE = '/data/user_settings.json'
 FACTORY_SETTINGS_FILE = '/data/factory_settings.json'
-PROGRAM_FILE = '/data/program.json'
+
+_settings_version = 0  # Incrementato a ogni salvataggio delle impostazioni
 
 # Funzione per il logging che evita importazioni circolari
 def _log_event(message, level="INFO"):
@@ -32,6 +34,20 @@ def _log_event(message, level="INFO"):
         # Fallback di logging se l'importazione fallisce
         print(f"[{level}] {message}")
 
+def _apply_log_level(settings):
+    """
+    Applica al log manager la soglia di livello salvata nelle impostazioni.
+    
+    Args:
+        settings: Dizionario delle impostazioni
+    """
+    try:
+        # Importazione locale per evitare dipendenze circolari
+        from log_manager import set_log_level
+        set_log_level(settings.get('log_level', 'INFO'))
+    except ImportError:
+        pass
+
 def create_default_settings():
     """
     Crea impostazioni predefinite con valori sicuri e ben documentati.
@@ -65,7 +81,8 @@ def create_default_settings():
             'ssid': 'IrrigationSystem',  # SSID dell'access point
             'password': '12345678'  # Password dell'access point (min 8 caratteri)
         },
-        'max_zone_duration': 180  # Durata massima di attivazione di una zona in minuti
+        'max_zone_duration': 180,  # Durata massima di attivazione di una zona in minuti
+        'log_level': 'INFO'  # Livello minimo dei messaggi registrati (DEBUG, INFO, WARNING, ERROR)
     }
 
 def _save_settings_atomic(settings, file_path):
@@ -79,6 +96,8 @@ def _save_settings_atomic(settings, file_path):
     Returns:
         boolean: True se il salvataggio è riuscito, False altrimenti
     """
+    global _settings_version
+    
     try:
         # Assicurati che la directory esista
         if not ensure_directory_exists(get_dirname(file_path)):
@@ -97,6 +116,12 @@ def _save_settings_atomic(settings, file_path):
         
         # Invalida cache
         invalidate_cache('settings')
+        _settings_version += 1
+        _apply_log_level(settings)
+        
+        # Scheduler, zone_manager e /status si aggiornano tramite event_bus,
+        # per ogni scrittura delle impostazioni (salvataggio e reset)
+        publish(TOPIC_SETTINGS, 'saved')
         
         return True
     except Exception as e:
@@ -120,6 +145,7 @@ def _load_settings_uncached():
                 if not isinstance(settings, dict):
                     raise ValueError("Formato impostazioni non valido")
                 
+                _apply_log_level(settings)
                 return settings
         except OSError:
             # Il file non esiste, crea impostazioni predefinite
@@ -157,6 +183,13 @@ def load_user_settings(force_reload=False):
     
     return get_cached('settings', _load_settings_uncached, ttl=60)
 
+def get_settings_version():
+    """
+    Returns:
+        int: Versione corrente delle impostazioni, per l'ETag delle API
+    """
+    return _settings_version
+
 def save_user_settings(settings):
     """
     Salva le impostazioni utente in un file JSON in modo atomico.
@@ -217,6 +250,28 @@ def reset_user_settings():
         _log_event(f"Errore reset impostazioni utente: {e}", "ERROR")
         return False
 
+def _reset_program_state():
+    """
+    Riporta lo stato del programma a inattivo, in memoria e su disco.
+    
+    Returns:
+        boolean: True se il salvataggio è riuscito
+    """
+    # Importazione locale per evitare dipendenze circolari
+    from program_state import clear_program_state
+    return clear_program_state()
+
+def _reset_programs():
+    """
+    Elimina tutti i programmi salvati.
+    
+    Returns:
+        boolean: True se l'operazione è riuscita
+    """
+    # Importazione locale per evitare dipendenze circolari
+    from program_manager import clear_programs
+    return clear_programs()
+
 def reset_factory_data():
     """
     Resetta tutti i dati ai valori di fabbrica.
@@ -233,13 +288,10 @@ def reset_factory_data():
             {'name': 'Impostazioni utente', 'func': reset_user_settings},
             
             # Reset programmi
-            {'name': 'Programmi', 'func': lambda: _save_settings_atomic({}, PROGRAM_FILE)},
+            {'name': 'Programmi', 'func': _reset_programs},
             
             # Resetta lo stato del programma
-            {'name': 'Stato programma', 'func': lambda: _save_settings_atomic(
-                {'program_running': False, 'current_program_id': None}, 
-                '/data/program_state.json'
-            )}
+            {'name': 'Stato programma', 'func': _reset_program_state}
         ]
         
         # Esegui tutte le operazioni e traccia i risultati
@@ -0,0 +1,63 @@
+"""
+Modulo per i file statici prodotti da tools/build_web.py.
+La build minimizza e comprime con gzip i file di web/, aggiunge al nome l'hash del
+contenuto e scrive asset-manifest.json: i file con hash sono serviti con cache
+immutabile, la pagina d'ingresso (main.html) con ETag e riconvalida; la versione .gz
+è inviata solo ai client che accettano gzip.
+Senza manifest (file di web/ caricati così come sono) il server li serve invariati.
+"""
+import ujson
+from file_cache import determine_content_type
+
+ASSET_DIR = '/web'
+ASSET_MANIFEST_PATH = ASSET_DIR + '/asset-manifest.json'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_assets = None  # Percorso richiesto -> (file, content_type, etag, gzip, immutabile)
+
+def _load_manifest():
+    """
+    Legge il manifest della build e costruisce la tabella dei percorsi.
+    Ogni file è raggiungibile sia con il nome originale (riconvalida tramite ETag)
+    sia con il nome con hash (immutabile).
+    
+    Returns:
+        dict: Tabella dei percorsi, vuota se la build non è presente
+    """
+    assets = {}
+    try:
+        with open(ASSET_MANIFEST_PATH, 'r') as f:
+            manifest = ujson.load(f)
+    except OSError:
+        return assets  # Nessuna build: i file di web/ sono serviti così come sono
+    except ValueError as e:
+        print(f"Manifest dei file statici non valido: {e}")
+        return assets
+    
+    for name, entry in manifest.get('assets', {}).items():
+        file_name = entry['file']
+        gzip = entry.get('gzip', False)
+        file_path = ASSET_DIR + '/' + file_name  # Con gzip esiste anche file_path + '.gz'
+        content_type = determine_content_type(name)
+        etag = '"' + entry['hash'] + '"'
+        assets[name] = (file_path, content_type, etag, gzip, False)
+        if file_name != name:
+            assets[file_name] = (file_path, content_type, etag, gzip, True)
+    return assets
+
+def get_asset(path):
+    """
+    Cerca un file nel manifest della build.
+    
+    Args:
+        path: Percorso richiesto, relativo a /web (es. 'js/core.1a2b3c4d.js')
+    
+    Returns:
+        tuple or None: (file, content_type, etag, gzip, immutabile), None se il
+            percorso non è nel manifest
+    """
+    global _assets
+    
+    if _assets is None:
+        _assets = _load_manifest()
+    return _assets.get(path)
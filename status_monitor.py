@@ -0,0 +1,75 @@
+"""
+Modulo per lo stato complessivo del controller mostrato dall'interfaccia web.
+Zone, stato del programma e passo in corso condividono un unico numero di versione,
+incrementato a ogni evento ricevuto da event_bus: l'endpoint /status può così tenere
+aperta la richiesta finché la versione nota al client non cambia, invece di essere
+interrogato a intervalli fissi. I tempi residui non incrementano la versione: il client li
+calcola localmente a partire dall'ultima risposta.
+"""
+import uasyncio as asyncio
+from event_bus import subscribe, TOPIC_SETTINGS, TOPIC_PROGRAM_STATE, TOPIC_ZONES
+
+_version = 0  # Incrementato a ogni cambio di zone, programma o passo
+_changed = asyncio.Event()
+
+def _on_change(topic, event, data):
+    """
+    Callback di event_bus: ogni cambio di zone, programma o impostazioni
+    (nomi e visibilità delle zone) produce una nuova versione e risveglia
+    le richieste in attesa.
+    """
+    global _version
+    
+    _version += 1
+    _changed.set()
+    _changed.clear()  # I task già in attesa restano risvegliati
+
+subscribe(TOPIC_ZONES, _on_change)
+subscribe(TOPIC_PROGRAM_STATE, _on_change)
+subscribe(TOPIC_SETTINGS, _on_change)
+
+def get_status_version():
+    """
+    Returns:
+        int: Versione corrente dello stato
+    """
+    return _version
+
+async def wait_status_change(version, timeout):
+    """
+    Attende un cambio di stato successivo a una versione nota.
+    Una versione diversa da quella corrente (anche precedente a un riavvio)
+    fa terminare subito l'attesa.
+    
+    Args:
+        version: Versione già nota al client
+        timeout: Attesa massima in secondi
+    
+    Returns:
+        boolean: True se lo stato è cambiato, False se è scaduto il timeout
+    """
+    if _version != version:
+        return True
+    try:
+        await asyncio.wait_for(_changed.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    return _version != version
+
+def get_status():
+    """
+    Compone lo stato corrente in un unico dizionario.
+    
+    Returns:
+        dict: {'version', 'zones', 'program_state'}, dove program_state contiene
+            anche zona attiva e passo in corso
+    """
+    # Importazione locale per evitare dipendenze circolari
+    from zone_manager import get_zones_status
+    from program_execution import get_program_state
+    
+    return {
+        'version': _version,
+        'zones': get_zones_status(),
+        'program_state': get_program_state()
+    }
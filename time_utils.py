@@ -0,0 +1,200 @@
+"""
+Modulo di utilità per date e orari.
+Tutti i valori sono interi: secondi e giorni trascorsi dal 1970-01-01 (epoch Unix),
+indipendentemente dall'epoch della piattaforma (2000 su ESP32). Le conversioni da e verso
+il calendario usano solo aritmetica intera, senza tabelle dei mesi né casi speciali di fine anno.
+"""
+import time
+
+SECONDS_PER_DAY = 86400
+
+def days_from_civil(year, month, day):
+    """
+    Converte una data del calendario gregoriano in giorni dall'epoch Unix.
+    
+    Args:
+        year: Anno
+        month: Mese (1-12)
+        day: Giorno (1-31)
+        
+    Returns:
+        int: Giorni dal 1970-01-01
+    """
+    if month <= 2:
+        year -= 1
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+def civil_from_days(days):
+    """
+    Converte i giorni dall'epoch Unix in una data del calendario gregoriano.
+    
+    Args:
+        days: Giorni dal 1970-01-01
+        
+    Returns:
+        tuple: (anno, mese, giorno)
+    """
+    days += 719468
+    era = days // 146097
+    doe = days - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = mp + (3 if mp < 10 else -9)
+    year = yoe + era * 400
+    if month <= 2:
+        year += 1
+    return (year, month, day)
+
+# Differenza tra l'epoch della piattaforma e l'epoch Unix, calcolata una sola volta
+try:
+    _platform_epoch = time.gmtime(0)
+except AttributeError:
+    _platform_epoch = time.localtime(0)
+_EPOCH_OFFSET = days_from_civil(_platform_epoch[0], _platform_epoch[1], _platform_epoch[2]) * SECONDS_PER_DAY
+_platform_epoch = None
+
+def now():
+    """
+    Restituisce l'istante corrente.
+    
+    Returns:
+        int: Secondi dall'epoch Unix
+    """
+    return int(time.time()) + _EPOCH_OFFSET
+
+def epoch_day(ts):
+    """
+    Restituisce il giorno di un istante.
+    
+    Args:
+        ts: Secondi dall'epoch Unix
+        
+    Returns:
+        int: Giorni dall'epoch Unix
+    """
+    return ts // SECONDS_PER_DAY
+
+def today():
+    """
+    Restituisce il giorno corrente.
+    
+    Returns:
+        int: Giorni dall'epoch Unix
+    """
+    return now() // SECONDS_PER_DAY
+
+def day_start(day):
+    """
+    Restituisce l'istante di inizio (mezzanotte) di un giorno.
+    
+    Args:
+        day: Giorni dall'epoch Unix
+        
+    Returns:
+        int: Secondi dall'epoch Unix
+    """
+    return day * SECONDS_PER_DAY
+
+def minute_of_day(ts):
+    """
+    Restituisce il minuto del giorno (0-1439) di un istante.
+    
+    Args:
+        ts: Secondi dall'epoch Unix
+        
+    Returns:
+        int: Minuti trascorsi dalla mezzanotte
+    """
+    return (ts % SECONDS_PER_DAY) // 60
+
+def month_of_day(day):
+    """
+    Restituisce il mese (1-12) di un giorno.
+    
+    Args:
+        day: Giorni dall'epoch Unix
+        
+    Returns:
+        int: Mese
+    """
+    return civil_from_days(day)[1]
+
+def format_date(day):
+    """
+    Formatta un giorno come YYYY-MM-DD.
+    
+    Args:
+        day: Giorni dall'epoch Unix
+        
+    Returns:
+        str: Data formattata
+    """
+    y, m, d = civil_from_days(day)
+    return f"{y}-{m:02d}-{d:02d}"
+
+def format_time(ts):
+    """
+    Formatta l'ora di un istante come HH:MM:SS.
+    
+    Args:
+        ts: Secondi dall'epoch Unix
+        
+    Returns:
+        str: Ora formattata
+    """
+    s = ts % SECONDS_PER_DAY
+    return f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}"
+
+def parse_date(text):
+    """
+    Converte una data YYYY-MM-DD nel giorno corrispondente.
+    
+    Args:
+        text: Data da convertire
+        
+    Returns:
+        int or None: Giorni dall'epoch Unix, None se la data non è valida
+            (formato errato, mese fuori da 1-12 o giorno oltre la fine del mese)
+    """
+    try:
+        parts = text.split('-')
+        if len(parts) != 3:
+            return None
+        year, month, day = int(parts[0]), int(parts[1]), int(parts[2])
+        if not 1 <= month <= 12 or day < 1:
+            raise ValueError("mese o giorno fuori intervallo")
+        days = days_from_civil(year, month, day)
+        # Un giorno oltre la fine del mese (es. 2024-02-30) cade nel mese successivo
+        if civil_from_days(days) != (year, month, day):
+            raise ValueError("giorno oltre la fine del mese")
+        return days
+    except (ValueError, AttributeError):
+        return None
+
+def parse_time(text):
+    """
+    Converte un orario HH:MM o HH:MM:SS nei secondi dalla mezzanotte.
+    
+    Args:
+        text: Orario da convertire
+        
+    Returns:
+        int or None: Secondi dalla mezzanotte, None se l'orario non è valido
+    """
+    try:
+        parts = text.split(':')
+        if len(parts) < 2 or len(parts) > 3:
+            return None
+        hours, minutes = int(parts[0]), int(parts[1])
+        seconds = int(parts[2]) if len(parts) == 3 else 0
+        if not (0 <= hours < 24 and 0 <= minutes < 60 and 0 <= seconds < 60):
+            return None
+        return hours * 3600 + minutes * 60 + seconds
+    except (ValueError, AttributeError):
+        return None
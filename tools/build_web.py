@@ -0,0 +1,397 @@
+"""
+Build dei file dell'interfaccia web, da eseguire su un host con CPython 3 prima di
+caricare web/ sul dispositivo.
+
+Per ogni file di web/:
+- HTML, JS e CSS vengono minimizzati in modo conservativo: indentazione, spazi finali,
+  righe vuote e righe di solo commento (// nei JS, <!-- --> negli HTML) sono rimossi,
+  gli a capo restano e le righe dentro template literal, commenti /* */, <pre> e
+  <textarea> non vengono toccate, quindi il codice non cambia significato;
+- al nome viene aggiunto l'hash del contenuto (js/core.js -> js/core.1a2b3c4d.js),
+  tranne che per le pagine d'ingresso (main.html), che il browser richiede sempre
+  con lo stesso nome;
+- i file di testo vengono compressi con gzip e salvati anche con estensione .gz,
+  servita ai browser che la accettano (Accept-Encoding).
+
+Scrive infine asset-manifest.json, letto da static_assets.py, e inserisce in main.html
+la tabella window.ASSET_MANIFEST usata da window.assetUrl (scripts.js) per richiedere i
+file con hash. Il contenuto della directory di uscita sostituisce /web sul dispositivo.
+
+Uso:
+    python3 tools/build_web.py [--src web] [--out build/web] [--no-minify]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MANIFEST_NAME = 'asset-manifest.json'
+ENTRY_FILES = ('main.html',)          # Richiesti sempre con lo stesso nome
+TEXT_EXTENSIONS = ('.html', '.js', '.css', '.json', '.svg')
+MINIFY_EXTENSIONS = ('.html', '.js', '.css')
+HASH_LENGTH = 8
+
+_HTML_COMMENT_LINE = re.compile(r'^<!--.*-->$')
+_HTML_SCRIPT_START = re.compile(r'<script\b[^>]*>(?!.*</script>)', re.I)
+_HTML_SCRIPT_END = re.compile(r'</script>', re.I)
+_HTML_RAW_START = re.compile(r'<(pre|textarea)\b', re.I)
+_HTML_RAW_END = re.compile(r'</(pre|textarea)>', re.I)
+_ASSET_ATTRIBUTE = re.compile(r'''((?:src|href)=["'])([^"'#?]+)(["'])''')
+
+# Dopo questi caratteri (o all'inizio) una / apre un'espressione regolare, non una divisione
+_REGEX_PRECEDERS = '(,=:[!&|?{};+-*%<>~^'
+_REGEX_KEYWORDS = ('return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete', 'void', 'yield')
+
+class JsScanner:
+    """
+    Segue riga per riga lo stato lessicale di un sorgente JavaScript, quanto basta per
+    sapere se una riga inizia e finisce fuori da stringhe, template literal e commenti
+    /* */: solo in quel caso indentazione, spazi finali e commenti // si possono togliere.
+    """
+    def __init__(self):
+        self.mode = None      # None (codice), 'tpl', 'block' o il delimitatore di una stringa
+        self.braces = []      # Profondità delle graffe dentro ogni ${ } aperto
+        self.last = ''        # Ultimo carattere significativo del codice
+        self.word = ''        # Ultima parola del codice
+
+    def in_code(self):
+        return self.mode is None
+
+    def feed(self, line):
+        """
+        Avanza lo stato fino alla fine della riga.
+        """
+        i = 0
+        n = len(line)
+        while i < n:
+            c = line[i]
+            mode = self.mode
+            if mode == 'block':
+                end = line.find('*/', i)
+                if end < 0:
+                    return
+                self.mode = None
+                i = end + 2
+                continue
+            if mode == 'tpl':
+                if c == '\\':
+                    i += 2
+                    continue
+                if c == '`':
+                    self.mode = None
+                    self.last = '`'
+                elif c == '$' and line.startswith('${', i):
+                    self.mode = None
+                    self.braces.append(0)
+                    self.last = '{'
+                    i += 1
+                i += 1
+                continue
+            if mode is not None:
+                # Stringa che prosegue dopo una \ a fine riga
+                i = self._skip_string(line, i, mode)
+                continue
+
+            if c in ' \t':
+                i += 1
+                continue
+            if c in '\'"':
+                self.mode = c
+                i = self._skip_string(line, i + 1, c)
+                self.last = c
+                self.word = ''
+                continue
+            if c == '`':
+                self.mode = 'tpl'
+                i += 1
+                continue
+            if c == '/':
+                nxt = line[i + 1:i + 2]
+                if nxt == '/':
+                    return
+                if nxt == '*':
+                    self.mode = 'block'
+                    i += 2
+                    continue
+                if not self.last or self.last in _REGEX_PRECEDERS or self.word in _REGEX_KEYWORDS:
+                    i = self._skip_regex(line, i + 1)
+                    self.last = '/'
+                    self.word = ''
+                    continue
+            if c == '{' and self.braces:
+                self.braces[-1] += 1
+            elif c == '}' and self.braces:
+                if self.braces[-1] == 0:
+                    self.braces.pop()
+                    self.mode = 'tpl'
+                    i += 1
+                    continue
+                self.braces[-1] -= 1
+
+            if c.isalnum() or c in '_$':
+                start = i
+                while i < n and (line[i].isalnum() or line[i] in '_$'):
+                    i += 1
+                self.word = line[start:i]
+                self.last = line[i - 1]
+                continue
+            self.last = c
+            self.word = ''
+            i += 1
+
+    def _skip_string(self, line, i, quote):
+        n = len(line)
+        while i < n:
+            c = line[i]
+            if c == '\\':
+                if i + 1 >= n:
+                    return n  # La stringa continua alla riga successiva
+                i += 2
+                continue
+            if c == quote:
+                self.mode = None
+                return i + 1
+            i += 1
+        self.mode = None  # Stringa non chiusa: errore di sintassi, non la si segue oltre
+        return n
+
+    def _skip_regex(self, line, i):
+        n = len(line)
+        in_class = False
+        while i < n:
+            c = line[i]
+            if c == '\\':
+                i += 2
+                continue
+            if c == '[':
+                in_class = True
+            elif c == ']':
+                in_class = False
+            elif c == '/' and not in_class:
+                return i + 1
+            i += 1
+        return n
+
+def _minify_js_line(scanner, line):
+    """
+    Minimizza una riga di JavaScript e aggiorna lo stato dello scanner.
+
+    Returns:
+        str or None: Riga minimizzata, None se la riga va eliminata
+    """
+    starts_in_code = scanner.in_code()
+    scanner.feed(line)
+    if scanner.in_code():
+        line = line.rstrip()
+    if not starts_in_code:
+        return line  # Contenuto di un template literal o di un commento: invariato
+    line = line.lstrip()
+    if not line or line.startswith('//'):
+        return None
+    return line
+
+def minify(name, text):
+    """
+    Minimizza un file di testo riga per riga, senza unire le righe.
+    Nei JS (anche negli script inline degli HTML) le righe che iniziano dentro un
+    template literal o un commento restano invariate; il contenuto di <pre> e
+    <textarea> non viene toccato.
+
+    Args:
+        name: Nome del file (determina le regole per i commenti)
+        text: Contenuto
+
+    Returns:
+        str: Contenuto minimizzato
+    """
+    is_js = name.endswith('.js')
+    is_html = name.endswith('.html')
+    scanner = JsScanner() if is_js else None
+    raw = False
+    lines = []
+    for line in text.splitlines():
+        if scanner is not None:
+            if is_html and scanner.in_code() and _HTML_SCRIPT_END.search(line):
+                scanner = None  # Fine dello script inline: si torna all'HTML
+            else:
+                line = _minify_js_line(scanner, line)
+                if line is not None:
+                    lines.append(line)
+                continue
+        if raw:
+            lines.append(line)
+            raw = not _HTML_RAW_END.search(line)
+            continue
+
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if is_html and _HTML_COMMENT_LINE.match(stripped):
+            continue
+        if is_html and _HTML_RAW_START.search(stripped) and not _HTML_RAW_END.search(stripped):
+            lines.append(stripped)
+            raw = True
+            continue
+        lines.append(stripped)
+        if is_html and _HTML_SCRIPT_START.search(stripped):
+            scanner = JsScanner()
+    return '\n'.join(lines) + '\n'
+
+def content_hash(data):
+    """
+    Returns:
+        str: Prime HASH_LENGTH cifre esadecimali dello SHA-1 del contenuto
+    """
+    return hashlib.sha1(data).hexdigest()[:HASH_LENGTH]
+
+def hashed_name(name, digest):
+    """
+    Inserisce l'hash prima dell'estensione: js/core.js -> js/core.1a2b3c4d.js
+    """
+    base, ext = os.path.splitext(name)
+    return f'{base}.{digest}{ext}'
+
+def compress(data):
+    """
+    Comprime con gzip in modo riproducibile (data di modifica nell'header a zero).
+    """
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def rewrite_entry(text, urls):
+    """
+    Prepara una pagina d'ingresso: gli attributi src/href che puntano a file della
+    build usano il nome con hash e la tabella dei nomi viene inserita prima di </head>.
+
+    Args:
+        text: Contenuto della pagina
+        urls: Dizionario nome originale -> nome con hash
+
+    Returns:
+        str: Pagina riscritta
+    """
+    def replace(match):
+        return match.group(1) + urls.get(match.group(2), match.group(2)) + match.group(3)
+
+    text = _ASSET_ATTRIBUTE.sub(replace, text)
+    table = json.dumps(urls, separators=(',', ':'), sort_keys=True)
+    script = f'<script>window.ASSET_MANIFEST={table};</script>\n'
+    head_end = text.find('</head>')
+    if head_end < 0:
+        return script + text
+    return text[:head_end] + script + text[head_end:]
+
+def collect_files(src_dir):
+    """
+    Returns:
+        list: Percorsi relativi (con /) dei file di src_dir, in ordine
+    """
+    names = []
+    for root, dirs, files in os.walk(src_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for file_name in sorted(files):
+            if file_name.startswith('.') or file_name == MANIFEST_NAME:
+                continue
+            path = os.path.join(root, file_name)
+            names.append(os.path.relpath(path, src_dir).replace(os.sep, '/'))
+    return names
+
+def prepare_out_dir(out_dir):
+    """
+    Svuota la directory di uscita. Per sicurezza rifiuta una directory non vuota
+    che non contenga una build precedente.
+    """
+    if os.path.isdir(out_dir) and os.listdir(out_dir):
+        if not os.path.exists(os.path.join(out_dir, MANIFEST_NAME)):
+            sys.exit(f"{out_dir} non è vuota e non contiene una build: scegliere un'altra --out")
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+
+def write_file(out_dir, name, data):
+    path = os.path.join(out_dir, *name.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def build(src_dir, out_dir, do_minify=True):
+    """
+    Esegue la build.
+
+    Args:
+        src_dir: Directory dei sorgenti (web/)
+        out_dir: Directory di uscita
+        do_minify: False per saltare la minimizzazione
+
+    Returns:
+        list: Righe (nome, byte originali, byte trasferiti) per il riepilogo
+    """
+    names = collect_files(src_dir)
+    prepare_out_dir(out_dir)
+
+    contents = {}
+    for name in names:
+        with open(os.path.join(src_dir, *name.split('/')), 'rb') as f:
+            data = f.read()
+        original_size = len(data)
+        if do_minify and name.endswith(MINIFY_EXTENSIONS):
+            data = minify(name, data.decode('utf-8')).encode('utf-8')
+        contents[name] = (data, original_size)
+
+    # Prima i file con hash, poi le pagine d'ingresso che ne contengono i nomi
+    urls = {}
+    for name in names:
+        if name not in ENTRY_FILES:
+            urls[name] = hashed_name(name, content_hash(contents[name][0]))
+    for name in names:
+        if name in ENTRY_FILES:
+            data, original_size = contents[name]
+            data = rewrite_entry(data.decode('utf-8'), urls).encode('utf-8')
+            contents[name] = (data, original_size)
+            urls[name] = name
+
+    assets = {}
+    summary = []
+    for name in names:
+        data, original_size = contents[name]
+        file_name = urls[name]
+        entry = {'file': file_name, 'hash': content_hash(data)}
+        write_file(out_dir, file_name, data)
+        if name.endswith(TEXT_EXTENSIONS):
+            compressed = compress(data)
+            if len(compressed) < len(data):
+                # La versione non compressa resta per i client senza gzip
+                data = compressed
+                entry['gzip'] = True
+                write_file(out_dir, file_name + '.gz', data)
+        assets[name] = entry
+        summary.append((name, original_size, len(data)))
+
+    manifest = {'version': 1, 'assets': assets}
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--src', default=os.path.join(REPO_DIR, 'web'))
+    parser.add_argument('--out', default=os.path.join(REPO_DIR, 'build', 'web'))
+    parser.add_argument('--no-minify', action='store_true', help='comprime senza minimizzare')
+    args = parser.parse_args()
+
+    summary = build(args.src, args.out, not args.no_minify)
+
+    total_in = total_out = 0
+    for name, size_in, size_out in summary:
+        total_in += size_in
+        total_out += size_out
+        print(f'{name:<40} {size_in:>8} -> {size_out:>7}  ({size_in / max(size_out, 1):.1f}x)')
+    print(f'# totale: {len(summary)} file, {total_in} -> {total_out} byte '
+          f'({total_in / max(total_out, 1):.1f}x), uscita in {args.out}')
+
+if __name__ == '__main__':
+    main()
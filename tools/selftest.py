@@ -0,0 +1,240 @@
+"""
+Test del firmware da eseguire su un host Linux con CPython 3.
+
+Usa gli stessi shim di tools/simulate.py (moduli MicroPython, orologio virtuale,
+/data reindirizzata in una directory temporanea) e verifica le parti che non si
+possono controllare a occhio sul dispositivo: calcolo della prossima attivazione,
+conflitti tra programmi, ripristino dello stato dai due slot e caricamento della
+tabella dei modelli di log dopo una scrittura interrotta.
+
+Uso:
+    python3 tools/selftest.py [-v]
+"""
+import builtins
+import os
+import shutil
+import tempfile
+import unittest
+
+import simulate
+from simulate import clock
+
+ALL_MONTHS = ["Gennaio", "Febbraio", "Marzo", "Aprile", "Maggio", "Giugno", "Luglio",
+              "Agosto", "Settembre", "Ottobre", "Novembre", "Dicembre"]
+
+_data_root = None
+_cwd = None
+
+def setUpModule():
+    global _data_root, _cwd
+    _data_root = tempfile.mkdtemp(prefix='irrigator-test-')
+    _cwd = os.getcwd()
+    simulate._prepare_data(_data_root, os.devnull,
+                           os.path.join(simulate.REPO_DIR, 'data', 'user_settings.json'), 'ERROR')
+    simulate._install_shims(_data_root)
+    os.chdir(_data_root)
+
+    import time_utils
+    clock.base = time_utils.day_start(time_utils.parse_date('2026-06-15'))
+
+def tearDownModule():
+    builtins.open = simulate._real_open
+    os.chdir(_cwd)
+    shutil.rmtree(_data_root, ignore_errors=True)
+
+def _program(pid, activation_time, months=ALL_MONTHS, steps=((0, 30),), **fields):
+    program = {
+        'id': pid,
+        'name': 'P' + pid,
+        'activation_time': activation_time,
+        'months': list(months),
+        'recurrence': 'giornaliero',
+        'steps': [{'zone_id': zone, 'duration': minutes} for zone, minutes in steps],
+    }
+    program.update(fields)
+    return program
+
+class NextActivationTest(unittest.TestCase):
+    def setUp(self):
+        import time_utils
+        from program_model import compile_program
+        from program_scheduling import next_activation
+        self.day = time_utils.parse_date('2026-06-15')
+        self.day_start = time_utils.day_start
+        self.compile = compile_program
+        self.next_activation = next_activation
+
+    def at(self, day, hour, minute=0):
+        return self.day_start(day) + hour * 3600 + minute * 60
+
+    def test_same_day_before_and_at_start(self):
+        program = self.compile(_program('1', '06:00'))
+        self.assertEqual(self.next_activation(program, self.at(self.day, 5)), self.at(self.day, 6))
+        self.assertEqual(self.next_activation(program, self.at(self.day, 6)), self.at(self.day, 6))
+
+    def test_next_day_after_start(self):
+        program = self.compile(_program('1', '06:00'))
+        self.assertEqual(self.next_activation(program, self.at(self.day, 6) + 1),
+                         self.at(self.day + 1, 6))
+
+    def test_interval_from_last_run(self):
+        program = self.compile(_program('1', '06:00', recurrence='personalizzata', interval_days=3),
+                               self.day)
+        self.assertEqual(self.next_activation(program, self.at(self.day, 7)), self.at(self.day + 3, 6))
+        # Un'esecuzione molto vecchia non sposta la prossima attivazione indietro
+        program = self.compile(_program('1', '06:00', recurrence='personalizzata', interval_days=3),
+                               self.day - 30)
+        self.assertEqual(self.next_activation(program, self.at(self.day, 7)), self.at(self.day + 1, 6))
+
+    def test_first_active_month(self):
+        import time_utils
+        program = self.compile(_program('1', '06:00', months=['Luglio']))
+        july_first = time_utils.parse_date('2026-07-01')
+        self.assertEqual(self.next_activation(program, self.at(self.day, 7)), self.at(july_first, 6))
+
+    def test_not_schedulable(self):
+        self.assertIsNone(self.next_activation(self.compile(_program('1', '06:00', months=[])),
+                                               self.at(self.day, 0)))
+        self.assertIsNone(self.next_activation(self.compile(_program('1', None)), self.at(self.day, 0)))
+        self.assertIsNone(self.next_activation(None, self.at(self.day, 0)))
+
+class ProgramConflictsTest(unittest.TestCase):
+    def setUp(self):
+        import program_manager
+        self.pm = program_manager
+        self.assertTrue(program_manager.save_programs({
+            '1': _program('1', '23:50'),
+            '2': _program('2', '06:00', months=['Luglio', 'Agosto'], steps=((1, 20), (2, 20)),
+                          parallel_groups=True),
+        }))
+
+    def tearDown(self):
+        self.pm.save_programs({})
+
+    def test_overlap(self):
+        conflict, message = self.pm.check_program_conflicts(_program('3', '06:10', months=['Luglio']))
+        self.assertTrue(conflict)
+        self.assertIn("P2", message)
+
+    def test_no_overlap(self):
+        self.assertFalse(self.pm.check_program_conflicts(_program('3', '07:00', months=['Luglio']))[0])
+        self.assertFalse(self.pm.check_program_conflicts(_program('3', '06:10', months=['Gennaio']))[0])
+
+    def test_exclude_self(self):
+        program = _program('2', '06:10', months=['Luglio'])
+        self.assertTrue(self.pm.check_program_conflicts(program)[0])
+        self.assertFalse(self.pm.check_program_conflicts(program, exclude_id=2)[0])
+
+    def test_run_past_midnight(self):
+        # P1 (23:50, 30 minuti) prosegue fino alle 00:20 del giorno dopo
+        conflict, message = self.pm.check_program_conflicts(_program('3', '00:10', months=['Marzo']))
+        self.assertTrue(conflict)
+        self.assertIn("P1", message)
+        self.assertFalse(self.pm.check_program_conflicts(_program('3', '00:30', months=['Marzo']))[0])
+
+class ProgramStateRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        import program_state
+        self.ps = program_state
+        for path in program_state.PROGRAM_STATE_SLOTS:
+            try:
+                os.remove(path[1:])
+            except OSError:
+                pass
+        program_state._state_seq = None
+        program_state.clear_program_state()
+
+    def restart(self):
+        """
+        Simula un riavvio: stato in memoria inattivo e sequenza da rileggere.
+        """
+        self.ps.state.running = False
+        self.ps.state.program_id = None
+        self.ps._state_seq = None
+        self.ps.load_program_state()
+
+    def corrupt(self, path):
+        with simulate._real_open(path[1:], 'r+') as f:
+            line = f.read()
+            f.seek(0)
+            f.truncate()
+            f.write(line[:len(line) // 2])
+
+    def latest_slot(self):
+        return self.ps.PROGRAM_STATE_SLOTS[self.ps._state_seq % 2]
+
+    def test_latest_valid_slot_wins(self):
+        self.ps.set_program_running('1')
+        self.ps.set_program_idle()
+        self.ps.set_program_running('2')
+        self.restart()
+        self.assertTrue(self.ps.state.running)
+        self.assertEqual(self.ps.state.program_id, '2')
+
+    def test_interrupted_write_falls_back_to_other_slot(self):
+        self.ps.set_program_running('1')
+        self.ps.set_program_idle()
+        self.corrupt(self.latest_slot())
+        self.restart()
+        self.assertTrue(self.ps.state.running)
+        self.assertEqual(self.ps.state.program_id, '1')
+
+        # Il salvataggio successivo sovrascrive lo slot danneggiato, non quello valido
+        valid_seq = self.ps._state_seq
+        self.ps.set_program_idle()
+        self.assertEqual(self.ps._state_seq, valid_seq + 1)
+        self.restart()
+        self.assertFalse(self.ps.state.running)
+
+    def test_both_slots_invalid_keep_idle(self):
+        self.ps.set_program_running('1')
+        self.ps.set_program_idle()
+        for path in self.ps.PROGRAM_STATE_SLOTS:
+            self.corrupt(path)
+        self.restart()
+        self.assertFalse(self.ps.state.running)
+        self.assertIsNone(self.ps.state.program_id)
+
+class LogTemplatesTest(unittest.TestCase):
+    def setUp(self):
+        import log_manager
+        self.lm = log_manager
+        self.path = log_manager.TEMPLATES_FILE[1:]
+
+    def reload(self):
+        """
+        Simula un riavvio: la tabella dei modelli viene riletta dal file.
+        """
+        del self.lm._templates[:]
+        self.lm._template_ids.clear()
+        self.lm._templates_saved = 0
+        self.lm._load_templates()
+
+    def write_table(self, text):
+        with simulate._real_open(self.path, 'w') as f:
+            f.write(text)
+
+    def test_truncated_line_keeps_later_ids(self):
+        self.write_table('[0, "Zona {} avviata"]\n[1, "Zona {} arre\n[2, "Programma {} completato"]\n')
+        self.reload()
+        self.assertEqual(self.lm._expand(0, [3]), "Zona 3 avviata")
+        self.assertEqual(self.lm._expand(2, ['P1']), "Programma P1 completato")
+        self.assertTrue(self.lm._expand(1, [3]).startswith("<modello 1>"))
+
+        # L'id perso non viene riassegnato e la riga illeggibile sparisce dal file
+        self.assertEqual(self.lm._intern_template("Nuovo {}"), 3)
+        self.assertTrue(self.lm._save_templates())
+        with simulate._real_open(self.path) as f:
+            self.assertNotIn("arre", f.read())
+        self.reload()
+        self.assertEqual(self.lm._expand(2, ['P1']), "Programma P1 completato")
+        self.assertEqual(self.lm._expand(3, [1]), "Nuovo 1")
+
+    def test_truncated_last_line(self):
+        self.write_table('[0, "Zona {} avviata"]\n[1, "Zona {')
+        self.reload()
+        self.assertEqual(self.lm._intern_template("Zona {} avviata"), 0)
+        self.assertEqual(self.lm._intern_template("Altro {}"), 1)
+
+if __name__ == '__main__':
+    unittest.main()
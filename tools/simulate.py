@@ -0,0 +1,434 @@
+"""
+Simulatore accelerato della pianificazione, da eseguire su un host Linux con CPython 3.
+
+Esegue program_scheduling.check_programs, program_execution.execute_program e i timer
+di zone_manager con un orologio virtuale: il ciclo eventi non attende mai davvero e,
+quando non ha nulla di pronto, fa avanzare l'orologio fino al prossimo timer. I pin GPIO
+sono sostituiti da un backend che registra ogni commutazione, i percorsi /data sono
+reindirizzati in una directory temporanea.
+
+Uso:
+    python3 tools/simulate.py [--programs data/program.json] [--settings data/user_settings.json]
+                              [--start 2026-01-01] [--days 365] [--timeline] [--log-level WARNING]
+
+Stampa per ogni giorno le esecuzioni, le attivazioni mancate e il tempo CPU reale speso
+dallo scheduler (esclusa l'esecuzione dei programmi); con --timeline stampa anche
+l'apertura e la chiusura delle zone.
+"""
+import argparse
+import asyncio
+import builtins
+import gc
+import json
+import os
+import selectors
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import types
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_perf = time.perf_counter
+_real_open = builtins.open
+
+class VirtualClock:
+    """
+    Orologio condiviso da time.time, time.ticks_ms e dal ciclo eventi.
+    Il ciclo eventi usa i secondi trascorsi dall'inizio (t), piccoli abbastanza da
+    non perdere precisione in virgola mobile; time.time restituisce base + t.
+    """
+    def __init__(self):
+        self.base = 0
+        self.t = 0.0
+
+    def now(self):
+        return self.base + self.t
+
+clock = VirtualClock()
+
+# ---------------------------------------------------------------------------
+# Shim dei moduli MicroPython
+# ---------------------------------------------------------------------------
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MASK = _TICKS_PERIOD - 1
+_TICKS_HALF = _TICKS_PERIOD // 2
+
+def _ticks_ms():
+    return int(clock.t * 1000) & _TICKS_MASK
+
+def _ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MASK
+
+def _ticks_diff(end, start):
+    return ((end - start + _TICKS_HALF) & _TICKS_MASK) - _TICKS_HALF
+
+def _patch_time():
+    """
+    Sostituisce le funzioni di time che dipendono dall'ora corrente.
+    """
+    real_localtime = time.localtime
+    real_gmtime = time.gmtime
+    time.time = clock.now
+    time.ticks_ms = _ticks_ms
+    time.ticks_add = _ticks_add
+    time.ticks_diff = _ticks_diff
+    time.localtime = lambda secs=None: real_localtime(clock.now() if secs is None else secs)
+    time.gmtime = lambda secs=None: real_gmtime(clock.now() if secs is None else secs)
+
+class _DataPaths:
+    """
+    Reindirizza i percorsi assoluti /data verso una directory dell'host.
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def map(self, path):
+        if isinstance(path, str) and (path == '/data' or path.startswith('/data/')):
+            return os.path.join(self.root, path[1:])
+        return path
+
+def _make_uos(paths):
+    """
+    Crea un modulo uos che applica il reindirizzamento dei percorsi.
+    """
+    uos = types.ModuleType('uos')
+    for name in ('listdir', 'stat', 'remove', 'mkdir', 'rmdir'):
+        func = getattr(os, name)
+        setattr(uos, name, lambda path, *a, _f=func: _f(paths.map(path), *a))
+    uos.rename = lambda src, dst: os.replace(paths.map(src), paths.map(dst))
+    uos.statvfs = lambda path: (4096, 4096, 1024, 512, 512, 0, 0, 0, 0, 255)
+    uos.sep = '/'
+    return uos
+
+class Pin:
+    """
+    Pin GPIO simulato: registra ogni cambio di livello con l'istante virtuale.
+    """
+    OUT = 1
+    IN = 0
+    events = []  # (istante, numero pin, livello)
+
+    def __init__(self, number, mode=None, *args, **kwargs):
+        self.number = number
+        self.level = None
+
+    def value(self, level=None):
+        if level is None:
+            return self.level
+        if level != self.level:
+            Pin.events.append((clock.now(), self.number, level))
+        self.level = level
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+def _install_shims(data_root):
+    """
+    Registra in sys.modules i moduli MicroPython usati dal firmware.
+    """
+    paths = _DataPaths(data_root)
+
+    def mapped_open(file, *args, **kwargs):
+        return _real_open(paths.map(file), *args, **kwargs)
+
+    builtins.open = mapped_open
+    sys.modules['ujson'] = json
+    sys.modules['ustruct'] = struct
+    sys.modules['uos'] = _make_uos(paths)
+    sys.modules['uasyncio'] = asyncio
+
+    machine = types.ModuleType('machine')
+    machine.Pin = Pin
+    machine.reset = lambda: None
+    sys.modules['machine'] = machine
+
+    if not hasattr(gc, 'mem_free'):
+        gc.mem_free = lambda: 100000
+        gc.mem_alloc = lambda: 50000
+
+    _patch_time()
+    for path in (REPO_DIR, os.path.join(REPO_DIR, 'lib')):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+# ---------------------------------------------------------------------------
+# Ciclo eventi a tempo virtuale
+# ---------------------------------------------------------------------------
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """
+    Selettore che non blocca mai: se non ci sono eventi fa avanzare l'orologio
+    virtuale della durata dell'attesa richiesta dal ciclo eventi.
+    """
+    def select(self, timeout=None):
+        events = super().select(0)
+        if events:
+            return events
+        if timeout is None:
+            raise RuntimeError("Simulazione bloccata: nessun timer in attesa")
+        if timeout > 0:
+            clock.t += timeout
+        return []
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    """
+    Ciclo eventi il cui tempo è l'orologio virtuale.
+    """
+    def __init__(self):
+        super().__init__(_VirtualSelector())
+        # Tolleranza sulle scadenze dei timer, per gli arrotondamenti dell'orologio virtuale
+        self._clock_resolution = 1e-3
+
+    def time(self):
+        return clock.t
+
+# ---------------------------------------------------------------------------
+# Strumentazione
+# ---------------------------------------------------------------------------
+
+class _Timed:
+    """
+    Avvolge una coroutine misurando il tempo reale speso in ciascun passo.
+    """
+    def __init__(self, coro, account):
+        self._coro = coro
+        self._account = account
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            start = _perf()
+            try:
+                if error is None:
+                    yielded = self._coro.send(value)
+                else:
+                    yielded = self._coro.throw(error)
+            except StopIteration as e:
+                self._account(_perf() - start)
+                return e.value
+            except BaseException:
+                self._account(_perf() - start)
+                raise
+            self._account(_perf() - start)
+            try:
+                value, error = (yield yielded), None
+            except BaseException as e:
+                value, error = None, e
+
+class DayStats:
+    """
+    Statistiche di un giorno simulato.
+    """
+    __slots__ = ('runs', 'missed', 'max_delay', 'cpu_total', 'cpu_exec')
+
+    def __init__(self):
+        self.runs = 0
+        self.missed = []
+        self.max_delay = 0
+        self.cpu_total = 0.0
+        self.cpu_exec = 0.0
+
+class Simulation:
+    """
+    Stato della simulazione: esecuzioni avviate, statistiche giornaliere e timeline.
+    """
+    def __init__(self, start_day, days):
+        self.start_day = start_day
+        self.days = days
+        self.stats = {}
+        self.starts = {}  # (id programma, giorno) -> istante di avvio
+        self.last_start = {}  # id programma -> ultimo giorno di avvio
+        self.first_event = 0  # Eventi GPIO precedenti: inizializzazione dei pin
+
+    def day_stats(self, day=None):
+        if day is None:
+            day = int(clock.now()) // 86400
+        stats = self.stats.get(day)
+        if stats is None:
+            stats = self.stats[day] = DayStats()
+        return stats
+
+    def account_total(self, elapsed):
+        self.day_stats().cpu_total += elapsed
+
+    def account_exec(self, elapsed):
+        self.day_stats().cpu_exec += elapsed
+
+def _load_json(path, default):
+    try:
+        with _real_open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def _prepare_data(data_root, programs_file, settings_file, log_level):
+    """
+    Crea la directory /data simulata con programmi e impostazioni.
+    """
+    data_dir = os.path.join(data_root, 'data')
+    os.makedirs(os.path.join(data_dir, 'logs'))
+    settings = _load_json(settings_file, {})
+    settings['automatic_programs_enabled'] = True
+    settings['log_level'] = log_level
+    programs = _load_json(programs_file, {})
+    with _real_open(os.path.join(data_dir, 'user_settings.json'), 'w') as f:
+        json.dump(settings, f)
+    with _real_open(os.path.join(data_dir, 'program.json'), 'w') as f:
+        json.dump(programs, f)
+    return settings
+
+async def _scheduler_loop(sch):
+    """
+    Equivalente di main.program_check_loop, senza la gestione degli errori.
+    """
+    while True:
+        await sch.check_programs()
+        await sch.wait_next_activation()
+
+async def _day_monitor(sim, pm, time_utils):
+    """
+    A fine giornata confronta le esecuzioni avviate con quelle attese.
+    Un'attivazione è attesa se il programma è pianificabile, il mese è attivo
+    e dall'ultimo avvio sono trascorsi almeno interval_days giorni.
+    """
+    for day in range(sim.start_day, sim.start_day + sim.days):
+        await asyncio.sleep(time_utils.day_start(day + 1) - clock.now())
+        month = time_utils.month_of_day(day)
+        stats = sim.day_stats(day)
+        for pid, program in pm.get_compiled_programs().items():
+            if not program.is_schedulable() or not program.is_active_in_month(month):
+                continue
+            if (pid, day) in sim.starts:
+                sim.last_start[pid] = day
+                continue
+            last = sim.last_start.get(pid, program.last_run_day)
+            if last is None or day - last >= program.interval_days:
+                stats.missed.append(pid)
+
+def _format_ts(time_utils, ts):
+    return time_utils.format_date(int(ts) // 86400) + ' ' + time_utils.format_time(int(ts))
+
+def run(args):
+    data_root = tempfile.mkdtemp(prefix='irrigator-sim-')
+    cwd = os.getcwd()
+    try:
+        settings = _prepare_data(data_root, args.programs, args.settings, args.log_level)
+        _install_shims(data_root)
+        # Come sul dispositivo, la directory corrente è la radice del filesystem
+        os.chdir(data_root)
+
+        import time_utils
+        start_day = time_utils.parse_date(args.start)
+        if start_day is None:
+            raise SystemExit("Data di inizio non valida: " + args.start)
+        clock.base = time_utils.day_start(start_day)
+
+        import zone_manager
+        import program_execution as pe
+        import program_manager as pm
+        import program_scheduling as sch
+
+        sim = Simulation(start_day, args.days)
+        execute_program = pe.execute_program
+
+        async def timed_execute_program(program, manual=False):
+            pid = str(program.get('id'))
+            day = int(clock.now()) // 86400
+            stats = sim.day_stats(day)
+            stats.runs += 1
+            sim.starts[(pid, day)] = clock.now()
+            compiled = pm.get_compiled_programs().get(pid)
+            if compiled is not None and compiled.start_minute is not None:
+                delay = clock.now() - time_utils.day_start(day) - compiled.start_minute * 60
+                stats.max_delay = max(stats.max_delay, delay)
+            return await _Timed(execute_program(program, manual), sim.account_exec)
+
+        pe.execute_program = timed_execute_program
+
+        async def main():
+            zone_manager.initialize_pins()
+            sim.first_event = len(Pin.events)
+            monitor = asyncio.create_task(_day_monitor(sim, pm, time_utils))
+            scheduler = asyncio.create_task(_scheduler_coro())
+            await monitor
+            scheduler.cancel()
+            try:
+                await scheduler
+            except asyncio.CancelledError:
+                pass
+
+        async def _scheduler_coro():
+            await _Timed(_scheduler_loop(sch), sim.account_total)
+
+        loop = VirtualEventLoop()
+        wall_start = _perf()
+        try:
+            loop.run_until_complete(main())
+        finally:
+            loop.close()
+        wall = _perf() - wall_start
+
+        _report(args, sim, settings, time_utils, wall)
+    finally:
+        builtins.open = _real_open
+        os.chdir(cwd)
+        shutil.rmtree(data_root, ignore_errors=True)
+
+def _report(args, sim, settings, time_utils, wall):
+    """
+    Stampa timeline, riepilogo giornaliero e totali.
+    """
+    zones = {}
+    for zone in settings.get('zones', []):
+        if isinstance(zone, dict) and zone.get('pin') is not None:
+            zones[zone['pin']] = 'zona %s' % zone.get('id')
+    safety_pin = settings.get('safety_relay', {}).get('pin')
+    if safety_pin is not None:
+        zones[safety_pin] = 'relè sicurezza'
+
+    if args.timeline:
+        print("# timeline")
+        for ts, pin, level in Pin.events[sim.first_event:]:
+            # Relè a logica attiva bassa: livello 0 = aperto
+            print(_format_ts(time_utils, ts), zones.get(pin, 'pin %s' % pin),
+                  'aperta' if level == 0 else 'chiusa')
+
+    print("# giorno, esecuzioni, mancate, ritardo_max_s, cpu_scheduler_ms, id_mancati")
+    runs = missed = 0
+    cpu = 0.0
+    for day in range(sim.start_day, sim.start_day + sim.days):
+        stats = sim.stats.get(day) or DayStats()
+        scheduler_cpu = max(0.0, stats.cpu_total - stats.cpu_exec)
+        runs += stats.runs
+        missed += len(stats.missed)
+        cpu += scheduler_cpu
+        if stats.runs or stats.missed or args.all_days:
+            print("%s, %d, %d, %d, %.3f, %s" % (
+                time_utils.format_date(day), stats.runs, len(stats.missed),
+                stats.max_delay, scheduler_cpu * 1000, ' '.join(stats.missed)))
+
+    print("# totale: %d giorni, %d esecuzioni, %d mancate, cpu scheduler %.1f ms, "
+          "tempo reale %.2f s" % (sim.days, runs, missed, cpu * 1000, wall))
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulatore accelerato della pianificazione")
+    parser.add_argument('--programs', default=os.path.join(REPO_DIR, 'data', 'program.json'),
+                        help="File dei programmi (formato program.json)")
+    parser.add_argument('--settings', default=os.path.join(REPO_DIR, 'data', 'user_settings.json'),
+                        help="File delle impostazioni utente")
+    parser.add_argument('--start', default='2026-01-01', help="Primo giorno simulato (YYYY-MM-DD)")
+    parser.add_argument('--days', type=int, default=365, help="Numero di giorni da simulare")
+    parser.add_argument('--timeline', action='store_true', help="Stampa apertura e chiusura delle zone")
+    parser.add_argument('--all-days', action='store_true', help="Riepilogo anche dei giorni senza eventi")
+    parser.add_argument('--log-level', default='WARNING', help="Soglia dei log del firmware")
+    run(parser.parse_args())
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,6 @@
 """
 Modulo di utilità con funzioni comuni usate in più parti del sistema.
 """
-import time
 import gc
 import uos as os
 
@@ -29,62 +28,6 @@ def join_path(path1, path2):
         return path1 + path2
     return path1 + '/' + path2
     
-def day_of_year(year, month, day):
-    """
-    Calcola il giorno dell'anno da una data.
-    
-    Args:
-        year: Anno
-        month: Mese
-        day: Giorno
-        
-    Returns:
-        int: Giorno dell'anno (1-366)
-    """
-    days_in_month = [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-    
-    # Gestione anno bisestile
-    if is_leap_year(year):
-        days_in_month[2] = 29
-    
-    day_of_year = day
-    for i in range(1, month):
-        day_of_year += days_in_month[i]
-    
-    return day_of_year
-
-def is_leap_year(year):
-    """
-    Verifica se un anno è bisestile.
-    
-    Args:
-        year: Anno da verificare
-        
-    Returns:
-        boolean: True se l'anno è bisestile, False altrimenti
-    """
-    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
-
-def get_current_date():
-    """
-    Ottiene la data corrente nel formato YYYY-MM-DD.
-    
-    Returns:
-        str: Data formattata
-    """
-    t = time.localtime()
-    return f"{t[0]}-{t[1]:02d}-{t[2]:02d}"
-
-def get_current_time():
-    """
-    Ottiene l'ora corrente nel formato HH:MM:SS.
-    
-    Returns:
-        str: Ora formattata
-    """
-    t = time.localtime()
-    return f"{t[3]:02d}:{t[4]:02d}:{t[5]:02d}"
-
 def ensure_directory_exists(path):
     """
     Assicura che una directory esista, creandola se necessario.
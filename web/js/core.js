@@ -6,7 +6,6 @@ console.log("Caricamento bundle core.js");
 window.IrrigationCore = window.IrrigationCore || {
     apiCache: new Map(),
     API_CACHE_TTL: 10000, // 10 secondi
-    PROGRAM_STATUS_POLLING_INTERVAL: 5000, // 5 secondi
     activePollingTimers: new Set()
 };
 
@@ -41,6 +40,14 @@ const IrrigationUtils = {
         return recurrenceMap[recurrence] || recurrence;
     },
 
+    formatLastRun(program) {
+        // last_run_day è il numero di giorni dall'epoch Unix
+        if (program && Number.isInteger(program.last_run_day)) {
+            return new Date(program.last_run_day * 86400000).toISOString().slice(0, 10);
+        }
+        return (program && program.last_run_date) || 'Mai eseguito';
+    },
+
     updateDateTime() {
         const dateElement = document.getElementById('date');
         const timeElement = document.getElementById('time');
@@ -183,14 +190,12 @@ window.IrrigationUI = IrrigationUI;
 const IrrigationAPI = {
     async apiCall(endpoint, method = 'GET', data = null, retryCount = 0, maxRetries = 2) {
         const cacheKey = method === 'GET' ? endpoint : null;
+        const cached = cacheKey ? window.IrrigationCore.apiCache.get(cacheKey) : null;
         
         // Check cache for GET requests
-        if (cacheKey && window.IrrigationCore.apiCache.has(cacheKey)) {
-            const cached = window.IrrigationCore.apiCache.get(cacheKey);
-            if (Date.now() - cached.timestamp < window.IrrigationCore.API_CACHE_TTL) {
-                console.log(`Usando cache per ${endpoint}`);
-                return cached.data;
-            }
+        if (cached && Date.now() - cached.timestamp < window.IrrigationCore.API_CACHE_TTL) {
+            console.log(`Usando cache per ${endpoint}`);
+            return cached.data;
         }
         
         const options = {
@@ -198,6 +203,11 @@ const IrrigationAPI = {
             headers: {}
         };
         
+        // Richiesta condizionale: se i dati non sono cambiati il server risponde 304 senza corpo
+        if (cached && cached.etag) {
+            options.headers['If-None-Match'] = cached.etag;
+        }
+        
         if (data) {
             options.headers['Content-Type'] = 'application/json';
             options.body = JSON.stringify(data);
@@ -205,6 +215,10 @@ const IrrigationAPI = {
         
         try {
             const response = await fetch(endpoint, options);
+            if (response.status === 304 && cached) {
+                cached.timestamp = Date.now();
+                return cached.data;
+            }
             if (!response.ok) throw new Error(`HTTP ${response.status}`);
             const result = await response.json();
             
@@ -212,6 +226,7 @@ const IrrigationAPI = {
             if (cacheKey) {
                 window.IrrigationCore.apiCache.set(cacheKey, {
                     data: result,
+                    etag: response.headers.get('ETag'),
                     timestamp: Date.now()
                 });
             }
@@ -352,7 +367,7 @@ const IrrigationRouter = {
         contentElement.innerHTML = '<div class="loading-indicator">Caricamento...</div>';
         
         try {
-            const response = await fetch(`${pageName}?_=${Date.now()}`);
+            const response = await fetch(window.assetUrl(pageName));
             if (!response.ok) throw new Error(`HTTP ${response.status}`);
             
             const html = await response.text();
@@ -409,7 +424,7 @@ const IrrigationRouter = {
         
         try {
             const script = document.createElement('script');
-            script.src = `${modulePath}?_=${Date.now()}`;
+            script.src = window.assetUrl(modulePath);
             
             await new Promise((resolve, reject) => {
                 script.onload = resolve;
@@ -651,6 +666,9 @@ const IrrigationProgram = {
             program.interval_days = intervalDays;
         }
         
+        const parallelInput = document.getElementById('parallel-groups');
+        if (parallelInput) program.parallel_groups = parallelInput.checked;
+        
         return program;
     },
 
@@ -704,6 +722,9 @@ const IrrigationProgram = {
             });
         }
         
+        const parallelInput = document.getElementById('parallel-groups');
+        if (parallelInput) parallelInput.checked = !!program.parallel_groups;
+        
         // Select zones and set durations
         if (program.steps?.length) {
             program.steps.forEach(step => {
@@ -729,9 +750,210 @@ const IrrigationProgram = {
 
 window.IrrigationProgram = IrrigationProgram;
 
+// ==================== STATUS-FEED.JS ====================
+// Unica richiesta long-poll a /status condivisa da banner e pagine: il server risponde
+// solo quando zone, programma o passo in corso cambiano (o alla scadenza del timeout)
+const IrrigationStatusFeed = {
+    LONG_POLL_TIMEOUT: 25, // secondi, lato server
+    MAX_RETRY_DELAY: 30000,
+    version: null,
+    lastStatus: null,
+    receivedAt: 0,
+    listeners: new Set(),
+    running: false,
+    generation: 0, // Identifica il ciclo run() attivo: i cicli precedenti terminano
+    controller: null,
+
+    subscribe(listener) {
+        this.listeners.add(listener);
+        if (this.lastStatus) {
+            try {
+                listener(this.lastStatus);
+            } catch (error) {
+                console.error('Errore nel gestore dello stato:', error);
+            }
+        }
+        this.start();
+        return () => {
+            this.listeners.delete(listener);
+            // Nessun iscritto: chiudi la richiesta in attesa sul server
+            if (this.listeners.size === 0) this.stop();
+        };
+    },
+
+    start() {
+        if (this.running) return;
+        this.running = true;
+        this.run(++this.generation);
+    },
+
+    stop() {
+        this.running = false;
+        this.generation++;
+        if (window.IrrigationEvents) window.IrrigationEvents.wake();
+        if (this.controller) {
+            this.controller.abort();
+            this.controller = null;
+        }
+    },
+
+    isCurrent(generation) {
+        return this.running && generation === this.generation;
+    },
+
+    // Secondi residui di un valore ricevuto, scalati del tempo trascorso dalla risposta
+    elapsedRemaining(seconds) {
+        const elapsed = Math.floor((Date.now() - this.receivedAt) / 1000);
+        return Math.max(0, (seconds || 0) - elapsed);
+    },
+
+    async run(generation) {
+        let failures = 0;
+        
+        // stop() seguito da start() prima che la fetch interrotta termini avvia un nuovo
+        // ciclo: quello vecchio se ne accorge dalla generazione ed esce
+        while (this.isCurrent(generation)) {
+            let query = this.version === null
+                ? ''
+                : `?since=${this.version}&timeout=${this.LONG_POLL_TIMEOUT}`;
+            
+            // Con /events aperto lo stato si rilegge solo dopo un evento (o allo scadere
+            // dell'attesa, per i cambi non notificati come i nomi delle zone)
+            const events = window.IrrigationEvents;
+            if (this.version !== null && events && events.isConnected()) {
+                await events.waitForChange(this.LONG_POLL_TIMEOUT * 1000);
+                if (!this.isCurrent(generation)) break;
+                query = `?since=${this.version}&timeout=0`;
+            }
+            const controller = new AbortController();
+            this.controller = controller;
+            
+            try {
+                const response = await fetch(`/status${query}`, {
+                    signal: controller.signal,
+                    cache: 'no-store'
+                });
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                
+                const status = await response.json();
+                if (!this.isCurrent(generation)) break;
+                failures = 0;
+                
+                // Scadenza del timeout senza cambiamenti: nessuna notifica
+                if (status.version === this.version) continue;
+                
+                this.version = status.version;
+                this.lastStatus = status;
+                this.receivedAt = Date.now();
+                this.listeners.forEach(listener => {
+                    try {
+                        listener(status);
+                    } catch (error) {
+                        console.error('Errore nel gestore dello stato:', error);
+                    }
+                });
+            } catch (error) {
+                if (error.name === 'AbortError' || !this.isCurrent(generation)) continue;
+                
+                console.error('Errore nel recupero dello stato:', error);
+                failures++;
+                this.version = null; // Dopo un errore chiedi subito lo stato completo
+                const delay = Math.min(this.MAX_RETRY_DELAY, 1000 * Math.pow(2, failures));
+                await new Promise(resolve => setTimeout(resolve, delay));
+            }
+        }
+    }
+};
+
+window.IrrigationStatusFeed = IrrigationStatusFeed;
+
+// ==================== EVENTS.JS ====================
+// Notifiche push da /events (Server-Sent Events): ogni evento viene ripubblicato
+// sul document come 'irrigation:<tipo>' (zone, step, program, log)
+// Finché il canale è aperto IrrigationStatusFeed non tiene aperto il long-poll di /status
+// ma rilegge lo stato a ogni evento: il browser usa una sola connessione verso il controller
+const IrrigationEvents = {
+    EVENT_TYPES: ['zone', 'step', 'program', 'log'],
+    source: null,
+    connected: false,
+    waiters: [],
+
+    start() {
+        if (this.source || typeof EventSource === 'undefined') return;
+        
+        // Il browser si riconnette da solo, con l'attesa indicata dal server
+        this.source = new EventSource('/events');
+        this.source.onopen = () => {
+            this.connected = true;
+        };
+        this.source.onerror = () => {
+            // Connessione persa o rifiutata (503): lo stato torna al long-poll
+            this.connected = false;
+            this.wake();
+        };
+        this.EVENT_TYPES.forEach(type => {
+            this.source.addEventListener(type, event => this.dispatch(type, event));
+        });
+    },
+
+    stop() {
+        if (this.source) {
+            this.source.close();
+            this.source = null;
+        }
+        this.connected = false;
+        this.wake();
+    },
+
+    isConnected() {
+        return this.connected;
+    },
+
+    // Attende il prossimo evento di zone o programmi, al più "timeout" millisecondi
+    waitForChange(timeout) {
+        return new Promise(resolve => {
+            const waiter = () => {
+                clearTimeout(timer);
+                resolve();
+            };
+            const timer = setTimeout(() => {
+                this.waiters = this.waiters.filter(w => w !== waiter);
+                resolve();
+            }, timeout);
+            this.waiters.push(waiter);
+        });
+    },
+
+    wake() {
+        const waiters = this.waiters;
+        this.waiters = [];
+        waiters.forEach(waiter => waiter());
+    },
+
+    dispatch(type, event) {
+        let data;
+        try {
+            data = JSON.parse(event.data);
+        } catch (error) {
+            console.error('Evento non valido:', event.data);
+            return;
+        }
+        
+        if (type === 'log' && data.level === 'ERROR') {
+            IrrigationUI.showToast(`Errore: ${data.message}`, 'error');
+        }
+        
+        document.dispatchEvent(new CustomEvent(`irrigation:${type}`, { detail: data }));
+        if (type !== 'log') this.wake();
+    }
+};
+
+window.IrrigationEvents = IrrigationEvents;
+
 // ==================== STATUS.JS ====================
 const IrrigationStatus = {
-    programStatusInterval: null,
+    unsubscribeFeed: null,
+    bannerTimer: null,
     lastProgramState: null,
 
     checkProgramStatus() {
@@ -817,33 +1039,53 @@ const IrrigationStatus = {
         }
     },
 
-    startProgramStatusPolling() {
-        console.log("Avvio polling stato programma");
+    // Aggiornamento ricevuto dal long-poll condiviso
+    handleStatusUpdate(status) {
+        const state = status.program_state;
+        if (!state) return;
         
-        // Assicurati di fermare polling esistente
-        this.stopProgramStatusPolling();
+        this.lastProgramState = state;
+        this.updateProgramStatusBanner(state);
+        this.updateBannerTimer(state);
+        
+        document.dispatchEvent(new CustomEvent('programStatusChanged', { detail: state }));
+    },
+
+    // Il tempo residuo nel banner scorre localmente: il server notifica solo i cambi di stato
+    updateBannerTimer(state) {
+        if (this.bannerTimer) {
+            clearInterval(this.bannerTimer);
+            this.bannerTimer = null;
+        }
+        if (!state.program_running || !state.active_zone) return;
         
-        // Controlla immediatamente
-        this.checkProgramStatus();
+        const remaining = state.active_zone.remaining_time || 0;
+        this.bannerTimer = setInterval(() => {
+            const activeZone = Object.assign({}, state.active_zone, {
+                remaining_time: IrrigationStatusFeed.elapsedRemaining(remaining)
+            });
+            this.updateActiveZoneInfo(Object.assign({}, state, { active_zone: activeZone }));
+        }, 1000);
+    },
+
+    startProgramStatusPolling() {
+        console.log("Avvio monitoraggio stato programma");
         
-        // Crea nuovo intervallo mantenendo il contesto
-        this.programStatusInterval = setInterval(() => {
-            this.checkProgramStatus();
-        }, window.IrrigationCore.PROGRAM_STATUS_POLLING_INTERVAL);
+        // Assicurati di fermare un monitoraggio esistente
+        this.stopProgramStatusPolling();
         
-        // Track timer for cleanup
-        if (window.IrrigationCore) {
-            window.IrrigationCore.activePollingTimers.add(this.programStatusInterval);
-        }
+        this.unsubscribeFeed = IrrigationStatusFeed.subscribe(this.handleStatusUpdate);
+        IrrigationEvents.start();
     },
 
     stopProgramStatusPolling() {
-        if (this.programStatusInterval) {
-            clearInterval(this.programStatusInterval);
-            if (window.IrrigationCore) {
-                window.IrrigationCore.activePollingTimers.delete(this.programStatusInterval);
-            }
-            this.programStatusInterval = null;
+        if (this.unsubscribeFeed) {
+            this.unsubscribeFeed();
+            this.unsubscribeFeed = null;
+        }
+        if (this.bannerTimer) {
+            clearInterval(this.bannerTimer);
+            this.bannerTimer = null;
         }
     },
 
@@ -856,6 +1098,7 @@ const IrrigationStatus = {
 IrrigationStatus.startProgramStatusPolling = IrrigationStatus.startProgramStatusPolling.bind(IrrigationStatus);
 IrrigationStatus.stopProgramStatusPolling = IrrigationStatus.stopProgramStatusPolling.bind(IrrigationStatus);
 IrrigationStatus.checkProgramStatus = IrrigationStatus.checkProgramStatus.bind(IrrigationStatus);
+IrrigationStatus.handleStatusUpdate = IrrigationStatus.handleStatusUpdate.bind(IrrigationStatus);
 
 window.IrrigationStatus = IrrigationStatus;
 
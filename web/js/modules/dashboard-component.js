@@ -250,6 +250,27 @@ const { useState, useEffect } = React;
 
     // Fetch data
     useEffect(() => {
+      const applyStatus = (status) => {
+        const state = status.program_state || {};
+        setSystemStatus({
+          programRunning: state.program_running || false,
+          activeProgram: state.current_program_id,
+          activeZone: state.active_zone
+        });
+        
+        const activeZones = {};
+        (status.zones || []).forEach(zone => {
+          if (zone.active) activeZones[zone.id] = zone;
+        });
+        setZones(prevZones => prevZones.map(zone => ({
+          ...zone,
+          active: !!activeZones[zone.id],
+          remainingTime: activeZones[zone.id] 
+            ? activeZones[zone.id].remaining_time / 60 
+            : 0
+        })));
+      };
+      
       const fetchData = async () => {
         try {
           setIsLoading(true);
@@ -316,6 +337,11 @@ const { useState, useEffect } = React;
             setLogs(logData.slice(-5).reverse());
           }
           
+          // Le zone appena ricostruite riprendono lo stato già ricevuto dal long-poll
+          if (window.IrrigationStatusFeed?.lastStatus) {
+            applyStatus(window.IrrigationStatusFeed.lastStatus);
+          }
+          
           setIsLoading(false);
         } catch (err) {
           console.error("Error loading dashboard data:", err);
@@ -326,7 +352,13 @@ const { useState, useEffect } = React;
       
       fetchData();
       
-      // Setup periodic refresh (every 5 seconds)
+      // Stato condiviso via long-poll: aggiorna zone e programma solo quando cambiano
+      const feed = window.IrrigationStatusFeed;
+      if (feed) {
+        return feed.subscribe(applyStatus);
+      }
+      
+      // Fallback: refresh periodico (ogni 5 secondi)
       const refreshInterval = setInterval(() => {
         fetchData();
       }, 5000);
@@ -1,6 +1,12 @@
 // Versione ottimizzata di logs.js
 let isLoadingLogs = false;
 let autoRefreshInterval = null;
+let currentLogs = [];      // Log visualizzati, dal più recente
+let logsTailCursor = null; // Cursore per richiedere solo i log nuovi
+let pendingLogsTimer = null; // Richiesta dei log ancora in attesa di scrittura sul server
+
+const LOGS_PAGE_SIZE = 200;
+const PENDING_LOGS_DELAY = 2000; // Il server scrive in background le voci più recenti
 
 function initializeLogsPage() {
     console.log("Inizializzazione pagina log");
@@ -11,20 +17,44 @@ function initializeLogsPage() {
 
 function startAutoRefresh() {
     stopAutoRefresh();
-    autoRefreshInterval = setInterval(loadLogs, 30000);
+    autoRefreshInterval = setInterval(loadNewLogs, 30000);
+    // I log di errore arrivano subito tramite /events
+    document.addEventListener('irrigation:log', loadNewLogs);
 }
 
 function stopAutoRefresh() {
+    if (pendingLogsTimer) {
+        clearTimeout(pendingLogsTimer);
+        pendingLogsTimer = null;
+    }
     if (autoRefreshInterval) {
         clearInterval(autoRefreshInterval);
         autoRefreshInterval = null;
     }
+    document.removeEventListener('irrigation:log', loadNewLogs);
 }
 
 function cleanupLogsPage() {
     stopAutoRefresh();
 }
 
+function fetchLogsPage(query) {
+    // Niente cache client: ogni cursore identifica una risposta diversa
+    return fetch(`/data/system_log.json?${query}`).then(response => {
+        if (!response.ok) throw new Error(`Errore HTTP: ${response.status}`);
+        return response.json();
+    }).then(result => {
+        // Voci non ancora su disco: arrivano con la prossima richiesta "after"
+        if (result.pending && autoRefreshInterval && !pendingLogsTimer) {
+            pendingLogsTimer = setTimeout(() => {
+                pendingLogsTimer = null;
+                loadNewLogs();
+            }, PENDING_LOGS_DELAY);
+        }
+        return result;
+    });
+}
+
 function loadLogs() {
     if (isLoadingLogs) return;
     isLoadingLogs = true;
@@ -37,18 +67,38 @@ function loadLogs() {
     
     logsBody.innerHTML = `<tr><td colspan="4" class="loading">Caricamento log...</td></tr>`;
     
-    (typeof IrrigationAPI !== 'undefined' && IrrigationAPI.apiCall 
-        ? IrrigationAPI.apiCall('/data/system_log.json')
-        : fetch('/data/system_log.json').then(response => {
-            if (!response.ok) throw new Error(`Errore HTTP: ${response.status}`);
-            return response.json();
-        })
-    )
-    .then(logs => displayLogs(logs))
+    fetchLogsPage(`limit=${LOGS_PAGE_SIZE}`)
+    .then(result => {
+        currentLogs = result.logs || [];
+        logsTailCursor = result.tail || null;
+        displayLogs(currentLogs);
+    })
     .catch(error => handleLogsError(error, logsBody))
     .finally(() => isLoadingLogs = false);
 }
 
+function loadNewLogs() {
+    // Senza cursore (primo caricamento fallito o nessun log) ricarica tutto
+    if (!logsTailCursor) {
+        loadLogs();
+        return;
+    }
+    if (isLoadingLogs) return;
+    isLoadingLogs = true;
+    
+    fetchLogsPage(`after=${encodeURIComponent(logsTailCursor)}&limit=${LOGS_PAGE_SIZE}`)
+    .then(result => {
+        logsTailCursor = result.tail || logsTailCursor;
+        const newLogs = result.logs || [];
+        if (newLogs.length === 0) return;
+        
+        currentLogs = newLogs.concat(currentLogs).slice(0, LOGS_PAGE_SIZE);
+        displayLogs(currentLogs);
+    })
+    .catch(error => console.error('Errore aggiornamento log:', error))
+    .finally(() => isLoadingLogs = false);
+}
+
 function handleLogsError(error, logsBody) {
     console.error('Errore:', error);
     const showToastFn = typeof IrrigationUI !== 'undefined' && IrrigationUI.showToast || showToast;
@@ -80,8 +130,7 @@ function displayLogs(logs) {
         return;
     }
     
-    logs.sort((a, b) => (b.date + ' ' + b.time).localeCompare(a.date + ' ' + a.time));
-    
+    // I log arrivano già ordinati dal più recente
     logsBody.innerHTML = logs.map(log => {
         const level = log.level || 'INFO';
         const levelClass = level.toLowerCase();
@@ -179,6 +228,7 @@ window.startAutoRefresh = startAutoRefresh;
 window.stopAutoRefresh = stopAutoRefresh;
 window.cleanupLogsPage = cleanupLogsPage;
 window.loadLogs = loadLogs;
+window.loadNewLogs = loadNewLogs;
 window.displayLogs = displayLogs;
 window.refreshLogs = refreshLogs;
 window.confirmClearLogs = confirmClearLogs;
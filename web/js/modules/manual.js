@@ -5,6 +5,7 @@ window.ManualPage = window.ManualPage || {
     maxZoneDuration: 180,
     maxActiveZones: 3,
     zoneStatusInterval: null,
+    unsubscribeStatus: null,
     activeZones: new Map(),
     disabledManualMode: false,
     POLL_INTERVAL: 1000,
@@ -214,7 +215,6 @@ function initializeManualPage(userData) {
     
     addManualStyles();
     startStatusPolling();
-    fetchProgramState();
     
     // Registra cleanup
     window.addEventListener('pagehide', cleanupManualPage, { once: true });
@@ -373,17 +373,36 @@ function addManualStyles() {
 
 function startStatusPolling() {
     stopStatusPolling();
+    
+    // Stato condiviso via long-poll: aggiornamenti solo quando zone o programma cambiano
+    const feed = window.IrrigationStatusFeed;
+    if (feed) {
+        window.ManualPage.unsubscribeStatus = feed.subscribe(handleStatusUpdate);
+        return;
+    }
+    
+    // Fallback se core.js non è disponibile
     fetchZonesStatus();
+    fetchProgramState();
     window.ManualPage.zoneStatusInterval = setInterval(fetchZonesStatus, window.ManualPage.POLL_INTERVAL);
 }
 
 function stopStatusPolling() {
+    if (window.ManualPage.unsubscribeStatus) {
+        window.ManualPage.unsubscribeStatus();
+        window.ManualPage.unsubscribeStatus = null;
+    }
     if (window.ManualPage.zoneStatusInterval) {
         clearInterval(window.ManualPage.zoneStatusInterval);
         window.ManualPage.zoneStatusInterval = null;
     }
 }
 
+function handleStatusUpdate(status) {
+    updateZonesUI(status.zones);
+    handleProgramState(status.program_state);
+}
+
 function cleanupManualPage() {
     console.log("Cleanup pagina manuale");
     
@@ -631,7 +650,7 @@ async function activateZone(zoneId, duration) {
                 `;
             }
             
-            fetchZonesStatus();
+            if (!window.ManualPage.unsubscribeStatus) fetchZonesStatus();
         } else {
             showToastMessage(`Errore: ${data.error || 'Attivazione zona fallita'}`, 'error');
             
@@ -701,7 +720,7 @@ async function deactivateZone(zoneId) {
             }
             
             resetProgressBar(zoneId);
-            fetchZonesStatus();
+            if (!window.ManualPage.unsubscribeStatus) fetchZonesStatus();
         } else {
             showToastMessage(`Errore: ${data.error || 'Disattivazione zona fallita'}`, 'error');
             
@@ -169,6 +169,9 @@ function populateProgramFormFallback(program) {
         });
     }
     
+    const parallelInput = document.getElementById('parallel-groups');
+    if (parallelInput) parallelInput.checked = !!program.parallel_groups;
+    
     // Select zones and set durations
     if (program.steps?.length) {
         program.steps.forEach(step => {
@@ -287,6 +290,9 @@ function collectProgramDataFallback() {
         program.months.push(item.dataset.month);
     });
     
+    const parallelInput = document.getElementById('parallel-groups');
+    if (parallelInput) program.parallel_groups = parallelInput.checked;
+    
     // Collect zones
     document.querySelectorAll('.zone-checkbox:checked').forEach(checkbox => {
         const zoneId = parseInt(checkbox.dataset.zoneId);
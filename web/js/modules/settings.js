@@ -119,6 +119,9 @@ function loadSettingsWithData(data) {
     const safetyRelayPinInput = document.getElementById('safety-relay-pin');
     if (safetyRelayPinInput) safetyRelayPinInput.value = safetyRelayPin;
     
+    const logLevelInput = document.getElementById('log-level');
+    if (logLevelInput) logLevelInput.value = data.log_level || 'INFO';
+    
     // Resetta i flag delle modifiche
     window.SettingsPage.settingsModified = { wifi: false, zones: false, advanced: false };
 }
@@ -137,7 +140,7 @@ function addChangeListeners() {
     });
     
     // Advanced settings
-    ['max-active-zones', 'activation-delay', 'max-zone-duration', 'safety-relay-pin'].forEach(id => {
+    ['max-active-zones', 'activation-delay', 'max-zone-duration', 'safety-relay-pin', 'log-level'].forEach(id => {
         const element = document.getElementById(id);
         if (element) {
             element.addEventListener('change', () => window.SettingsPage.settingsModified.advanced = true);
@@ -474,6 +477,7 @@ async function saveAdvancedSettings() {
         const activationDelay = parseInt(document.getElementById('activation-delay')?.value) || 0;
         const maxZoneDuration = parseInt(document.getElementById('max-zone-duration')?.value) || 180;
         const safetyRelayPin = parseInt(document.getElementById('safety-relay-pin')?.value) || 13;
+        const logLevel = document.getElementById('log-level')?.value || 'INFO';
         
         // Validazione
         if (maxActiveZones < 1 || maxActiveZones > 8) {
@@ -497,6 +501,7 @@ async function saveAdvancedSettings() {
             activation_delay: activationDelay,
             max_zone_duration: maxZoneDuration,
             safety_relay: { pin: safetyRelayPin },
+            log_level: logLevel,
             automatic_programs_enabled: true // Mantenuto per compatibilità
         };
         
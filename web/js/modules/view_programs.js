@@ -2,12 +2,12 @@
 // Namespace per evitare conflitti
 window.ViewProgramsPage = window.ViewProgramsPage || {
     statusInterval: null,
+    unsubscribeStatus: null,
+    runningTimer: null,
     programsData: {},
     zoneNameMap: {},
     lastKnownState: null,
-    pollingAccelerated: false,
     NORMAL_POLLING_INTERVAL: 5000,
-    FAST_POLLING_INTERVAL: 1000,
     abortControllers: new Map(),
     zoneProgressData: {}
 };
@@ -370,48 +370,33 @@ function cleanupViewProgramsPage() {
 function startProgramStatusPolling() {
     stopProgramStatusPolling();
     
-    // Prima esecuzione immediata
-    fetchProgramState();
-    
-    // Setup intervallo
-    const pollingInterval = window.ViewProgramsPage.lastKnownState?.program_running 
-        ? window.ViewProgramsPage.FAST_POLLING_INTERVAL 
-        : window.ViewProgramsPage.NORMAL_POLLING_INTERVAL;
-    
-    window.ViewProgramsPage.statusInterval = setInterval(fetchProgramState, pollingInterval);
-    
-    // Gestione visibilità pagina
-    document.addEventListener('visibilitychange', handleVisibilityChange);
-}
-
-function handleVisibilityChange() {
-    if (!window.ViewProgramsPage.statusInterval) return;
-    
-    stopProgramStatusPolling();
-    
-    if (document.hidden) {
-        // Polling più lento quando la pagina non è visibile
-        window.ViewProgramsPage.statusInterval = setInterval(
-            fetchProgramState, 
-            window.ViewProgramsPage.NORMAL_POLLING_INTERVAL * 2
-        );
-    } else {
-        // Ripristina polling normale
-        const newInterval = window.ViewProgramsPage.lastKnownState?.program_running 
-            ? window.ViewProgramsPage.FAST_POLLING_INTERVAL 
-            : window.ViewProgramsPage.NORMAL_POLLING_INTERVAL;
-        
-        fetchProgramState(); // Aggiornamento immediato
-        window.ViewProgramsPage.statusInterval = setInterval(fetchProgramState, newInterval);
+    // Stato condiviso via long-poll: aggiornamenti solo quando il programma o il passo cambiano
+    const feed = window.IrrigationStatusFeed;
+    if (feed) {
+        window.ViewProgramsPage.unsubscribeStatus = feed.subscribe(status => {
+            if (status.program_state) applyProgramState(status.program_state);
+        });
+        return;
     }
+    
+    // Fallback se core.js non è disponibile
+    fetchProgramState();
+    window.ViewProgramsPage.statusInterval = setInterval(
+        fetchProgramState, 
+        window.ViewProgramsPage.NORMAL_POLLING_INTERVAL
+    );
 }
 
 function stopProgramStatusPolling() {
+    if (window.ViewProgramsPage.unsubscribeStatus) {
+        window.ViewProgramsPage.unsubscribeStatus();
+        window.ViewProgramsPage.unsubscribeStatus = null;
+    }
     if (window.ViewProgramsPage.statusInterval) {
         clearInterval(window.ViewProgramsPage.statusInterval);
         window.ViewProgramsPage.statusInterval = null;
     }
-    document.removeEventListener('visibilitychange', handleVisibilityChange);
+    stopRunningTimer();
 }
 
 async function fetchProgramState() {
@@ -425,30 +410,7 @@ async function fetchProgramState() {
         const state = await response.json();
         
         if (state && typeof state === 'object') {
-            const previousState = window.ViewProgramsPage.lastKnownState;
-            window.ViewProgramsPage.lastKnownState = state;
-            
-            console.log("Stato programma ricevuto:", state);
-            
-            updateProgramsUI(state);
-            
-            // Gestione transizioni di stato
-            if (state.program_running && state.current_program_id) {
-                updateRunningProgramStatus(state);
-                
-                if (!previousState?.program_running && !window.ViewProgramsPage.pollingAccelerated) {
-                    acceleratePolling();
-                }
-                
-                showGlobalStopButton(state);
-            } else {
-                hideRunningStatus();
-                hideGlobalStopButton();
-                
-                if (previousState?.program_running && window.ViewProgramsPage.pollingAccelerated) {
-                    restoreNormalPolling();
-                }
-            }
+            applyProgramState(state);
         }
     } catch (error) {
         if (error.name !== 'AbortError') {
@@ -459,33 +421,46 @@ async function fetchProgramState() {
     }
 }
 
-function acceleratePolling() {
-    if (window.ViewProgramsPage.pollingAccelerated) return;
+function applyProgramState(state) {
+    window.ViewProgramsPage.lastKnownState = state;
     
-    console.log("Accelerazione polling per monitoraggio stato");
-    window.ViewProgramsPage.pollingAccelerated = true;
+    console.log("Stato programma ricevuto:", state);
     
-    stopProgramStatusPolling();
-    window.ViewProgramsPage.statusInterval = setInterval(
-        fetchProgramState, 
-        window.ViewProgramsPage.FAST_POLLING_INTERVAL
-    );
+    updateProgramsUI(state);
     
-    // Torna al polling normale dopo 15 secondi
-    setTimeout(restoreNormalPolling, 15000);
+    stopRunningTimer();
+    
+    if (state.program_running && state.current_program_id) {
+        updateRunningProgramStatus(state);
+        startRunningTimer(state);
+        showGlobalStopButton(state);
+    } else {
+        hideRunningStatus();
+        hideGlobalStopButton();
+    }
 }
 
-function restoreNormalPolling() {
-    if (!window.ViewProgramsPage.pollingAccelerated) return;
+// Il tempo residuo scorre localmente tra un aggiornamento di stato e il successivo
+function startRunningTimer(state) {
+    if (!state.active_zone) return;
     
-    console.log("Ripristino polling normale");
-    window.ViewProgramsPage.pollingAccelerated = false;
+    const receivedAt = Date.now();
+    const remaining = state.active_zone.remaining_time || 0;
     
-    stopProgramStatusPolling();
-    window.ViewProgramsPage.statusInterval = setInterval(
-        fetchProgramState, 
-        window.ViewProgramsPage.NORMAL_POLLING_INTERVAL
-    );
+    window.ViewProgramsPage.runningTimer = setInterval(() => {
+        const elapsed = Math.floor((Date.now() - receivedAt) / 1000);
+        const activeZone = Object.assign({}, state.active_zone, {
+            remaining_time: Math.max(0, remaining - elapsed)
+        });
+        updateRunningProgramStatus(Object.assign({}, state, { active_zone: activeZone }));
+    }, 1000);
+}
+
+function stopRunningTimer() {
+    if (window.ViewProgramsPage.runningTimer) {
+        clearInterval(window.ViewProgramsPage.runningTimer);
+        window.ViewProgramsPage.runningTimer = null;
+    }
 }
 
 async function loadUserSettingsAndPrograms() {
@@ -621,7 +596,7 @@ function createProgramCard(program, programId, state) {
                 <span class="info-value">${formatRecurrence(program.recurrence, program.interval_days)}</span>
                 
                 <span class="info-label">Ultima esecuzione:</span>
-                <span class="info-value">${program.last_run_date || 'Mai eseguito'}</span>
+                <span class="info-value">${formatLastRun(program)}</span>
             </div>
             
             <div class="tags-container">
@@ -898,6 +873,15 @@ function formatRecurrence(recurrence, interval_days) {
     return recurrenceMap[recurrence] || recurrence || 'Non impostata';
 }
 
+function formatLastRun(program) {
+    const utils = window.IrrigationUtils;
+    if (utils && utils.formatLastRun) {
+        return utils.formatLastRun(program);
+    }
+    
+    return program.last_run_date || 'Mai eseguito';
+}
+
 async function startProgram(programId) {
     const startBtn = document.querySelector(`.program-card[data-program-id="${programId}"] .btn-start`);
     if (startBtn) {
@@ -926,8 +910,7 @@ async function startProgram(programId) {
         
         if (data.success) {
             showToastMessage('Programma avviato con successo', 'success');
-            fetchProgramState();
-            acceleratePolling();
+            if (!window.ViewProgramsPage.unsubscribeStatus) fetchProgramState();
         } else {
             showToastMessage(`Errore: ${data.error || 'Errore sconosciuto'}`, 'error');
             if (startBtn) {
@@ -26,6 +26,14 @@ const PAGE_CONFIG = {
 };
 const DEFAULT_PAGE = 'dashboard.html';
 
+// Nome con hash del contenuto di un file, scritto in window.ASSET_MANIFEST da
+// tools/build_web.py: i file con hash restano nella cache del browser finché non cambiano.
+// Senza build il nome resta invariato.
+window.assetUrl = function(path) {
+    const manifest = window.ASSET_MANIFEST;
+    return (manifest && manifest[path]) || path;
+};
+
 // ==================== RILEVAMENTO PAGINA ====================
 function detectCurrentPage() {
     const contentElement = document.getElementById('content');
@@ -90,7 +98,7 @@ function loadModule(modulePath) {
         }
         
         const script = document.createElement('script');
-        script.src = `${modulePath}?v=${Date.now()}`;
+        script.src = window.assetUrl(modulePath);
         script.async = true;
         
         const timeout = setTimeout(() => {
@@ -223,7 +231,7 @@ async function initializeApp() {
         const contentElement = document.getElementById('content');
         if (contentElement) {
             try {
-                const response = await fetch('dashboard.html');
+                const response = await fetch(window.assetUrl('dashboard.html'));
                 if (response.ok) {
                     const html = await response.text();
                     contentElement.innerHTML = html;
@@ -316,7 +324,7 @@ async function emergencyLoadPage(pageName) {
     if (!contentElement) return;
     
     try {
-        const response = await fetch(pageName);
+        const response = await fetch(window.assetUrl(pageName));
         if (!response.ok) throw new Error(`HTTP ${response.status}`);
         
         const html = await response.text();
@@ -2,7 +2,7 @@
 Modulo principale per il server web.
 Gestisce l'inizializzazione del server e il routing delle richieste.
 """
-from microdot import Request, Microdot, Response, send_file
+from microdot import Request, Microdot, Response
 import uasyncio as asyncio
 from log_manager import log_event
 import gc
@@ -28,9 +28,12 @@ from api_handlers.wifi_api import (
 from api_handlers.settings_api import (
     get_user_settings, save_user_settings_route
 )
+from api_handlers.status_api import get_status_route, events_route
 
 # Importazioni da moduli di utilità
 from file_cache import get_cached_file, file_exists, clear_cache
+from static_assets import get_asset, IMMUTABLE_CACHE_CONTROL
+from etag import is_not_modified, not_modified
 
 # Configurazione
 HTML_BASE_PATH = '/web'
@@ -48,8 +51,6 @@ server_stats = {
     'requests_total': 0,
     'requests_error': 0,
     'last_request_time': 0,
-    'cache_hits': 0,
-    'cache_misses': 0,
     'gc_runs': 0
 }
 
@@ -158,6 +159,10 @@ app.route('/get_program_state', methods=['GET'])(api_handler(get_program_state))
 app.route('/toggle_program_automatic', methods=['POST'])(api_handler(toggle_program_automatic))
 app.route('/toggle_automatic_programs', methods=['POST'])(api_handler(toggle_automatic_programs))
 
+# API stato complessivo (long-poll) e notifiche push (Server-Sent Events)
+app.route('/status', methods=['GET'])(api_handler(get_status_route))
+app.route('/events', methods=['GET'])(api_handler(events_route))
+
 # API gestione sistema
 app.route('/data/system_log.json', methods=['GET'])(api_handler(get_system_logs))
 app.route('/clear_logs', methods=['POST'])(api_handler(clear_system_logs))
@@ -181,14 +186,58 @@ app.route('/save_user_settings', methods=['POST'])(api_handler(save_user_setting
 
 # -------- Route per file statici --------
 
+def asset_response(request, path):
+    """
+    Crea la risposta per un file prodotto da tools/build_web.py.
+    
+    Args:
+        request: Richiesta Microdot
+        path: Percorso richiesto, relativo a /web
+    
+    Returns:
+        Response or None: Risposta, None se il percorso non è nel manifest
+    """
+    asset = get_asset(path)
+    if asset is None:
+        return None
+    
+    file_path, content_type, etag, gzip, immutable = asset
+    compressed = gzip and 'gzip' in request.headers.get('Accept-Encoding', '')
+    if compressed:
+        # Le due codifiche sono rappresentazioni diverse: ETag distinti
+        file_path += '.gz'
+        etag = etag[:-1] + '-gz"'
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    
+    # Il nome (o il manifest) cambia con il contenuto: nessuna scadenza in cache
+    response_data = get_cached_file(file_path, content_type, ttl=None)
+    if not response_data:
+        return Response('File non trovato', status_code=404)
+    
+    headers = {
+        'Content-Type': content_type,
+        'ETag': etag,
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL if immutable else 'no-cache'
+    }
+    if gzip:
+        headers['Vary'] = 'Accept-Encoding'
+    if compressed:
+        headers['Content-Encoding'] = 'gzip'
+    return Response(response_data[0], headers=headers)
+
 @app.route('/', methods=['GET'])
 @api_handler
 async def index(request):
     """Route per servire la pagina principale."""
+    response = asset_response(request, 'main.html')
+    if response:
+        return response
+    
     response_data = get_cached_file('/web/main.html')
     if response_data:
         content, content_type = response_data
-        return Response(content, headers={'Content-Type': content_type})
+        return Response(content, headers={'Content-Type': content_type, 'Cache-Control': 'no-cache'})
     else:
         return Response('Errore caricamento pagina', status_code=500)
 
@@ -199,15 +248,18 @@ async def static_files(request, path):
     # Evita accesso a directory data
     if path.startswith('data/'):
         return Response('Not Found', status_code=404)
-
+    
+    response = asset_response(request, path)
+    if response:
+        return response
+    
+    # File non prodotti dalla build: serviti invariati, riconvalidati a ogni richiesta
     file_path = f'/web/{path}'
     response_data = get_cached_file(file_path)
     
     if response_data:
         content, content_type = response_data
-        return Response(content, headers={'Content-Type': content_type})
-    elif file_exists(file_path):
-        return send_file(file_path)
+        return Response(content, headers={'Content-Type': content_type, 'Cache-Control': 'no-cache'})
     else:
         return Response('File non trovato', status_code=404)
 
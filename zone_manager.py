@@ -7,11 +7,12 @@ import machine
 from machine import Pin
 import uasyncio as asyncio
 from settings_manager import load_user_settings
-from log_manager import log_event
+from log_manager import log_event, log_eventf
 from cache_manager import get_cached, invalidate_cache
+from event_bus import subscribe, publish, TOPIC_SETTINGS, TOPIC_ZONES
 
 # Variabili globali
-active_zones = {}      # Dizionario delle zone attive: {zone_id: {start_time, duration, task}}
+active_zones = {}      # Dizionario delle zone attive: {zone_id: {start_time, duration, task}} (task None se gestita da un programma)
 zone_pins = {}         # Cache dei pin GPIO: {zone_id: Pin}
 safety_relay = None    # Pin del relè master di sicurezza
 
@@ -25,6 +26,14 @@ def _load_settings_for_zones():
     """
     return load_user_settings()
 
+def _on_settings_saved(topic, event, data):
+    """
+    Callback di event_bus: nomi, visibilità e limiti delle zone possono essere cambiati.
+    """
+    invalidate_cache('zone_settings')
+
+subscribe(TOPIC_SETTINGS, _on_settings_saved)
+
 def initialize_pins():
     """
     Inizializza i pin del sistema di irrigazione.
@@ -36,7 +45,7 @@ def initialize_pins():
     
     settings = get_cached('zone_settings', _load_settings_for_zones, ttl=30)
     if not settings:
-        log_event("Errore: Impossibile caricare le impostazioni utente", "ERROR")
+        log_eventf("ERROR", "Errore: Impossibile caricare le impostazioni utente")
         print("Errore: Impossibile caricare le impostazioni utente.")
         return False
 
@@ -66,7 +75,7 @@ def initialize_pins():
 
     # Log collettivo per ridurre il numero di chiamate
     if initialized_zones > 0:
-        log_event(f"Inizializzate {initialized_zones} zone", "INFO")
+        log_eventf("INFO", "Inizializzate {} zone", initialized_zones)
     
     if errors:
         log_event(f"Errori inizializzazione pin: {', '.join(errors)}", "ERROR")
@@ -79,9 +88,9 @@ def initialize_pins():
             safety_relay_obj = Pin(safety_relay_pin, Pin.OUT)
             safety_relay_obj.value(1)  # Relè spento (logica attiva bassa)
             safety_relay = safety_relay_obj
-            log_event(f"Relè di sicurezza inizializzato sul pin {safety_relay_pin}", "INFO")
+            log_eventf("INFO", "Relè di sicurezza inizializzato sul pin {}", safety_relay_pin)
         except Exception as e:
-            log_event(f"Errore inizializzazione relè sicurezza: {e}", "ERROR")
+            log_eventf("ERROR", "Errore inizializzazione relè sicurezza: {}", e)
             safety_relay = None
     
     zone_pins = pins
@@ -141,7 +150,7 @@ def get_zones_status():
         
         return zones_status
     except Exception as e:
-        log_event(f"Errore in get_zones_status: {e}", "ERROR")
+        log_eventf("ERROR", "Errore in get_zones_status: {}", e)
         return []
 
 def get_active_zones_count():
@@ -153,13 +162,15 @@ def get_active_zones_count():
     """
     return len(active_zones)
 
-def start_zone(zone_id, duration):
+def start_zone(zone_id, duration, from_program=False):
     """
     Attiva una zona di irrigazione.
     
     Args:
         zone_id: ID della zona da attivare
         duration: Durata dell'attivazione in minuti
+        from_program: True se la richiesta arriva dall'esecuzione di un programma;
+            in quel caso non viene creato il timer, la chiusura spetta all'esecutore
         
     Returns:
         boolean: True se l'operazione è riuscita, False altrimenti
@@ -171,32 +182,31 @@ def start_zone(zone_id, duration):
         zone_id = int(zone_id)
         duration = int(duration)
     except (ValueError, TypeError):
-        log_event(f"Errore: parametri non validi per start_zone", "ERROR")
+        log_eventf("ERROR", "Errore: parametri non validi per start_zone")
         return False
     
-    # Verifica stato programma
-    from program_state import program_running, load_program_state
-    load_program_state()
-    if program_running:
-        log_event(f"Impossibile avviare zona {zone_id}: programma in esecuzione", "WARNING")
+    # Durante un programma solo l'esecutore può attivare zone
+    from program_state import state
+    if state.running and not from_program:
+        log_eventf("WARNING", "Impossibile avviare zona {}: programma in esecuzione", zone_id)
         return False
 
     # Controlla validità zona
     if zone_id not in zone_pins:
-        log_event(f"Errore: zona {zone_id} non trovata", "ERROR")
+        log_eventf("ERROR", "Errore: zona {} non trovata", zone_id)
         return False
     
     # Validazione durata
     settings = get_cached('zone_settings', _load_settings_for_zones, ttl=30)
     max_duration = settings.get('max_zone_duration', 180)
     if duration <= 0 or duration > max_duration:
-        log_event(f"Errore: durata non valida ({duration}) per zona {zone_id}", "ERROR")
+        log_eventf("ERROR", "Errore: durata non valida ({}) per zona {}", duration, zone_id)
         return False
     
     # Verifica limite zone attive
     max_active_zones = settings.get('max_active_zones', 1)
     if len(active_zones) >= max_active_zones and zone_id not in active_zones:
-        log_event(f"Limite massimo zone attive ({max_active_zones}) raggiunto", "WARNING")
+        log_eventf("WARNING", "Limite massimo zone attive ({}) raggiunto", max_active_zones)
         return False
 
     # Memorizza il task precedente se necessario
@@ -208,17 +218,17 @@ def start_zone(zone_id, duration):
     if safety_relay and not active_zones:
         try:
             safety_relay.value(0)  # Attiva il relè di sicurezza (logica attiva bassa)
-            log_event("Relè di sicurezza attivato", "INFO")
+            log_eventf("INFO", "Relè di sicurezza attivato")
         except Exception as e:
-            log_event(f"Errore attivazione relè sicurezza: {e}", "ERROR")
+            log_eventf("ERROR", "Errore attivazione relè sicurezza: {}", e)
             return False
 
     # Attiva la zona
     try:
         zone_pins[zone_id].value(0)  # Attiva la zona (logica attiva bassa)
-        log_event(f"Zona {zone_id} avviata per {duration} minuti", "INFO")
+        log_eventf("INFO", "Zona {} avviata per {} minuti", zone_id, duration)
     except Exception as e:
-        log_event(f"Errore attivazione zona {zone_id}: {e}", "ERROR")
+        log_eventf("ERROR", "Errore attivazione zona {}: {}", zone_id, e)
         
         # Ripristina relè sicurezza se necessario
         if safety_relay and not active_zones:
@@ -236,8 +246,10 @@ def start_zone(zone_id, duration):
         except Exception:
             pass
 
-    # Crea nuovo timer
-    task = asyncio.create_task(_zone_timer(zone_id, duration))
+    # Crea nuovo timer (non per le zone di un programma)
+    task = None
+    if not from_program:
+        task = asyncio.create_task(_zone_timer(zone_id, duration))
     
     # Aggiorna stato zona
     active_zones[zone_id] = {
@@ -245,6 +257,8 @@ def start_zone(zone_id, duration):
         'duration': duration,
         'task': task
     }
+    publish(TOPIC_ZONES, 'started', {'zone_id': zone_id, 'duration': duration,
+                                     'from_program': from_program})
     
     return True
 
@@ -266,7 +280,7 @@ async def _zone_timer(zone_id, duration):
         # Normale quando zona fermata manualmente
         pass
     except Exception as e:
-        log_event(f"Errore nel timer zona {zone_id}: {e}", "ERROR")
+        log_eventf("ERROR", "Errore nel timer zona {}: {}", zone_id, e)
 
 async def _safe_stop_zone(zone_id):
     """
@@ -288,9 +302,9 @@ async def _safe_stop_zone(zone_id):
     # Disattiva la zona
     try:
         zone_pins[zone_id].value(1)  # Disattiva la zona (logica attiva bassa)
-        log_event(f"Zona {zone_id} arrestata automaticamente", "INFO")
+        log_eventf("INFO", "Zona {} arrestata automaticamente", zone_id)
     except Exception as e:
-        log_event(f"Errore arresto automatico zona {zone_id}: {e}", "ERROR")
+        log_eventf("ERROR", "Errore arresto automatico zona {}: {}", zone_id, e)
         return
     
     # Memorizza se questa era l'ultima zona attiva
@@ -298,14 +312,15 @@ async def _safe_stop_zone(zone_id):
     
     # Rimuovi la zona dalle zone attive
     del active_zones[zone_id]
+    publish(TOPIC_ZONES, 'stopped', {'zone_id': zone_id})
     
     # Spegni il relè di sicurezza se necessario
     if safety_relay and was_last_active:
         try:
             safety_relay.value(1)  # Disattiva il relè di sicurezza (logica attiva bassa)
-            log_event("Relè di sicurezza disattivato", "INFO")
+            log_eventf("INFO", "Relè di sicurezza disattivato")
         except Exception as e:
-            log_event(f"Errore spegnimento relè sicurezza: {e}", "ERROR")
+            log_eventf("ERROR", "Errore spegnimento relè sicurezza: {}", e)
 
 def stop_zone(zone_id):
     """
@@ -323,12 +338,12 @@ def stop_zone(zone_id):
     try:
         zone_id = int(zone_id)
     except (ValueError, TypeError):
-        log_event(f"Errore: ID zona non valido in stop_zone", "ERROR")
+        log_eventf("ERROR", "Errore: ID zona non valido in stop_zone")
         return False
 
     # Verifica esistenza zona
     if zone_id not in zone_pins:
-        log_event(f"Errore: Zona {zone_id} non trovata", "ERROR")
+        log_eventf("ERROR", "Errore: Zona {} non trovata", zone_id)
         return False
 
     # Verifica stato zona
@@ -338,15 +353,15 @@ def stop_zone(zone_id):
     
     # Se la zona non è attiva, lo consideriamo un successo
     if not was_active:
-        log_event(f"Zona {zone_id} già disattivata", "INFO")
+        log_eventf("INFO", "Zona {} già disattivata", zone_id)
         return True
     
     # Disattiva la zona
     try:
         zone_pins[zone_id].value(1)  # Disattiva la zona (logica attiva bassa)
-        log_event(f"Zona {zone_id} arrestata manualmente", "INFO")
+        log_eventf("INFO", "Zona {} arrestata manualmente", zone_id)
     except Exception as e:
-        log_event(f"Errore arresto zona {zone_id}: {e}", "ERROR")
+        log_eventf("ERROR", "Errore arresto zona {}: {}", zone_id, e)
         return False
 
     # Aggiorna stato e cancella task
@@ -357,18 +372,19 @@ def stop_zone(zone_id):
                 task = zone_data['task']
                 task.cancel()
             except Exception as e:
-                log_event(f"Errore cancellazione task zona {zone_id}: {e}", "WARNING")
+                log_eventf("WARNING", "Errore cancellazione task zona {}: {}", zone_id, e)
                 
         # Rimuovi zona dalla lista attive
         del active_zones[zone_id]
+        publish(TOPIC_ZONES, 'stopped', {'zone_id': zone_id})
 
     # Disattiva relè sicurezza se necessario
     if safety_relay and was_last_active and not active_zones:
         try:
             safety_relay.value(1)  # Disattiva il relè di sicurezza (logica attiva bassa)
-            log_event("Relè di sicurezza disattivato", "INFO")
+            log_eventf("INFO", "Relè di sicurezza disattivato")
         except Exception as e:
-            log_event(f"Errore spegnimento relè sicurezza: {e}", "ERROR")
+            log_eventf("ERROR", "Errore spegnimento relè sicurezza: {}", e)
             # Continuiamo comunque, la zona è stata disattivata
     
     # Verifica che la zona sia stata effettivamente disattivata
@@ -376,7 +392,7 @@ def stop_zone(zone_id):
         if zone_id in zone_pins and zone_pins[zone_id].value() != 1:
             # Tentativo aggiuntivo di disattivazione
             zone_pins[zone_id].value(1)
-            log_event(f"Tentativo aggiuntivo di disattivazione zona {zone_id}", "WARNING")
+            log_eventf("WARNING", "Tentativo aggiuntivo di disattivazione zona {}", zone_id)
     except Exception:
         pass
             
@@ -407,7 +423,7 @@ def stop_all_zones():
     
     # Seconda fase: verifica e forzatura
     if active_zones:
-        log_event("Forzatura disattivazione zone rimanenti", "WARNING")
+        log_eventf("WARNING", "Forzatura disattivazione zone rimanenti")
         remaining_ids = list(active_zones.keys())
         
         for zone_id in remaining_ids:
@@ -424,25 +440,26 @@ def stop_all_zones():
                             try:
                                 task.cancel()
                             except Exception as e:
-                                log_event(f"Errore cancellazione task zona {zoneId}: {e}", "WARNING")
+                                log_eventf("WARNING", "Errore cancellazione task zona {}: {}", zoneId, e)
                     except:
                         pass
                 
                 # Rimuovi dalla lista attive
                 if zone_id in active_zones:
                     del active_zones[zone_id]
+                    publish(TOPIC_ZONES, 'stopped', {'zone_id': zone_id})
                 
             except Exception as e:
-                log_event(f"Errore disattivazione forzata zona {zone_id}: {e}", "ERROR")
+                log_eventf("ERROR", "Errore disattivazione forzata zona {}: {}", zone_id, e)
                 success = False
     
     # Disattiva sempre il relè di sicurezza
     if safety_relay:
         try:
             safety_relay.value(1)  # Disattiva il relè di sicurezza
-            log_event("Relè di sicurezza disattivato", "INFO")
+            log_eventf("INFO", "Relè di sicurezza disattivato")
         except Exception as e:
-            log_event(f"Errore disattivazione relè sicurezza: {e}", "ERROR")
+            log_eventf("ERROR", "Errore disattivazione relè sicurezza: {}", e)
             success = False
     
     # Pulizia finale forzata